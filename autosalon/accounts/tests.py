@@ -1,3 +1,91 @@
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
 
-# Create your tests here.
+from accounts.models import CustomUser
+from cars.models import Brand, Car, Favorite, PurchaseRequest, UserStats
+from cars.stats import count_stats, rebuild_stats
+
+
+class ProfileStatsTest(TestCase):
+    """Счётчики профиля поддерживаются сигналами, страница не считает их заново"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.client_user = CustomUser.objects.create_user(username='client', password='secret')
+        cls.manager = CustomUser.objects.create_user(username='manager', password='secret', role='manager')
+        brand = Brand.objects.create(name='Toyota')
+        cls.cars = [
+            Car.objects.create(
+                brand=brand, model=f'Camry {i}', year=2020, price=2_000_000, color='Белый',
+                transmission='automatic', fuel_type='petrol', engine_volume=2.5, horsepower=181,
+            )
+            for i in range(8)
+        ]
+        for car in cls.cars:
+            Favorite.objects.create(user=cls.client_user, car=car)
+            PurchaseRequest.objects.create(
+                user=cls.client_user, car=car, contact_name='Иван',
+                contact_phone='+70000000000', contact_email='ivan@example.com',
+            )
+
+    def _stats(self, user=None):
+        return UserStats.objects.get(user=user)
+
+    def test_counters_follow_changes(self):
+        purchase_request = PurchaseRequest.objects.filter(user=self.client_user).first()
+        purchase_request.status = 'approved'
+        purchase_request.save()
+        Favorite.objects.filter(user=self.client_user).first().delete()
+        PurchaseRequest.objects.filter(user=self.client_user, status='new').first().delete()
+
+        stats = self._stats(self.client_user)
+        self.assertEqual(stats.favorites_count, 7)
+        self.assertEqual((stats.requests_total, stats.requests_new, stats.requests_approved), (7, 6, 1))
+        for user in (self.client_user, self.manager, None):
+            expected = count_stats(user.pk if user else None)
+            actual = {name: getattr(self._stats(user), name) for name in expected}
+            self.assertEqual(actual, expected)
+
+    def test_unknown_previous_status_recounted(self):
+        purchase_request = PurchaseRequest.objects.filter(user=self.client_user).first()
+        # Экземпляр собран не из БД: прежний статус неизвестен
+        detached = PurchaseRequest.objects.only('pk', 'user', 'car').get(pk=purchase_request.pk)
+        detached.status = 'rejected'
+        detached.save()
+        # Статус экземпляра не совпадает с сохранённым в БД
+        other = PurchaseRequest.objects.filter(user=self.client_user, status='new').first()
+        PurchaseRequest(pk=other.pk, user=self.client_user, status='approved').delete()
+        for user in (self.client_user, None):
+            expected = count_stats(user.pk if user else None)
+            actual = {name: getattr(self._stats(user), name) for name in expected}
+            self.assertEqual(actual, expected)
+        stats = self._stats(self.client_user)
+        self.assertEqual((stats.requests_total, stats.requests_new, stats.requests_rejected), (7, 6, 1))
+
+    def _profile_queries(self, user):
+        self.client.force_login(user)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/accounts/profile/')
+        self.assertEqual(response.status_code, 200)
+        # Сессия и пользователь - в middleware; всё остальное - запросы страницы
+        return len(queries) - 2, response
+
+    def test_profile_query_budget(self):
+        count, response = self._profile_queries(self.client_user)
+        self.assertLessEqual(count, 3)
+        self.assertEqual(response.context['favorites_count'], 8)
+        self.assertEqual(response.context['active_requests_count'], 8)
+
+        count, response = self._profile_queries(self.manager)
+        self.assertLessEqual(count, 3)
+        self.assertEqual(response.context['purchase_requests_count'], 8)
+        self.assertEqual(response.context['user_requests_count'], 0)
+
+    def test_rebuild_matches_counts(self):
+        UserStats.objects.filter(user=self.client_user).update(favorites_count=0, requests_new=0)
+        rebuild_stats()
+        for user in (self.client_user, self.manager, None):
+            expected = count_stats(user.pk if user else None)
+            actual = {name: getattr(self._stats(user), name) for name in expected}
+            self.assertEqual(actual, expected)
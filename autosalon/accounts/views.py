@@ -1,4 +1,5 @@
 # accounts/views.py
+from django.db import transaction
 from django.shortcuts import render, redirect, get_object_or_404
 from django.urls import reverse_lazy
 from django.contrib.auth.views import LoginView, LogoutView
@@ -29,39 +30,52 @@ def profile(request):
     if not request.user.is_authenticated:
         return redirect('accounts:login')
 
-    # Получаем статистику пользователя
-    favorites_count = request.user.favorites.count()
-    favorite_cars = request.user.favorites.select_related('car', 'car__brand').order_by('-added_at')[:6]
+    from cars.images import add_main_image_urls, main_image_subquery
+    from cars.models import PurchaseRequest
+    from cars.stats import profile_stats
+
+    # Счётчики поддерживаются сигналами (cars/stats.py): строка пользователя
+    # и, для менеджера, общая строка читаются одним запросом
+    is_manager = request.user.is_manager()
+    stats, global_stats = profile_stats(request.user, include_global=is_manager)
+
+    # Марка и основное фото - в том же SELECT, что и сами записи
+    favorite_cars = add_main_image_urls(
+        request.user.favorites.select_related('car__brand')
+        .annotate(main_image=main_image_subquery('car'))
+        .order_by('-added_at')[:6]
+    )
 
     # Для менеджеров показываем все заявки
-    if request.user.is_manager():
-        from cars.models import PurchaseRequest
-        all_requests = PurchaseRequest.objects.select_related('user', 'car', 'car__brand').order_by('-created_at')[:10]
-        purchase_requests_count = PurchaseRequest.objects.count()
-        active_requests_count = PurchaseRequest.objects.filter(status__in=['new', 'in_progress']).count()
-        recent_requests = all_requests
-        user_requests_count = request.user.purchase_requests.count()
+    if is_manager:
+        all_requests = add_main_image_urls(
+            PurchaseRequest.objects.select_related('user', 'car__brand')
+            .annotate(main_image=main_image_subquery('car'))
+            .order_by('-created_at')[:10]
+        )
         context = {
             'user': request.user,
-            'purchase_requests_count': purchase_requests_count,
-            'favorites_count': favorites_count,
-            'active_requests_count': active_requests_count,
-            'recent_requests': recent_requests,
+            'purchase_requests_count': global_stats.requests_total,
+            'favorites_count': stats.favorites_count,
+            'active_requests_count': global_stats.active_requests,
+            'recent_requests': all_requests,
             'favorite_cars': favorite_cars,
             'is_manager': True,
             'all_requests': all_requests,
-            'user_requests_count': user_requests_count,
+            'user_requests_count': stats.requests_total,
         }
     else:
         # Для обычных пользователей показываем только свои заявки
-        purchase_requests_count = request.user.purchase_requests.count()
-        active_requests_count = request.user.purchase_requests.filter(status__in=['new', 'in_progress']).count()
-        recent_requests = request.user.purchase_requests.select_related('car', 'car__brand').order_by('-created_at')[:5]
+        recent_requests = add_main_image_urls(
+            request.user.purchase_requests.select_related('car__brand')
+            .annotate(main_image=main_image_subquery('car'))
+            .order_by('-created_at')[:5]
+        )
         context = {
             'user': request.user,
-            'purchase_requests_count': purchase_requests_count,
-            'favorites_count': favorites_count,
-            'active_requests_count': active_requests_count,
+            'purchase_requests_count': stats.requests_total,
+            'favorites_count': stats.favorites_count,
+            'active_requests_count': stats.active_requests,
             'recent_requests': recent_requests,
             'favorite_cars': favorite_cars,
             'is_manager': False,
@@ -90,7 +104,8 @@ def update_request_status(request, request_id):
         return JsonResponse({'error': 'Метод не поддерживается'}, status=405)
 
     from cars.models import PurchaseRequest
-    purchase_request = get_object_or_404(PurchaseRequest, id=request_id)
+    from cars.purchase_requests import notify_status_change
+    purchase_request = get_object_or_404(PurchaseRequest.objects.select_related('car__brand'), id=request_id)
 
     if not purchase_request.can_be_processed_by_user(request.user):
         return JsonResponse({'error': 'Невозможно изменить статус этой заявки'}, status=400)
@@ -104,27 +119,10 @@ def update_request_status(request, request_id):
     old_status = purchase_request.status
     purchase_request.status = new_status
     purchase_request.manager_comment = manager_comment
-    purchase_request.save()
-
-    # Получаем текстовые представления статусов
-    old_status_display = dict(PurchaseRequest.STATUS_CHOICES)[old_status]
-    new_status_display = purchase_request.get_status_display()
-
-    # Отправка уведомления пользователю (если есть система уведомлений)
-    try:
-        from notifications.models import Notification
-        message = f"Статус вашей заявки на {purchase_request.car.brand.name} {purchase_request.car.model} изменен с '{old_status_display}' на '{new_status_display}'"
-        if manager_comment:
-            message += f". Комментарий менеджера: {manager_comment}"
-
-        Notification.objects.create(
-            user=purchase_request.user,
-            title='Изменение статуса заявки',
-            message=message,
-            notification_type='request_status_update'
-        )
-    except ImportError:
-        pass  # Если модуль уведомлений не найден, пропускаем
+    # Уведомление попадает в очередь доставки вместе с изменением заявки
+    with transaction.atomic():
+        purchase_request.save()
+        notify_status_change(purchase_request, old_status)
 
     return JsonResponse({
         'success': True,
@@ -0,0 +1,139 @@
+"""
+Кэш ответов публичного API каталога.
+
+Ключ ответа: действие + версия инвентаря + хост и путь + нормализованные
+GET-параметры. Любое изменение автомобиля, фото или марки поднимает
+версию (cars/cache.py), поэтому инвалидировать записи по одной не нужно.
+
+В кэш попадает обезличенный ответ: is_favorite подставляется для
+текущего пользователя уже после чтения из кэша.
+
+Работает с любым бэкендом Django (locmem, file, memcached, redis).
+С locmem у каждого процесса свой кэш и своя версия, поэтому в
+многопроцессной конфигурации нужен общий бэкенд (см. CACHES в settings).
+
+Поверх кэша - условные GET (conditional_response): клиент с актуальным
+ETag получает 304 без сериализатора и без чтения кэша.
+"""
+import hashlib
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+from rest_framework.response import Response
+
+from cars.cache import inventory_version
+from cars.etags import last_modified_header, make_etag, timestamp
+from .serializers import get_favorite_car_ids
+
+
+def normalized_query(params):
+    """Параметры в каноническом виде: отсортированы, пустые значения отброшены"""
+    items = sorted(
+        (key, value)
+        for key in params
+        for value in params.getlist(key)
+        if value != ''
+    )
+    return urlencode(items)
+
+
+def response_cache_key(request, namespace):
+    # Путь различает автомобили в /api/cars/{id}/; хост и схема - абсолютные ссылки в ответе
+    raw = f'{request.scheme}://{request.get_host()}{request.path}?{normalized_query(request.query_params)}'
+    digest = hashlib.md5(raw.encode()).hexdigest()
+    return f'api:{namespace}:{inventory_version()}:{digest}'
+
+
+def list_etag(request, namespace, favorite_ids):
+    """ETag списка: версия инвентаря + запрос + избранное пользователя"""
+    return make_etag(
+        namespace, inventory_version(), request.scheme, request.get_host(),
+        normalized_query(request.query_params), sorted(favorite_ids),
+    )
+
+
+def detail_etag(request, namespace, updated_at, is_favorite):
+    """ETag одного автомобиля: его updated_at + запрос + флаг избранного"""
+    return make_etag(
+        namespace, updated_at.isoformat(), request.scheme, request.get_host(),
+        normalized_query(request.query_params), is_favorite,
+    )
+
+
+def conditional_response(request, build, etag, last_modified=None):
+    """
+    Отвечает 304 (или 412 для If-Match), если у клиента актуальная версия,
+    иначе вызывает build() и проставляет ETag/Last-Modified в ответ.
+    """
+    if request.method not in ('GET', 'HEAD'):
+        return build()
+    response = get_conditional_response(
+        request, etag=etag, last_modified=last_modified and timestamp(last_modified),
+    )
+    if response is None:
+        response = build()
+        if response.status_code != 200:
+            return response
+    response['ETag'] = etag
+    if last_modified:
+        response['Last-Modified'] = last_modified_header(last_modified)
+    # Ответ зависит от пользователя: кэши обязаны перепроверять его по ETag
+    patch_vary_headers(response, ('Authorization', 'Cookie'))
+    patch_cache_control(response, no_cache=True)
+    return response
+
+
+def merge_favorites(data, favorite_ids):
+    """Проставляет is_favorite в ответе со списком (results) или одним автомобилем"""
+    cars = data['results'] if 'results' in data else [data]
+    for car in cars:
+        # Поле могли исключить через ?fields=
+        if 'is_favorite' in car:
+            car['is_favorite'] = car['id'] in favorite_ids
+
+
+class CachedResponseMixin:
+    """
+    Кэширование ответов ViewSet для безопасных запросов.
+    Наследник оборачивает действие: return self.cached_response(request, build).
+    """
+    response_cache_namespace = None
+
+    _filling_response_cache = False
+
+    def get_response_cache_timeout(self):
+        return getattr(settings, 'API_RESPONSE_CACHE_TIMEOUT', 600)
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        if self._filling_response_cache:
+            # Обезличенный ответ: избранное подставит merge_favorites
+            context['favorite_car_ids'] = frozenset()
+        return context
+
+    def cached_response(self, request, build):
+        timeout = self.get_response_cache_timeout()
+        if request.method not in ('GET', 'HEAD') or not timeout:
+            return build()
+
+        key = response_cache_key(request, f'{self.response_cache_namespace}:{self.action}')
+        data = cache.get(key)
+        if data is None:
+            self._filling_response_cache = True
+            try:
+                response = build()
+            finally:
+                self._filling_response_cache = False
+            if response.status_code != 200:
+                return response
+            cache.set(key, response.data, timeout)
+            cache_status = 'MISS'
+        else:
+            response = Response(data)
+            cache_status = 'HIT'
+
+        merge_favorites(response.data, get_favorite_car_ids(request))
+        response['X-Cache'] = cache_status
+        return response
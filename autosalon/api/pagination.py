@@ -0,0 +1,79 @@
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+from cars.pagination import (
+    InvalidCursor,
+    page_size_from_params,
+    paginate_by_created,
+    paginate_ranked,
+)
+
+
+class CarCursorPagination(BasePagination):
+    """
+    Keyset-пагинация списка автомобилей по (created_at, id).
+
+    ?cursor= - непрозрачный курсор из полей next/previous ответа,
+    ?page_size= - размер страницы (не больше cars.pagination.MAX_PAGE_SIZE).
+    Если view выставил search_ids, страницы идут в порядке релевантности.
+    """
+    cursor_query_param = 'cursor'
+    page_size = 12
+    ordering_field = 'created_at'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        cursor = request.query_params.get(self.cursor_query_param)
+        page_size = page_size_from_params(request.query_params, self.page_size)
+        ranked_ids = getattr(view, 'search_ids', None)
+        try:
+            if ranked_ids is not None:
+                self.page = paginate_ranked(queryset, ranked_ids, cursor, page_size)
+            else:
+                self.page = paginate_by_created(queryset, cursor, page_size, self.ordering_field)
+        except InvalidCursor:
+            raise NotFound('Неверный курсор')
+        return list(self.page)
+
+    def _link(self, cursor):
+        if cursor is None:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, cursor)
+
+    def get_next_link(self):
+        return self._link(self.page.next_cursor)
+
+    def get_previous_link(self):
+        return self._link(self.page.previous_cursor)
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'results': data,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'previous': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
+
+
+class ChatHistoryCursorPagination(CarCursorPagination):
+    """История чата: от новых сообщений к старым по (timestamp, id)"""
+    page_size = 50
+    ordering_field = 'timestamp'
+
+
+class ChatInboxCursorPagination(CarCursorPagination):
+    """Чаты поддержки: от последней активности к давней"""
+    page_size = 30
+    ordering_field = 'last_activity_at'
@@ -1,6 +1,103 @@
 from rest_framework import serializers
-from cars.models import Car, Brand, PurchaseRequest, Favorite
+from cars.images import media_base_url
+from cars.listing import add_image_urls
+from cars.reference import brands_by_id, get_brand
+from cars.models import Car, CarImage, Brand, PurchaseRequest, Favorite
 from accounts.models import CustomUser
+from chat.models import Message, SupportChat
+
+
+def get_favorite_car_ids(request):
+    """
+    Множество id избранных автомобилей текущего пользователя.
+    Загружается одним запросом и кэшируется на объекте request, поэтому
+    все сериализаторы в рамках запроса (в т.ч. вложенные) делят один набор.
+    """
+    if request is None or not request.user.is_authenticated:
+        return frozenset()
+    favorite_ids = getattr(request, '_favorite_car_ids', None)
+    if favorite_ids is None:
+        favorite_ids = set(
+            Favorite.objects.filter(user=request.user).values_list('car_id', flat=True)
+        )
+        request._favorite_car_ids = favorite_ids
+    return favorite_ids
+
+
+def invalidate_favorite_car_ids(request):
+    """Сбрасывает кэш избранного после его изменения"""
+    request._favorite_car_ids = None
+
+
+class FavoriteFlagMixin:
+    """Поле is_favorite по набору избранного из контекста сериализатора"""
+
+    def _favorite_ids(self):
+        favorite_ids = self.context.get('favorite_car_ids')
+        if favorite_ids is None:
+            # Контекст общий для всего дерева сериализаторов (list, вложенные car)
+            favorite_ids = get_favorite_car_ids(self.context.get('request'))
+            self.context['favorite_car_ids'] = favorite_ids
+        return favorite_ids
+
+    def _media_base_url(self):
+        base_url = self.context.get('media_base_url')
+        if base_url is None:
+            base_url = media_base_url(self.context.get('request'))
+            self.context['media_base_url'] = base_url
+        return base_url
+
+
+def parse_field_names(value, allowed, param):
+    """'id,price' -> множество имён полей; неизвестное имя - ошибка 400"""
+    names = {name.strip() for name in value.split(',') if name.strip()}
+    unknown = names - set(allowed)
+    if unknown:
+        raise serializers.ValidationError({param: f'Неизвестные поля: {", ".join(sorted(unknown))}'})
+    return names
+
+
+class SparseFieldsMixin:
+    """
+    Разреженный набор полей (?fields=): Serializer(..., fields={'price'})
+    отдаёт только перечисленные поля и id, fields=None - все. expand - вложенные
+    объекты, которые нужно отдать целиком (см. CarListingSerializer).
+
+    source_fields - какие поля источника (модели или строки проекции) нужны
+    полю сериализатора, если не одноимённое; по ним view сужает запрос.
+    """
+    source_fields = {}
+
+    def __init__(self, *args, fields=None, expand=(), **kwargs):
+        super().__init__(*args, **kwargs)
+        self.expand = frozenset(expand)
+        if fields is not None:
+            for name in set(self.fields) - set(fields) - {'id'}:
+                self.fields.pop(name)
+
+    @classmethod
+    def readable_field_names(cls):
+        return [name for name, field in cls().fields.items() if not field.write_only]
+
+    @classmethod
+    def source_fields_for(cls, fields):
+        columns = set()
+        for name in fields:
+            columns.update(cls.source_fields.get(name, (name,)))
+        return columns
+
+
+def image_payload(image, base_url):
+    """Фото автомобиля в ответе API (абсолютные URL, srcset готовых WebP/AVIF-копий)"""
+    srcsets = {fmt: image.srcset(fmt, base_url) for fmt in ('avif', 'webp')}
+    return {
+        'id': image.id,
+        'image': f"{base_url}{image.image.url}",
+        'card': f"{base_url}{image.card_url}",
+        'srcset': {fmt: value for fmt, value in srcsets.items() if value},
+        'description': image.description,
+        'is_main': image.is_main
+    }
 
 
 class BrandSerializer(serializers.ModelSerializer):
@@ -9,9 +106,25 @@ class BrandSerializer(serializers.ModelSerializer):
         fields = ['id', 'name', 'country', 'description']
 
 
-class CarSerializer(serializers.ModelSerializer):
+class BrandIdField(serializers.PrimaryKeyRelatedField):
+    """id марки проверяется по справочнику в памяти процесса (cars.reference), без запроса к БД"""
+
+    def to_internal_value(self, data):
+        if isinstance(data, bool):
+            self.fail('incorrect_type', data_type=type(data).__name__)
+        try:
+            pk = int(data)
+        except (TypeError, ValueError):
+            self.fail('incorrect_type', data_type=type(data).__name__)
+        brand = get_brand(pk)
+        if brand is None:
+            self.fail('does_not_exist', pk_value=data)
+        return brand
+
+
+class CarSerializer(SparseFieldsMixin, FavoriteFlagMixin, serializers.ModelSerializer):
     brand = BrandSerializer(read_only=True)
-    brand_id = serializers.PrimaryKeyRelatedField(
+    brand_id = BrandIdField(
         queryset=Brand.objects.all(),
         source='brand',
         write_only=True
@@ -28,40 +141,110 @@ class CarSerializer(serializers.ModelSerializer):
         ]
         read_only_fields = ['created_at']
 
+    # Марка - через select_related, фото и избранное - не из строки автомобиля
+    source_fields = {
+        'brand': ('brand', 'brand__name', 'brand__country', 'brand__description'),
+        'images': (),
+        'is_favorite': (),
+    }
+
     def get_images(self, obj):
-        from django.conf import settings
-        request = self.context.get('request')
-        base_url = ''
-        if request:
-            try:
-                base_url = request.build_absolute_uri('/').rstrip('/')
-            except:
-                # Fallback to settings
-                scheme = 'https' if settings.SECURE_SSL_REDIRECT else 'http'
-                host = settings.ALLOWED_HOSTS[0] if settings.ALLOWED_HOSTS else 'localhost:8000'
-                base_url = f"{scheme}://{host}"
-        else:
-            scheme = 'https' if settings.SECURE_SSL_REDIRECT else 'http'
-            host = settings.ALLOWED_HOSTS[0] if settings.ALLOWED_HOSTS else '127.0.0.1'
-            port = ':8000' if host in ['127.0.0.1', 'localhost'] else ''
-            base_url = f"{scheme}://{host}{port}"
-
-        return [
-            {
-                'id': image.id,
-                'image': f"{base_url}{image.image.url}",
-                'description': image.description,
-                'is_main': image.is_main
-            }
-            for image in obj.images.all()
-        ]
+        base_url = self._media_base_url()
+        # obj.images.all() берёт данные из prefetch (см. cars.images.images_prefetch)
+        return [image_payload(image, base_url) for image in obj.images.all()]
 
     def get_is_favorite(self, obj):
-        request = self.context.get('request')
-        if request and request.user.is_authenticated:
-            return Favorite.objects.filter(user=request.user, car=obj).exists()
+        return obj.id in self._favorite_ids()
+
+
+class CarListingListSerializer(serializers.ListSerializer):
+    def to_representation(self, data):
+        rows = list(data)
+        # Развёрнутые фото - одним запросом на страницу, марки - из справочника
+        self.child.load_expanded(rows)
+        return super().to_representation(rows)
+
+
+class CarListingSerializer(SparseFieldsMixin, FavoriteFlagMixin, serializers.Serializer):
+    """
+    Компактная карточка автомобиля для списков - из строки проекции каталога
+    (dict из cars.listing.listing_values). Поля те же, что у CarSerializer,
+    но у марки только id и название, а в images - только основное фото.
+    ?expand=brand,images отдаёт их в полном виде, как CarSerializer
+    (марки - из справочника в памяти процесса, фото - одним запросом).
+    """
+    EXPANDABLE = ('brand', 'images')
+
+    id = serializers.IntegerField()
+    brand = serializers.SerializerMethodField()
+    model = serializers.CharField()
+    year = serializers.IntegerField()
+    price = serializers.DecimalField(max_digits=10, decimal_places=2)
+    color = serializers.CharField()
+    transmission = serializers.CharField()
+    fuel_type = serializers.CharField()
+    engine_volume = serializers.FloatField()
+    horsepower = serializers.IntegerField()
+    mileage = serializers.IntegerField()
+    is_sold = serializers.SerializerMethodField()
+    created_at = serializers.DateTimeField()
+    images = serializers.SerializerMethodField()
+    is_favorite = serializers.SerializerMethodField()
+
+    class Meta:
+        list_serializer_class = CarListingListSerializer
+
+    source_fields = {
+        'brand': ('brand_id', 'brand_name'),
+        'images': ('main_image', 'main_image_variants'),
+        'is_sold': (),
+        'is_favorite': (),
+    }
+
+    _brands = None
+    _images = None
+
+    def load_expanded(self, rows):
+        if 'brand' in self.expand and 'brand' in self.fields:
+            brands = brands_by_id()
+            self._brands = {
+                pk: BrandSerializer(brands[pk]).data for pk in {row['brand_id'] for row in rows} if pk in brands
+            }
+        if 'images' in self.expand and 'images' in self.fields:
+            self._images = {}
+            images = CarImage.objects.filter(car_id__in=[row['id'] for row in rows]).order_by('-is_main', 'uploaded_at')
+            for image in images:
+                self._images.setdefault(image.car_id, []).append(image)
+
+    def get_brand(self, row):
+        if self._brands is not None and row['brand_id'] in self._brands:
+            return self._brands[row['brand_id']]
+        return {'id': row['brand_id'], 'name': row['brand_name']}
+
+    def get_is_sold(self, row):
+        # В проекции только непроданные автомобили
         return False
 
+    def get_images(self, row):
+        if self._images is not None:
+            base_url = self._media_base_url()
+            return [image_payload(image, base_url) for image in self._images.get(row['id'], [])]
+        if not row['main_image']:
+            return []
+        if 'image_url' not in row:
+            add_image_urls([row], self._media_base_url())
+        srcsets = {fmt: row[f'{fmt}_srcset'] for fmt in ('avif', 'webp')}
+        return [{
+            'image': row['image_url'],
+            'card': row['card_url'],
+            'srcset': {fmt: value for fmt, value in srcsets.items() if value},
+            'is_main': True,
+        }]
+
+    def get_is_favorite(self, row):
+        return row['id'] in self._favorite_ids()
+
+
 
 class FavoriteSerializer(serializers.ModelSerializer):
     """Сериализатор для избранных автомобилей"""
@@ -95,4 +278,45 @@ class PurchaseRequestSerializer(serializers.ModelSerializer):
             'contact_phone', 'contact_email', 'message',
             'status', 'manager_comment', 'created_at'
         ]
-        read_only_fields = ['user', 'created_at']
\ No newline at end of file
+        read_only_fields = ['user', 'created_at']
+
+
+class PurchaseRequestBulkStatusSerializer(serializers.Serializer):
+    """Входные данные массовой смены статуса заявок менеджером"""
+    MAX_IDS = 1000
+
+    ids = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=MAX_IDS,
+    )
+    status = serializers.ChoiceField(choices=PurchaseRequest.STATUS_CHOICES)
+    manager_comment = serializers.CharField(required=False, allow_blank=True)
+
+
+class SupportChatSerializer(serializers.ModelSerializer):
+    """Чат поддержки в списке: unread - непрочитанное для запросившей стороны"""
+    user = serializers.CharField(source='user.username', read_only=True)
+    manager = serializers.CharField(source='manager.username', read_only=True, default=None)
+    last_message = serializers.CharField(read_only=True, default=None)
+    unread = serializers.SerializerMethodField()
+
+    class Meta:
+        model = SupportChat
+        fields = ['id', 'user', 'manager', 'is_active', 'created_at', 'last_activity_at', 'last_message', 'unread']
+
+    def get_unread(self, chat):
+        return chat.unread_for(self.context['request'].user)
+
+
+class ChatMessageSerializer(serializers.ModelSerializer):
+    sender = serializers.CharField(source='sender.username', read_only=True)
+
+    class Meta:
+        model = Message
+        fields = ['id', 'sender_id', 'sender', 'content', 'timestamp', 'is_read']
+
+
+class ChatMarkReadSerializer(serializers.Serializer):
+    """Прочитано всё до сообщения up_to включительно"""
+    up_to = serializers.IntegerField(min_value=1)
@@ -1,3 +1,487 @@
+from django.core.cache import cache
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
 
-# Create your tests here.
+from accounts.models import CustomUser
+from cars.cache import INVENTORY_VERSION_KEY
+from cars.models import Brand, Car, CarImage, Favorite, PurchaseRequest, UserStats
+from cars.stats import count_stats
+from chat.history import save_messages
+from chat.models import Message, SupportChat
+from notifications.models import Notification
+
+
+class CarListFavoriteQueriesTest(TestCase):
+    """is_favorite в списке автомобилей не должен давать N+1"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create_user(username='client', password='secret')
+        brand = Brand.objects.create(name='Toyota')
+        cls.cars = [
+            Car.objects.create(
+                brand=brand, model=f'Camry {i}', year=2020, price=2_000_000, color='Белый',
+                transmission='automatic', fuel_type='petrol', engine_volume=2.5, horsepower=181,
+            )
+            for i in range(20)
+        ]
+        for car in cls.cars[::2]:
+            Favorite.objects.create(user=cls.user, car=car)
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def _favorite_queries(self, page_size):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/api/cars/', {'page_size': page_size})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['results']), page_size)
+        return [q for q in queries.captured_queries if 'cars_favorite' in q['sql']]
+
+    def test_favorites_loaded_once_per_request(self):
+        self.assertEqual(len(self._favorite_queries(5)), 1)
+        self.assertEqual(len(self._favorite_queries(20)), 1)
+
+    def test_is_favorite_values(self):
+        response = self.client.get('/api/cars/', {'page_size': 20})
+        favorite_ids = {car.id for car in self.cars[::2]}
+        for item in response.data['results']:
+            self.assertEqual(item['is_favorite'], item['id'] in favorite_ids)
+
+    def test_favorites_endpoint_single_favorite_query(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/api/favorites/')
+        self.assertEqual(len(response.data), 10)
+        self.assertTrue(all(item['car']['is_favorite'] for item in response.data))
+        favorite_queries = [q for q in queries.captured_queries if 'cars_favorite' in q['sql']]
+        # Сам список избранного + один запрос набора id для is_favorite
+        self.assertEqual(len(favorite_queries), 2)
+
+
+class CarListImagesQueriesTest(TestCase):
+    """Фотографии подгружаются одним prefetch-запросом на страницу"""
+
+    @classmethod
+    def setUpTestData(cls):
+        brand = Brand.objects.create(name='BMW')
+        for i in range(30):
+            car = Car.objects.create(
+                brand=brand, model=f'X{i}', year=2021, price=5_000_000, color='Черный',
+                transmission='automatic', fuel_type='diesel', engine_volume=3.0, horsepower=249,
+            )
+            CarImage.objects.create(car=car, image=f'car_images/{i}.jpg')
+            CarImage.objects.create(car=car, image=f'car_images/{i}_main.jpg', is_main=True)
+
+    def setUp(self):
+        cache.clear()
+
+    def _list_queries(self, page_size):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/api/cars/', {'page_size': page_size})
+        self.assertEqual(len(response.data['results']), page_size)
+        return len(queries.captured_queries)
+
+    def test_query_count_does_not_depend_on_page_size(self):
+        # Справочники в памяти процесса перечитываются при новой версии - до замера
+        self._list_queries(1)
+        self.assertEqual(self._list_queries(5), self._list_queries(30))
+
+    def test_main_image_first_with_absolute_url(self):
+        response = self.client.get('/api/cars/', {'page_size': 1})
+        images = response.data['results'][0]['images']
+        self.assertTrue(images[0]['is_main'])
+        self.assertTrue(images[0]['image'].startswith('http://testserver/media/car_images/'))
+
+
+class SimilarCarsTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        toyota = Brand.objects.create(name='Toyota')
+        kia = Brand.objects.create(name='Kia')
+
+        def make(brand, model, price, year, fuel='petrol', is_sold=False):
+            return Car.objects.create(
+                brand=brand, model=model, year=year, price=price, color='Серый', mileage=10_000,
+                transmission='automatic', fuel_type=fuel, engine_volume=2.0, horsepower=150, is_sold=is_sold,
+            )
+
+        cls.car = make(toyota, 'Camry', 3_000_000, 2022)
+        cls.close = make(toyota, 'Camry', 3_100_000, 2022)
+        cls.far = make(toyota, 'Land Cruiser', 12_000_000, 2015, fuel='diesel')
+        cls.other_brand = make(kia, 'K5', 3_000_000, 2022)
+        cls.sold = make(toyota, 'Camry', 3_000_000, 2022, is_sold=True)
+
+    def setUp(self):
+        cache.clear()
+
+    def test_nearest_first_and_excludes_self_and_sold(self):
+        from cars.similarity import similarity_index
+
+        similarity_index.invalidate()
+        response = self.client.get(f'/api/cars/{self.car.id}/similar/', {'limit': 10})
+        self.assertEqual(response.status_code, 200)
+        ids = [item['id'] for item in response.data]
+        self.assertEqual(ids[0], self.close.id)
+        self.assertNotIn(self.car.id, ids)
+        self.assertNotIn(self.sold.id, ids)
+        self.assertEqual(len(ids), 3)
+
+
+class CarResponseCacheTest(TestCase):
+    """Кэш ответов /api/cars/ и /api/cars/{id}/"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create_user(username='client', password='secret')
+        cls.brand = Brand.objects.create(name='Mazda')
+        cls.cars = [
+            Car.objects.create(
+                brand=cls.brand, model=f'CX-{i}', year=2022, price=3_000_000, color='Красный',
+                transmission='automatic', fuel_type='petrol', engine_volume=2.0, horsepower=150,
+            )
+            for i in range(5)
+        ]
+        Favorite.objects.create(user=cls.user, car=cls.cars[0])
+
+    def setUp(self):
+        cache.clear()
+
+    def test_second_request_served_from_cache(self):
+        first = self.client.get('/api/cars/', {'brand': self.brand.id, 'page_size': 3})
+        self.assertEqual(first['X-Cache'], 'MISS')
+        with self.assertNumQueries(0):
+            # Порядок параметров не важен
+            second = self.client.get('/api/cars/', {'page_size': 3, 'brand': self.brand.id})
+        self.assertEqual(second['X-Cache'], 'HIT')
+        self.assertEqual(second.json(), first.json())
+
+    def test_detail_cached(self):
+        self.client.get(f'/api/cars/{self.cars[1].id}/')
+        # Остаётся только запрос updated_at для ETag
+        with self.assertNumQueries(1):
+            response = self.client.get(f'/api/cars/{self.cars[1].id}/')
+        self.assertEqual(response.data['model'], 'CX-1')
+
+    def test_detail_urls_cached_separately(self):
+        first = self.client.get(f'/api/cars/{self.cars[1].id}/')
+        second = self.client.get(f'/api/cars/{self.cars[2].id}/')
+        self.assertEqual(second['X-Cache'], 'MISS')
+        self.assertEqual((first.data['model'], second.data['model']), ('CX-1', 'CX-2'))
+        self.assertEqual(self.client.get(f'/api/cars/{self.cars[1].id}/').data['id'], self.cars[1].id)
+
+    def test_is_favorite_merged_per_user(self):
+        # Кэш наполняет анонимный запрос
+        self.client.get('/api/cars/', {'page_size': 5})
+        client = APIClient()
+        client.force_authenticate(self.user)
+        with self.assertNumQueries(1):
+            response = client.get('/api/cars/', {'page_size': 5})
+        self.assertEqual(response['X-Cache'], 'HIT')
+        favorites = {item['id']: item['is_favorite'] for item in response.data['results']}
+        self.assertTrue(favorites[self.cars[0].id])
+        self.assertEqual(sum(favorites.values()), 1)
+        # Обезличенная копия в кэше не испорчена
+        response = self.client.get('/api/cars/', {'page_size': 5})
+        self.assertFalse(any(item['is_favorite'] for item in response.data['results']))
+
+    def test_car_change_invalidates(self):
+        car = self.cars[2]
+        self.client.get(f'/api/cars/{car.id}/')
+        with self.captureOnCommitCallbacks(execute=True):
+            car.price = 2_500_000
+            car.save()
+        response = self.client.get(f'/api/cars/{car.id}/')
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertEqual(response.data['price'], '2500000.00')
+
+    def test_brand_change_invalidates(self):
+        self.client.get('/api/cars/', {'page_size': 1})
+        with self.captureOnCommitCallbacks(execute=True):
+            self.brand.name = 'Mazda Motor'
+            self.brand.save()
+        response = self.client.get('/api/cars/', {'page_size': 1})
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertEqual(response.data['results'][0]['brand']['name'], 'Mazda Motor')
+
+
+class ConditionalGetTest(TestCase):
+    """ETag / Last-Modified у /api/cars/ и страницы автомобиля"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create_user(username='client', password='secret')
+        cls.brand = Brand.objects.create(name='Volvo')
+        cls.cars = [
+            Car.objects.create(
+                brand=cls.brand, model=f'XC{i}', year=2021, price=4_000_000, color='Белый',
+                transmission='automatic', fuel_type='diesel', engine_volume=2.0, horsepower=200,
+            )
+            for i in range(3)
+        ]
+
+    def setUp(self):
+        cache.clear()
+
+    def test_list_not_modified_without_serializer(self):
+        first = self.client.get('/api/cars/', {'page_size': 2})
+        self.assertIn('ETag', first)
+        # Без БД: 304 по версии инвентаря, до чтения кэша ответов
+        with self.assertNumQueries(0):
+            response = self.client.get('/api/cars/', {'page_size': 2}, HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], first['ETag'])
+        self.assertIn('Cookie', response['Vary'])
+        self.assertNotEqual(self.client.get('/api/cars/', {'page_size': 3})['ETag'], first['ETag'])
+
+    def test_list_etag_changes_with_inventory_and_favorites(self):
+        etag = self.client.get('/api/cars/')['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            self.cars[0].price = 3_900_000
+            self.cars[0].save()
+        response = self.client.get('/api/cars/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+        client = APIClient()
+        client.force_authenticate(self.user)
+        etag = client.get('/api/cars/')['ETag']
+        Favorite.objects.create(user=self.user, car=self.cars[1])
+        self.assertEqual(client.get('/api/cars/', HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_etags_change_after_version_reset(self):
+        car = self.cars[0]
+        self.client.get(f'/cars/car/{car.id}/')
+        list_etag = self.client.get('/api/cars/')['ETag']
+        page_etag = self.client.get(f'/cars/car/{car.id}/')['ETag']
+        # Перезапуск процесса с locmem или вытеснение ключа версии
+        cache.delete(INVENTORY_VERSION_KEY)
+        response = self.client.get('/api/cars/', HTTP_IF_NONE_MATCH=list_etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], list_etag)
+        cache.clear()
+        response = self.client.get(f'/cars/car/{car.id}/', HTTP_IF_NONE_MATCH=page_etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], page_etag)
+
+    def test_detail_etag_and_last_modified(self):
+        car = self.cars[1]
+        first = self.client.get(f'/api/cars/{car.id}/')
+        self.assertIn('Last-Modified', first)
+        with self.assertNumQueries(1):
+            response = self.client.get(f'/api/cars/{car.id}/', HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(response.status_code, 304)
+        response = self.client.get(f'/api/cars/{car.id}/', HTTP_IF_MODIFIED_SINCE=first['Last-Modified'])
+        self.assertEqual(response.status_code, 304)
+
+        # Новое фото поднимает updated_at - версия меняется
+        CarImage.objects.create(car=car, image='cars/new.jpg')
+        response = self.client.get(f'/api/cars/{car.id}/', HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], first['ETag'])
+        # Ответы разных автомобилей в кэше не смешиваются
+        self.assertEqual(self.client.get(f'/api/cars/{self.cars[2].id}/').data['model'], 'XC2')
+        self.assertEqual(self.client.get('/api/cars/0/').status_code, 404)
+
+    def test_car_detail_page_not_modified(self):
+        car = self.cars[0]
+        # Первый ответ выдаёт CSRF-cookie, под неё страница и версионируется
+        self.client.get(f'/cars/car/{car.id}/')
+        first = self.client.get(f'/cars/car/{car.id}/')
+        self.assertEqual(first.status_code, 200)
+        response = self.client.get(f'/cars/car/{car.id}/', HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+        # Страница зависит от пользователя и от подборки похожих машин
+        self.client.force_login(self.user)
+        self.assertEqual(self.client.get(f'/cars/car/{car.id}/', HTTP_IF_NONE_MATCH=first['ETag']).status_code, 200)
+        self.client.logout()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.cars[2].price = 1_000_000
+            self.cars[2].save()
+        self.assertEqual(self.client.get(f'/cars/car/{car.id}/', HTTP_IF_NONE_MATCH=first['ETag']).status_code, 200)
+
+
+class CarSparseFieldsTest(TestCase):
+    """?fields= / ?expand= у /api/cars/"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.brand = Brand.objects.create(name='Skoda', country='Чехия', description='Описание марки')
+        cls.cars = [
+            Car.objects.create(
+                brand=cls.brand, model=f'Octavia {i}', year=2020, price=2_000_000 + i, color='Серый',
+                transmission='manual', fuel_type='petrol', engine_volume=1.4, horsepower=150,
+            )
+            for i in range(3)
+        ]
+        for i in range(2):
+            CarImage.objects.create(car=cls.cars[0], image=f'cars/octavia{i}.jpg', is_main=not i)
+
+    def setUp(self):
+        cache.clear()
+
+    def test_list_returns_only_requested_fields(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/api/cars/', {'fields': 'price,model'})
+        self.assertEqual(set(response.data['results'][0]), {'id', 'price', 'model'})
+        page_sql = next(query['sql'] for query in queries if 'cars_carlisting' in query['sql'])
+        self.assertNotIn('main_image_variants', page_sql)
+        self.assertNotIn('brand_name', page_sql)
+        # Курсор следующей страницы строится и по узкой строке
+        response = self.client.get('/api/cars/', {'fields': 'price', 'page_size': 2})
+        self.assertEqual(len(self.client.get(response.data['next']).data['results']), 1)
+
+    def test_unknown_field_rejected(self):
+        self.assertEqual(self.client.get('/api/cars/', {'fields': 'price,secret'}).status_code, 400)
+        self.assertEqual(self.client.get('/api/cars/', {'expand': 'color'}).status_code, 400)
+
+    def test_expand_brand_and_images(self):
+        compact = self.client.get('/api/cars/').data['results']
+        self.assertEqual(set(compact[-1]['brand']), {'id', 'name'})
+        self.assertEqual(len(compact[-1]['images']), 1)
+
+        cache.clear()
+        response = self.client.get('/api/cars/', {'expand': 'brand,images'})
+        first = next(car for car in response.data['results'] if car['id'] == self.cars[0].id)
+        self.assertEqual(first['brand']['description'], 'Описание марки')
+        self.assertEqual(len(first['images']), 2)
+        self.assertTrue(first['images'][0]['is_main'])
+
+    def test_detail_reads_only_requested_columns(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(f'/api/cars/{self.cars[1].id}/', {'fields': 'model,year'})
+        self.assertEqual(response.data, {'id': self.cars[1].id, 'model': 'Octavia 1', 'year': 2020})
+        sql = queries[-1]['sql']
+        self.assertNotIn('cars_brand', sql)
+        self.assertNotIn('"price"', sql)
+        # Без фото - без prefetch
+        self.assertEqual(len(queries), 2)
+
+
+class PurchaseRequestBulkStatusTest(TestCase):
+    """POST /api/purchase-requests/bulk-status/"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.manager = CustomUser.objects.create_user(username='manager', password='secret', role='manager')
+        cls.clients = [CustomUser.objects.create_user(username=f'client{i}', password='secret') for i in range(3)]
+        car = Car.objects.create(
+            brand=Brand.objects.create(name='Kia'), model='Rio', year=2021, price=1_500_000, color='Серый',
+            transmission='manual', fuel_type='petrol', engine_volume=1.6, horsepower=123,
+        )
+        cls.requests = [
+            PurchaseRequest.objects.create(
+                user=cls.clients[i % 3], car=car, contact_name='Пётр',
+                contact_phone='+70000000000', contact_email='petr@example.com',
+            )
+            for i in range(30)
+        ]
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.manager)
+
+    def _post(self, ids, status, **extra):
+        return self.client.post(
+            '/api/purchase-requests/bulk-status/', {'ids': ids, 'status': status, **extra}, format='json',
+        )
+
+    def test_single_update_and_batched_notifications(self):
+        ids = [request.id for request in self.requests]
+        with CaptureQueriesContext(connection) as queries:
+            response = self._post(ids, 'in_progress', manager_comment='Свяжемся')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(sorted(response.data['updated']), sorted(ids))
+        sql = [q['sql'] for q in queries.captured_queries]
+        self.assertEqual(sum(q.startswith('UPDATE "cars_purchaserequest"') for q in sql), 1)
+        self.assertEqual(sum(q.startswith('INSERT INTO "notifications_notification"') for q in sql), 1)
+
+        self.assertEqual(PurchaseRequest.objects.filter(status='in_progress', manager_comment='Свяжемся').count(), 30)
+        self.assertEqual(Notification.objects.count(), 30)
+        for user in self.clients + [None]:
+            stats = UserStats.objects.get(user=user)
+            expected = count_stats(user.pk if user else None)
+            self.assertEqual({name: getattr(stats, name) for name in expected}, expected)
+
+    def test_invalid_transitions_skipped(self):
+        completed = self.requests[0]
+        PurchaseRequest.objects.filter(pk=completed.pk).update(status='completed')
+        response = self._post([completed.id, self.requests[1].id, 999_999], 'new')
+        self.assertEqual(response.data['updated'], [])
+        self.assertEqual(
+            {int(pk): reason for pk, reason in response.data['skipped'].items()},
+            {completed.id: 'not_allowed', self.requests[1].id: 'unchanged', 999_999: 'not_found'},
+        )
+        self.assertFalse(Notification.objects.exists())
+
+    def test_managers_only(self):
+        self.client.force_authenticate(self.clients[0])
+        response = self._post([self.requests[0].id], 'approved')
+        self.assertEqual(response.status_code, 403)
+        self.assertEqual(PurchaseRequest.objects.get(pk=self.requests[0].pk).status, 'new')
+
+
+class SupportChatApiTest(TestCase):
+    """/api/chats/: история по курсору, счётчики непрочитанного, входящие менеджера"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.manager = CustomUser.objects.create_user(username='manager', password='secret', role='manager')
+        cls.clients = [CustomUser.objects.create_user(username=f'client{i}', password='secret') for i in range(3)]
+        cls.chats = [SupportChat.objects.create(user=client) for client in cls.clients]
+        chat = cls.chats[0]
+        save_messages(
+            [Message(chat=chat, sender=cls.clients[0], content=f'Вопрос {i}') for i in range(5)]
+            + [Message(chat=chat, sender=cls.manager, content='Ответ')]
+            + [Message(chat=cls.chats[1], sender=cls.clients[1], content='Здравствуйте')]
+        )
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.manager)
+
+    def test_history_paginated_by_cursor(self):
+        response = self.client.get(f'/api/chats/{self.chats[0].pk}/messages/', {'page_size': 4})
+        self.assertEqual(
+            [message['content'] for message in response.data['results']],
+            ['Ответ', 'Вопрос 4', 'Вопрос 3', 'Вопрос 2'],
+        )
+        response = self.client.get(response.data['next'])
+        self.assertEqual([message['content'] for message in response.data['results']], ['Вопрос 1', 'Вопрос 0'])
+        self.assertIsNone(response.data['next'])
+
+    def test_counters_and_mark_read_single_update(self):
+        chat = SupportChat.objects.get(pk=self.chats[0].pk)
+        self.assertEqual((chat.client_unread, chat.manager_unread), (1, 5))
+        up_to = Message.objects.get(chat=chat, content='Вопрос 2')
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(f'/api/chats/{chat.pk}/read/', {'up_to': up_to.pk}, format='json')
+        self.assertEqual(response.data, {'marked': 3, 'unread': 2})
+        sql = [q['sql'] for q in queries.captured_queries]
+        self.assertEqual(sum(q.startswith('UPDATE "chat_message"') for q in sql), 1)
+        self.assertEqual(self.client.get('/api/chats/unread/').data, {'unread': 3})
+
+        # Сообщения менеджера клиент видит отдельно
+        self.client.force_authenticate(self.clients[0])
+        self.assertEqual(self.client.get('/api/chats/unread/').data, {'unread': 1})
+        self.assertEqual(self.client.get(f'/api/chats/{self.chats[1].pk}/messages/').status_code, 404)
+
+    def test_inbox_single_query_by_last_activity(self):
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/chats/inbox/')
+        results = response.data['results']
+        # Чат без сообщений - по времени создания, он раньше всех сообщений
+        self.assertEqual([chat['id'] for chat in results], [self.chats[1].pk, self.chats[0].pk, self.chats[2].pk])
+        self.assertEqual(
+            [(chat['last_message'], chat['unread']) for chat in results],
+            [('Здравствуйте', 1), ('Ответ', 5), (None, 0)],
+        )
+
+    def test_inbox_managers_only(self):
+        self.client.force_authenticate(self.clients[0])
+        self.assertEqual(self.client.get('/api/chats/inbox/').status_code, 403)
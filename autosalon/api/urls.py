@@ -6,6 +6,7 @@ router = DefaultRouter()
 router.register(r'cars', views.CarViewSet)
 router.register(r'purchase-requests', views.PurchaseRequestViewSet, basename='purchaserequest')
 router.register(r'favorites', views.FavoriteViewSet, basename='favorite')
+router.register(r'chats', views.SupportChatViewSet, basename='supportchat')
 
 urlpatterns = [
     path('', include(router.urls)),
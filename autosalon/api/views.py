@@ -8,21 +8,148 @@ from django.shortcuts import get_object_or_404
 from django.contrib.auth import authenticate
 from django.views.decorators.csrf import csrf_exempt
 from django.utils.decorators import method_decorator
+from cars.etags import car_updated_at
+from cars.facets import apply_filters, facet_index, filters_from_params
+from cars.images import images_prefetch
+from cars.listing import CARD_FIELDS, listing_values
 from cars.models import Car, PurchaseRequest, Favorite
+from chat.models import Message
+from cars.purchase_requests import transition_requests
+from cars.search import get_search_backend
+from cars.similarity import MAX_NEIGHBOURS, get_similar_cars
 from accounts.models import CustomUser
+from chat.history import chats_for, last_message, manager_inbox, mark_read, unread_total
+from .cache import CachedResponseMixin, conditional_response, detail_etag, list_etag
+from .pagination import CarCursorPagination, ChatHistoryCursorPagination, ChatInboxCursorPagination
 from .serializers import (
+    CarListingSerializer,
     CarSerializer,
+    ChatMarkReadSerializer,
+    ChatMessageSerializer,
+    PurchaseRequestBulkStatusSerializer,
     PurchaseRequestSerializer,
     UserSerializer,
-    FavoriteSerializer
+    FavoriteSerializer,
+    SupportChatSerializer,
+    get_favorite_car_ids,
+    invalidate_favorite_car_ids,
+    parse_field_names,
 )
 
 
-class CarViewSet(viewsets.ModelViewSet):
+class CarViewSet(CachedResponseMixin, viewsets.ModelViewSet):
     """API для автомобилей"""
-    queryset = Car.objects.filter(is_sold=False).select_related('brand')
+    queryset = Car.objects.filter(is_sold=False).select_related('brand').prefetch_related(images_prefetch())
     serializer_class = CarSerializer
     permission_classes = [permissions.IsAuthenticatedOrReadOnly]
+    pagination_class = CarCursorPagination
+    response_cache_namespace = 'cars'
+
+    # id автомобилей, найденных по ?search= (в порядке релевантности)
+    search_ids = None
+
+    _sparse_fieldset = None
+
+    def get_sparse_fieldset(self):
+        """
+        (fields, expand) из ?fields=id,price,... и ?expand=brand,images;
+        fields=None - все поля. expand есть только у компактного списка.
+        """
+        if self._sparse_fieldset is None:
+            params = self.request.query_params
+            serializer_class = self.get_serializer_class()
+            fields = params.get('fields', '')
+            fields = parse_field_names(fields, serializer_class.readable_field_names(), 'fields') if fields else None
+            expand = params.get('expand', '')
+            allowed = getattr(serializer_class, 'EXPANDABLE', ())
+            expand = parse_field_names(expand, allowed, 'expand') if expand else set()
+            self._sparse_fieldset = (fields, expand)
+        return self._sparse_fieldset
+
+    def get_serializer(self, *args, **kwargs):
+        if self.action in ('list', 'retrieve', 'similar'):
+            kwargs['fields'], kwargs['expand'] = self.get_sparse_fieldset()
+        return super().get_serializer(*args, **kwargs)
+
+    def narrow_queryset(self, queryset):
+        """Читает из Car только колонки запрошенных полей (.only())"""
+        fields, _ = self.get_sparse_fieldset()
+        if fields is None:
+            return queryset
+        if 'brand' not in fields:
+            queryset = queryset.select_related(None)
+        if 'images' not in fields:
+            queryset = queryset.prefetch_related(None)
+        return queryset.only('id', *CarSerializer.source_fields_for(fields))
+
+    def get_queryset(self):
+        if self.action != 'list':
+            queryset = super().get_queryset()
+            return self.narrow_queryset(queryset) if self.action == 'retrieve' else queryset
+
+        # Список читает только проекцию каталога: dict-строки без JOIN и моделей
+        params = self.request.query_params
+        fields, _ = self.get_sparse_fieldset()
+        columns = CARD_FIELDS
+        if fields is not None:
+            # created_at нужен курсору страницы
+            columns = ['created_at', *(CarListingSerializer.source_fields_for(fields) - {'id', 'created_at'})]
+        # Те же фильтры, что и в серверном каталоге (brand, fuel, min_price, ...)
+        queryset = apply_filters(listing_values(fields=columns), filters_from_params(params))
+        search_query = params.get('search', '')
+        if search_query:
+            backend = get_search_backend()
+            # Порядок по релевантности применяет CarCursorPagination
+            self.search_ids = backend.search(search_query, limit=None)
+            queryset = backend.filter_matches(queryset, search_query)
+        return queryset
+
+    def get_serializer_class(self):
+        if self.action == 'list':
+            return CarListingSerializer
+        return super().get_serializer_class()
+
+    def list(self, request, *args, **kwargs):
+        etag = list_etag(request, 'cars:list', get_favorite_car_ids(request))
+        return conditional_response(request, lambda: self.cached_response(
+            request, lambda: self._list_with_facets(request, *args, **kwargs),
+        ), etag)
+
+    def retrieve(self, request, *args, **kwargs):
+        build = super().retrieve
+
+        def respond():
+            return self.cached_response(request, lambda: build(request, *args, **kwargs))
+
+        # Валидатор - один запрос к updated_at; 404 отдаст сам retrieve
+        car_id = kwargs['pk']
+        updated_at = car_updated_at(car_id, super().get_queryset()) if str(car_id).isdigit() else None
+        if updated_at is None:
+            return respond()
+        etag = detail_etag(request, 'cars:detail', updated_at, int(car_id) in get_favorite_car_ids(request))
+        return conditional_response(request, respond, etag, updated_at)
+
+    def _list_with_facets(self, request, *args, **kwargs):
+        """
+        Страница автомобилей (keyset-пагинация) со счётчиками фасетов
+        и общим количеством из фасетного индекса - без COUNT(*) по таблице
+        """
+        response = super().list(request, *args, **kwargs)
+        filters = filters_from_params(request.query_params)
+        car_ids = set(self.search_ids) if self.search_ids is not None else None
+        response.data['count'] = facet_index.total(filters, car_ids=car_ids)
+        response.data['facets'] = facet_index.serialize(filters, car_ids=car_ids)
+        return response
+
+    @action(detail=True, methods=['get'])
+    def similar(self, request, pk=None):
+        """Похожие автомобили (?limit=, по умолчанию 3)"""
+        car = get_object_or_404(Car, pk=pk)
+        limit = request.query_params.get('limit', '')
+        limit = min(int(limit), MAX_NEIGHBOURS) if limit.isdigit() else 3
+        cars = get_similar_cars(car, limit, queryset=self.narrow_queryset(self.queryset))
+        serializer = self.get_serializer(cars, many=True)
+        return Response(serializer.data)
 
     @action(detail=True, methods=['post'], permission_classes=[permissions.IsAuthenticated])
     @method_decorator(csrf_exempt, name='dispatch')
@@ -47,13 +174,38 @@ class PurchaseRequestViewSet(viewsets.ModelViewSet):
         """Пользователи видят свои заявки, менеджеры - все"""
         user = self.request.user
         if user.is_manager():
-            return PurchaseRequest.objects.all().select_related('user', 'car')
-        return PurchaseRequest.objects.filter(user=user).select_related('car')
+            queryset = PurchaseRequest.objects.all()
+        else:
+            queryset = PurchaseRequest.objects.filter(user=user)
+        return queryset.select_related('user', 'car', 'car__brand').prefetch_related(images_prefetch('car__images'))
 
     def perform_create(self, serializer):
         """Автоматически привязываем пользователя"""
         serializer.save(user=self.request.user)
 
+    @action(detail=False, methods=['post'], url_path='bulk-status')
+    def bulk_status(self, request):
+        """
+        Массовая смена статуса (только менеджеры): {"ids": [...], "status": ...,
+        "manager_comment": ...}. Один UPDATE и один INSERT уведомлений;
+        в ответе - изменённые заявки и пропущенные с причиной.
+        """
+        if not request.user.is_manager():
+            return Response({'error': 'Недостаточно прав'}, status=status.HTTP_403_FORBIDDEN)
+
+        serializer = PurchaseRequestBulkStatusSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        result = transition_requests(
+            serializer.validated_data['ids'],
+            serializer.validated_data['status'],
+            serializer.validated_data.get('manager_comment'),
+        )
+        return Response({
+            'status': serializer.validated_data['status'],
+            'updated': result['updated'],
+            'skipped': result['skipped'],
+        })
+
 
 class FavoriteViewSet(viewsets.ModelViewSet):
     """API для избранных автомобилей"""
@@ -61,7 +213,11 @@ class FavoriteViewSet(viewsets.ModelViewSet):
     permission_classes = [permissions.IsAuthenticated]
 
     def get_queryset(self):
-        return Favorite.objects.filter(user=self.request.user).select_related('car')
+        return (
+            Favorite.objects.filter(user=self.request.user)
+            .select_related('car', 'car__brand')
+            .prefetch_related(images_prefetch('car__images'))
+        )
 
     def perform_create(self, serializer):
         car_id = self.request.data.get('car_id')
@@ -69,6 +225,7 @@ class FavoriteViewSet(viewsets.ModelViewSet):
         # Проверяем, не добавлен ли уже в избранное
         if not Favorite.objects.filter(user=self.request.user, car=car).exists():
             serializer.save(user=self.request.user, car=car)
+            invalidate_favorite_car_ids(self.request)
         else:
             # Если уже есть, возвращаем ошибку
             raise serializers.ValidationError("Автомобиль уже в избранном")
@@ -85,6 +242,9 @@ class FavoriteViewSet(viewsets.ModelViewSet):
             car=car
         )
 
+        # Набор избранного, закэшированный на запросе, больше не актуален
+        invalidate_favorite_car_ids(request)
+
         if not created:
             favorite.delete()
             return Response({'action': 'removed', 'message': 'Удалено из избранного'})
@@ -99,6 +259,53 @@ class FavoriteViewSet(viewsets.ModelViewSet):
         return Response({'is_favorite': is_favorite})
 
 
+class SupportChatViewSet(viewsets.ReadOnlyModelViewSet):
+    """API чатов поддержки: список, история сообщений, непрочитанное"""
+    serializer_class = SupportChatSerializer
+    permission_classes = [permissions.IsAuthenticated]
+    pagination_class = ChatInboxCursorPagination
+
+    def get_queryset(self):
+        """Клиенты видят свои чаты, менеджеры - все"""
+        return (
+            chats_for(self.request.user)
+            .select_related('user', 'manager')
+            .annotate(last_message=last_message())
+        )
+
+    @action(detail=False, methods=['get'])
+    def inbox(self, request):
+        """Входящие менеджера: активные чаты по последней активности, одним запросом"""
+        if not request.user.is_manager():
+            return Response({'error': 'Недостаточно прав'}, status=status.HTTP_403_FORBIDDEN)
+        page = self.paginate_queryset(manager_inbox())
+        return self.get_paginated_response(self.get_serializer(page, many=True).data)
+
+    @action(detail=False, methods=['get'])
+    def unread(self, request):
+        return Response({'unread': unread_total(request.user)})
+
+    @action(detail=True, methods=['get'])
+    def messages(self, request, pk=None):
+        """История чата по курсору, от новых сообщений к старым"""
+        chat = self.get_object()
+        paginator = ChatHistoryCursorPagination()
+        page = paginator.paginate_queryset(
+            Message.objects.filter(chat=chat).select_related('sender'), request, view=self,
+        )
+        return paginator.get_paginated_response(ChatMessageSerializer(page, many=True).data)
+
+    @action(detail=True, methods=['post'])
+    def read(self, request, pk=None):
+        """{"up_to": id} - отметить прочитанным всё до сообщения включительно"""
+        chat = self.get_object()
+        serializer = ChatMarkReadSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        marked = mark_read(chat, request.user, serializer.validated_data['up_to'])
+        chat.refresh_from_db(fields=['client_unread', 'manager_unread'])
+        return Response({'marked': marked, 'unread': chat.unread_for(request.user)})
+
+
 class LoginView(APIView):
     """API для входа в систему"""
     permission_classes = []
@@ -13,4 +13,23 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'autosalon.settings')
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+from channels.routing import ProtocolTypeRouter, URLRouter  # noqa: E402 (после настройки Django)
+from channels.security.websocket import AllowedHostsOriginValidator  # noqa: E402
+
+from cars.routing import websocket_urlpatterns as cars_websocket_urlpatterns  # noqa: E402
+from chat.middleware import WebsocketAuthMiddlewareStack  # noqa: E402
+from chat.persistence import lifespan  # noqa: E402
+from chat.routing import websocket_urlpatterns as chat_websocket_urlpatterns  # noqa: E402
+from .middleware import EarlyHintsMiddleware  # noqa: E402
+
+application = ProtocolTypeRouter({
+    'http': EarlyHintsMiddleware(django_application),
+    # Чат и живой каталог: Origin - только с ALLOWED_HOSTS, пользователь - из JWT или сессии
+    'websocket': AllowedHostsOriginValidator(
+        WebsocketAuthMiddlewareStack(URLRouter(chat_websocket_urlpatterns + cars_websocket_urlpatterns))
+    ),
+    # При остановке сервера дописываем в БД буфер сообщений чата
+    'lifespan': lifespan,
+})
@@ -0,0 +1,68 @@
+"""
+Подсказки браузеру о ресурсах сборки Vue.
+
+VitePreloadMiddleware добавляет к HTML-ответам заголовок Link с
+modulepreload/preload для entry-чанка и его зависимостей.
+EarlyHintsMiddleware (ASGI) отправляет те же ссылки ответом 103 Early Hints
+ещё до того, как Django начнёт обрабатывать запрос, - если сервер
+поддерживает расширение http.response.early_hint (например, Hypercorn).
+
+Сборку подключают только страницы-оболочки SPA, поэтому оба пути
+работают лишь для адресов из settings.VITE_SHELL_PATHS: админке, серверному
+каталогу и страницам входа ссылки на чужие чанки не нужны.
+"""
+from django.conf import settings
+
+from .vite_utils import preload_links
+
+
+def is_shell_path(path):
+    """Адрес страницы-оболочки SPA, которая грузит сборку Vite"""
+    return path in settings.VITE_SHELL_PATHS
+
+
+class VitePreloadMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        if (
+            request.method == 'GET'
+            and is_shell_path(request.path)
+            and response.status_code == 200
+            and response.get('Content-Type', '').startswith('text/html')
+            and not response.has_header('Link')
+        ):
+            links = preload_links()
+            if links:
+                response['Link'] = ', '.join(links)
+        return response
+
+
+class EarlyHintsMiddleware:
+    """ASGI-обёртка над приложением Django"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if self._wants_hints(scope):
+            links = preload_links()
+            if links:
+                await send({
+                    'type': 'http.response.early_hint',
+                    'links': [link.encode() for link in links],
+                })
+        await self.app(scope, receive, send)
+
+    @staticmethod
+    def _wants_hints(scope):
+        if scope['type'] != 'http' or scope['method'] != 'GET':
+            return False
+        if 'http.response.early_hint' not in scope.get('extensions', {}):
+            return False
+        if not is_shell_path(scope['path']):
+            return False
+        accept = dict(scope.get('headers', [])).get(b'accept', b'')
+        return b'text/html' in accept
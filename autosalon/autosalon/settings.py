@@ -45,6 +45,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'autosalon.middleware.VitePreloadMiddleware',
 ]
 
 # Настройки REST Framework
@@ -84,12 +85,24 @@ TEMPLATES = [
                 'django.template.context_processors.request',
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
+                'cars.reference.reference_data',
                 #'autosalon.vite_utils.vite_assets',
             ],
         },
     },
 ]
 
+if not DEBUG:
+    # В продакшене шаблоны компилируются один раз за процесс. В режиме DEBUG
+    # Django и так использует cached.Loader со сбросом при изменении файлов
+    TEMPLATES[0]['APP_DIRS'] = False
+    TEMPLATES[0]['OPTIONS']['loaders'] = [
+        ('django.template.loaders.cached.Loader', [
+            'django.template.loaders.filesystem.Loader',
+            'django.template.loaders.app_directories.Loader',
+        ]),
+    ]
+
 WSGI_APPLICATION = 'autosalon.wsgi.application'
 
 # Database
@@ -131,6 +144,30 @@ STATIC_ROOT = BASE_DIR / 'staticfiles'
 MEDIA_URL = 'media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# Кэш. По умолчанию - в памяти процесса; для нескольких воркеров укажите общий
+# бэкенд, например CACHE_BACKEND=django.core.cache.backends.filebased.FileBasedCache
+# и CACHE_LOCATION=/var/tmp/autosalon_cache (или memcached/redis на localhost)
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv('CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.getenv('CACHE_LOCATION', ''),
+    }
+}
+
+# Время жизни закэшированных ответов API каталога, сек (0 - без кэша)
+API_RESPONSE_CACHE_TIMEOUT = int(os.getenv('API_RESPONSE_CACHE_TIMEOUT', '600'))
+
+# Время жизни HTML-карточек автомобилей в каталоге, сек (ключ включает updated_at)
+CAR_CARD_CACHE_TIMEOUT = int(os.getenv('CAR_CARD_CACHE_TIMEOUT', str(24 * 60 * 60)))
+
+# Страницы-оболочки SPA, которые подключают сборку Vite (static/vue): только им
+# отправляются Link/103 Early Hints с её чанками (autosalon/middleware.py).
+# Например VITE_SHELL_PATHS=/,/vue-cars/
+VITE_SHELL_PATHS = [path for path in os.getenv('VITE_SHELL_PATHS', '').split(',') if path]
+
+# Процессы для построения WebP/AVIF-копий фотографий (cars/images.py)
+CAR_IMAGE_WORKERS = int(os.getenv('CAR_IMAGE_WORKERS', '2'))
+
 # Моя кастомная модель пользователя
 AUTH_USER_MODEL = 'accounts.CustomUser'
 
@@ -144,4 +181,35 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 # Telegram bot settings
 TELEGRAM_BOT_TOKEN = os.getenv('TELEGRAM_BOT_TOKEN', '')
-TELEGRAM_BOT_USERNAME = os.getenv('TELEGRAM_BOT_USERNAME', '')
\ No newline at end of file
+TELEGRAM_BOT_USERNAME = os.getenv('TELEGRAM_BOT_USERNAME', '')
+# Лимиты рассылки (flood control Telegram: ~30 сообщений/с на бота, ~1/с в один чат)
+TELEGRAM_GLOBAL_RATE = float(os.getenv('TELEGRAM_GLOBAL_RATE', '25'))
+TELEGRAM_CHAT_RATE = float(os.getenv('TELEGRAM_CHAT_RATE', '1'))
+# Одновременных отправок и HTTP-соединений в пуле
+TELEGRAM_CONCURRENCY = int(os.getenv('TELEGRAM_CONCURRENCY', '20'))
+
+# Чат: сообщения пишутся в БД пачками (chat/persistence.py)
+CHAT_FLUSH_SIZE = int(os.getenv('CHAT_FLUSH_SIZE', '200'))
+CHAT_FLUSH_INTERVAL = float(os.getenv('CHAT_FLUSH_INTERVAL', '0.5'))
+# Как часто рассылаются снимки присутствия и «печатает...» (chat/presence.py)
+CHAT_PRESENCE_TICK = float(os.getenv('CHAT_PRESENCE_TICK', '1'))
+
+# ASGI: HTTP, WebSocket чата и lifespan (autosalon/asgi.py)
+ASGI_APPLICATION = 'autosalon.asgi.application'
+
+# Слой каналов (рассылка сообщений чата). По умолчанию - в памяти процесса
+# (chat/layers.py): работает, пока сервер запущен одним воркером. Для нескольких воркеров
+# нужен общий сервер, например CHANNEL_LAYER_BACKEND=channels_redis.core.RedisChannelLayer
+# и CHANNEL_LAYER_HOSTS=redis://127.0.0.1:6379 (подойдёт и совместимый с Redis
+# сервер, например Valkey). Замер: python manage.py bench_channel_layer
+CHANNEL_LAYERS = {
+    'default': {
+        'BACKEND': os.getenv('CHANNEL_LAYER_BACKEND', 'chat.layers.LocalChannelLayer'),
+    }
+}
+if os.getenv('CHANNEL_LAYER_HOSTS'):
+    CHANNEL_LAYERS['default']['CONFIG'] = {'hosts': os.getenv('CHANNEL_LAYER_HOSTS').split(',')}
+
+# Живой каталог: изменения автомобилей уходят открытым страницам не чаще
+# раза в столько секунд (cars/live.py, cars/consumers.py)
+INVENTORY_PUSH_INTERVAL = float(os.getenv('INVENTORY_PUSH_INTERVAL', '1'))
@@ -0,0 +1,75 @@
+import json
+import os
+import tempfile
+from pathlib import Path
+
+from django.test import SimpleTestCase, override_settings
+
+from . import vite_utils
+from .middleware import EarlyHintsMiddleware
+
+MANIFEST = {
+    'src/main.js': {'file': 'assets/main.js', 'isEntry': True, 'imports': ['_vendor.js'], 'css': ['assets/main.css']},
+    '_vendor.js': {'file': 'assets/vendor.js', 'imports': ['_core.js'], 'css': ['assets/vendor.css']},
+    '_core.js': {'file': 'assets/core.js'},
+}
+
+
+class ViteManifestTest(SimpleTestCase):
+    """Манифест сборки Vue и ссылки для Link / 103 Early Hints"""
+
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        base_dir = self.settings(BASE_DIR=tmp.name, DEBUG=False)
+        base_dir.enable()
+        self.addCleanup(base_dir.disable)
+        self.path = Path(tmp.name) / 'static' / 'vue' / '.vite' / 'manifest.json'
+        self.path.parent.mkdir(parents=True)
+        vite_utils._cache.update(mtime=None, assets=None)
+        self.addCleanup(vite_utils._cache.update, mtime=None, assets=None)
+
+    def _write(self, manifest, mtime_ns):
+        self.path.write_text(json.dumps(manifest))
+        os.utime(self.path, ns=(mtime_ns, mtime_ns))
+
+    def test_links_in_dependency_order(self):
+        self._write(MANIFEST, 1_000_000_000)
+        self.assertEqual(vite_utils.preload_links(), [
+            '</static/vue/assets/main.js>; rel=modulepreload',
+            '</static/vue/assets/core.js>; rel=modulepreload',
+            '</static/vue/assets/vendor.js>; rel=modulepreload',
+            '</static/vue/assets/vendor.css>; rel=preload; as=style',
+            '</static/vue/assets/main.css>; rel=preload; as=style',
+        ])
+
+    def test_manifest_reread_only_when_mtime_changes(self):
+        self._write(MANIFEST, 1_000_000_000)
+        self.assertEqual(vite_utils.get_vite_manifest()['main']['file'], '/static/vue/assets/main.js')
+
+        rebuilt = {'src/main.js': {'file': 'assets/main-2.js', 'isEntry': True}}
+        # Тот же mtime - файл не перечитывается
+        self._write(rebuilt, 1_000_000_000)
+        self.assertEqual(vite_utils.get_vite_manifest()['main']['file'], '/static/vue/assets/main.js')
+        self._write(rebuilt, 2_000_000_000)
+        self.assertEqual(vite_utils.get_vite_manifest()['main']['file'], '/static/vue/assets/main-2.js')
+        self.assertEqual(vite_utils.preload_links(), ['</static/vue/assets/main-2.js>; rel=modulepreload'])
+
+    @override_settings(VITE_SHELL_PATHS=['/about/'])
+    def test_link_header_only_on_shell_pages(self):
+        self._write(MANIFEST, 1_000_000_000)
+        response = self.client.get('/about/')
+        self.assertIn('</static/vue/assets/main.js>; rel=modulepreload', response['Link'])
+        self.assertFalse(self.client.get('/register/').has_header('Link'))
+
+    @override_settings(VITE_SHELL_PATHS=['/about/'])
+    def test_early_hints_only_on_shell_pages(self):
+        def scope(path):
+            return {
+                'type': 'http', 'method': 'GET', 'path': path,
+                'extensions': {'http.response.early_hint': {}}, 'headers': [(b'accept', b'text/html')],
+            }
+
+        self.assertTrue(EarlyHintsMiddleware._wants_hints(scope('/about/')))
+        self.assertFalse(EarlyHintsMiddleware._wants_hints(scope('/admin/')))
+        self.assertFalse(EarlyHintsMiddleware._wants_hints(scope('/cars/')))
@@ -1,6 +1,9 @@
+from django.conf import settings
 from django.shortcuts import render, get_object_or_404
 from django.http import Http404
+from cars.images import images_prefetch, settings_base_url
 from cars.models import Car  # Импортируем модель Car из приложения cars
+from cars.similarity import get_similar_cars
 
 
 # Детальная страница автомобиля
@@ -14,14 +17,11 @@ def vue_car_detail(request, car_id):
         car = Car.objects.get(id=car_id)
 
         # Получаем изображения автомобиля
-        from django.conf import settings
+        car_images = list(car.images.all())
         images = []
-        scheme = 'https' if settings.SECURE_SSL_REDIRECT else 'http'
-        host = settings.ALLOWED_HOSTS[0] if settings.ALLOWED_HOSTS else '127.0.0.1'
-        port = ':8000' if host in ['127.0.0.1', 'localhost'] else ''
-        base_url = f"{scheme}://{host}{port}"
+        base_url = settings_base_url()
 
-        for image in car.images.all():
+        for image in car_images:
             images.append({
                 'id': image.id,
                 'url': f"{base_url}{image.image.url}",
@@ -35,11 +35,10 @@ def vue_car_detail(request, car_id):
             from cars.models import Favorite
             is_favorite = Favorite.objects.filter(user=request.user, car=car).exists()
 
-        # Получаем похожие автомобили (той же марки, но не проданные)
-        similar_cars = Car.objects.filter(
-            brand=car.brand,
-            is_sold=False
-        ).exclude(id=car.id).order_by('?')[:3]  # 3 случайных авто
+        # Похожие непроданные автомобили (ближайшие по характеристикам, сначала той же марки)
+        similar_cars = get_similar_cars(
+            car, 3, queryset=Car.objects.select_related('brand').prefetch_related(images_prefetch())
+        )
 
         # Форматируем данные для шаблона
         car_data = {
@@ -62,6 +61,7 @@ def vue_car_detail(request, car_id):
 
     except Car.DoesNotExist:
         # Если автомобиль не найден в базе, используем демо-данные
+        car_images, similar_cars, is_favorite = [], [], False
         car_data = {
             'id': car_id,
             'brand': 'Mercedes-Benz',
@@ -83,8 +83,11 @@ def vue_car_detail(request, car_id):
     # Передаем данные в шаблон
     context = {
         'car': car_data,
+        # Галерея шаблона - объекты CarImage, как в cars.views.car_detail
+        'images': car_images,
         'is_favorite': is_favorite,
         'similar_cars': similar_cars,
+        'card_cache_timeout': settings.CAR_CARD_CACHE_TIMEOUT,
     }
 
     return render(request, 'cars/car_detail.html', context)
\ No newline at end of file
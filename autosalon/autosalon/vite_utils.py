@@ -1,41 +1,91 @@
 import json
 import os
+import threading
 from pathlib import Path
 from django.conf import settings
 
+VITE_STATIC_URL = '/static/vue/'
+
+# Разобранный манифест и собранные из него ассеты; перечитываются при смене mtime
+_cache = {'mtime': None, 'assets': None}
+_cache_lock = threading.Lock()
+
+
+def get_manifest_path():
+    return Path(settings.BASE_DIR) / "static" / "vue" / ".vite" / "manifest.json"
+
+
+def _collect_chunk(manifest, key, scripts, styles, seen):
+    """Рекурсивно собирает JS-импорты и CSS чанка (в порядке зависимостей)"""
+    if key in seen or key not in manifest:
+        return
+    seen.add(key)
+    chunk = manifest[key]
+    for imported in chunk.get('imports', []):
+        _collect_chunk(manifest, imported, scripts, styles, seen)
+        imported_file = manifest.get(imported, {}).get('file')
+        if imported_file and imported_file not in scripts:
+            scripts.append(imported_file)
+    for css in chunk.get('css', []):
+        if css not in styles:
+            styles.append(css)
+
+
+def _build_assets(manifest):
+    for key, value in manifest.items():
+        if value.get('isEntry'):
+            scripts, styles = [], []
+            _collect_chunk(manifest, key, scripts, styles, set())
+            return {
+                'development': False,
+                'main': {
+                    'file': f'{VITE_STATIC_URL}{value["file"]}',
+                    'css': [f'{VITE_STATIC_URL}{css}' for css in value.get('css', [])]
+                },
+                # Всё, что браузер может начать загружать до разбора HTML
+                'preload': {
+                    'modules': [f'{VITE_STATIC_URL}{value["file"]}'] + [f'{VITE_STATIC_URL}{name}' for name in scripts],
+                    'styles': [f'{VITE_STATIC_URL}{css}' for css in styles],
+                },
+            }
+    return None
+
 
 def get_vite_manifest():
     """
     Загружает манифест Vite для production сборки.
     В development режиме возвращает ссылки на dev сервер.
+
+    Манифест разбирается один раз и держится в памяти процесса; при каждом
+    вызове проверяется только mtime файла (новая сборка - перечитываем).
     """
-    manifest_path = Path(settings.BASE_DIR) / "static" / "vue" / ".vite" / "manifest.json"
+    manifest_path = get_manifest_path()
+
+    try:
+        mtime = os.stat(manifest_path).st_mtime_ns
+    except FileNotFoundError:
+        mtime = None
 
     # В development режиме
-    if settings.DEBUG and not manifest_path.exists():
+    if settings.DEBUG and mtime is None:
         return {
             'development': True,
             'main': {
                 'file': 'http://localhost:5173/src/main.js',
                 'css': []
-            }
+            },
+            'preload': {'modules': [], 'styles': []},
         }
 
     # В production режиме
-    if manifest_path.exists():
-        with open(manifest_path, 'r') as f:
-            manifest = json.load(f)
-
-        # Ищем entry point
-        for key, value in manifest.items():
-            if value.get('isEntry'):
-                return {
-                    'development': False,
-                    'main': {
-                        'file': f'/static/vue/{value["file"]}',
-                        'css': [f'/static/vue/{css}' for css in value.get('css', [])]
-                    }
-                }
+    if mtime is not None:
+        with _cache_lock:
+            if _cache['mtime'] != mtime:
+                with open(manifest_path, 'r') as f:
+                    _cache['assets'] = _build_assets(json.load(f))
+                _cache['mtime'] = mtime
+            if _cache['assets'] is not None:
+                return _cache['assets']
 
     # Если манифест не найден
     return {
@@ -43,12 +93,21 @@ def get_vite_manifest():
         'main': {
             'file': '',
             'css': []
-        }
+        },
+        'preload': {'modules': [], 'styles': []},
     }
 
 
+def preload_links():
+    """Значения для заголовка Link / 103 Early Hints по entry-чанку сборки"""
+    preload = get_vite_manifest()['preload']
+    links = [f'<{url}>; rel=modulepreload' for url in preload['modules']]
+    links += [f'<{url}>; rel=preload; as=style' for url in preload['styles']]
+    return links
+
+
 def vite_assets(request):
     """Контекстный процессор для шаблонов Django"""
     return {
         'vite': get_vite_manifest()
-    }
\ No newline at end of file
+    }
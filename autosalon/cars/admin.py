@@ -1,5 +1,7 @@
-from django.contrib import admin
+from django.contrib import admin, messages
+from notifications.outbox import enqueue_broadcast
 from .models import Brand, Car, CarImage, PurchaseRequest  # <-- ДОБАВЛЯЕМ PurchaseRequest
+from .purchase_requests import transition_requests
 
 
 @admin.register(Brand)
@@ -36,7 +38,7 @@ class CarAdmin(admin.ModelAdmin):
         'fuel_type',
         'is_sold'
     )
-    search_fields = ('model', 'color', 'brand__name')
+    search_fields = ('model', 'color', 'brand__name', 'stock_id')
     readonly_fields = ('created_at', 'updated_at')
     inlines = [CarImageInline]  # добавляем фото прямо в форму авто
 
@@ -63,6 +65,20 @@ class CarAdmin(admin.ModelAdmin):
         }),
     )
 
+    actions = ['broadcast_to_subscribers']
+
+    def broadcast_to_subscribers(self, request, queryset):
+        # Одно сообщение со всеми выбранными авто; доставляет воркер run_notification_worker
+        cars = queryset.filter(is_sold=False).select_related('brand').order_by('brand__name', 'model')
+        lines = [f"{car.brand.name} {car.model}, {car.year} г. - {car.price:,.0f} ₽".replace(',', ' ') for car in cars]
+        if not lines:
+            self.message_user(request, "Среди выбранных нет автомобилей в продаже", level=messages.WARNING)
+            return
+        count = enqueue_broadcast('Новые автомобили в продаже', '\n'.join(lines), 'new_car')
+        self.message_user(request, f"Рассылка поставлена в очередь: {count} подписчиков")
+
+    broadcast_to_subscribers.short_description = "Разослать подписчикам Telegram"
+
 
 @admin.register(CarImage)
 class CarImageAdmin(admin.ModelAdmin):
@@ -110,20 +126,27 @@ class PurchaseRequestAdmin(admin.ModelAdmin):
     # Действия в админке
     actions = ['mark_as_in_progress', 'mark_as_approved', 'mark_as_rejected']
 
+    def _set_status(self, request, queryset, status, message):
+        result = transition_requests(queryset.values_list('pk', flat=True), status)
+        self.message_user(request, f"{len(result['updated'])} {message}")
+        if result['skipped']:
+            self.message_user(
+                request,
+                f"Пропущено заявок: {len(result['skipped'])} (статус уже установлен или заявка завершена)",
+                level=messages.WARNING,
+            )
+
     def mark_as_in_progress(self, request, queryset):
-        queryset.update(status='in_progress')
-        self.message_user(request, f"{queryset.count()} заявок переведены в обработку")
+        self._set_status(request, queryset, 'in_progress', "заявок переведены в обработку")
 
     mark_as_in_progress.short_description = "Перевести в обработку"
 
     def mark_as_approved(self, request, queryset):
-        queryset.update(status='approved')
-        self.message_user(request, f"{queryset.count()} заявок одобрены")
+        self._set_status(request, queryset, 'approved', "заявок одобрены")
 
     mark_as_approved.short_description = "Одобрить выбранные"
 
     def mark_as_rejected(self, request, queryset):
-        queryset.update(status='rejected')
-        self.message_user(request, f"{queryset.count()} заявок отклонены")
+        self._set_status(request, queryset, 'rejected', "заявок отклонены")
 
     mark_as_rejected.short_description = "Отклонить выбранные"
\ No newline at end of file
@@ -0,0 +1,49 @@
+"""
+Счётчики версий в общем кэше Django.
+
+Версия - целое число под постоянным ключом. Кэши, построенные по данным
+каталога, включают её в свои ключи; изменение данных поднимает версию,
+и старые записи просто перестают читаться (и вытесняются по таймауту).
+
+Новый счётчик начинается не с 0, а с time.time_ns(): от версии строятся и
+ETag, которые живут у клиентов сколько угодно. После перезапуска процесса
+или вытеснения ключа счётчик не повторит уже выданное значение, иначе
+клиент получил бы 304 на изменившиеся данные. Подъём версии в одном
+процессе виден другим только через общий бэкенд кэша (см. CACHES).
+
+Версия инвентаря (cars:inventory:version) поднимается сигналами Car,
+CarImage и Brand после фиксации транзакции (см. cars/signals.py).
+"""
+import time
+
+from django.core.cache import cache
+
+INVENTORY_VERSION_KEY = 'cars:inventory:version'
+
+
+def get_version(key):
+    return cache.get_or_set(key, time.time_ns, timeout=None)
+
+
+def bump_version(key):
+    """Увеличивает версию; возвращает новое значение"""
+    seed = time.time_ns()
+    if cache.add(key, seed, timeout=None):
+        # Новый счётчик уже отличается от всех прежних значений
+        return seed
+    try:
+        return cache.incr(key)
+    except ValueError:
+        # Ключ успели вытеснить между add() и incr()
+        version = time.time_ns()
+        cache.set(key, version, timeout=None)
+        return version
+
+
+def inventory_version():
+    """Текущая версия данных каталога (автомобили, фото, марки)"""
+    return get_version(INVENTORY_VERSION_KEY)
+
+
+def bump_inventory_version():
+    return bump_version(INVENTORY_VERSION_KEY)
@@ -0,0 +1,52 @@
+import asyncio
+import json
+
+from channels.generic.websocket import AsyncWebsocketConsumer
+from django.conf import settings
+
+from .live import CREATED, DELETED, INVENTORY_GROUP
+
+
+def merge_change(pending, change):
+    """Добавляет изменение к накопленным за тик: поля объединяются, удаление - окончательно"""
+    previous = pending.get(change['id'])
+    if previous is None or change['op'] == DELETED or previous['op'] == DELETED:
+        pending[change['id']] = change
+        return
+    pending[change['id']] = {
+        'id': change['id'],
+        'op': CREATED if CREATED in (previous['op'], change['op']) else change['op'],
+        'fields': {**previous['fields'], **change['fields']},
+        'is_sold': change['is_sold'],
+    }
+
+
+class InventoryConsumer(AsyncWebsocketConsumer):
+    """
+    Изменения каталога (cars/live.py) для открытых страниц. Клиенту -
+    не чаще раза в INVENTORY_PUSH_INTERVAL секунд кадр
+    {"type": "inventory", "changes": [...]} с изменениями, объединёнными по id.
+    """
+
+    async def connect(self):
+        self.pending = {}
+        self.flush_task = None
+        await self.channel_layer.group_add(INVENTORY_GROUP, self.channel_name)
+        await self.accept()
+
+    async def disconnect(self, close_code):
+        if self.flush_task is not None:
+            self.flush_task.cancel()
+        await self.channel_layer.group_discard(INVENTORY_GROUP, self.channel_name)
+
+    async def inventory_changes(self, event):
+        for change in event['changes']:
+            merge_change(self.pending, change)
+        if self.flush_task is None:
+            self.flush_task = asyncio.get_running_loop().create_task(self._flush_later())
+
+    async def _flush_later(self):
+        await asyncio.sleep(settings.INVENTORY_PUSH_INTERVAL)
+        changes, self.pending = list(self.pending.values()), {}
+        self.flush_task = None
+        await self.send(text_data=json.dumps({'type': 'inventory', 'changes': changes}))
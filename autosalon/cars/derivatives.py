@@ -0,0 +1,94 @@
+"""
+Генерация производных изображений (миниатюра, карточка, полный размер)
+в формате WebP и, если его поддерживает установленный Pillow, AVIF.
+
+Модуль намеренно не импортирует Django: функции выполняются в пуле
+процессов (см. cars.images.schedule_variants) и работают только с путями
+на диске, поэтому годятся и для fork, и для spawn.
+"""
+from pathlib import Path
+
+from PIL import Image, ImageOps, features
+
+# Варианты: имя -> целевая ширина в пикселях
+VARIANT_WIDTHS = {
+    'thumb': 320,
+    'card': 640,
+    'full': 1600,
+}
+
+FORMAT_OPTIONS = {
+    'webp': {'format': 'WEBP', 'quality': 80, 'method': 4},
+    'avif': {'format': 'AVIF', 'quality': 55},
+}
+
+
+def _supported(fmt):
+    # Pillow до 11.2 не знает модуля avif: features.check('avif') на каждом
+    # вызове лишь предупреждает "Unknown feature" - поэтому check_module
+    return fmt in features.modules and features.check_module(fmt)
+
+
+# Проверяется один раз при импорте; с Pillow~=10.2 из requirements.txt - только WebP
+AVAILABLE_FORMATS = tuple(name for name in FORMAT_OPTIONS if _supported(name))
+
+
+def available_formats():
+    """Форматы, которые поддерживает установленный Pillow"""
+    return list(AVAILABLE_FORMATS)
+
+
+def derivative_name(name, variant, fmt):
+    """
+    car_images/photo.jpg -> car_images/derived/photo.jpg_card.webp
+
+    Имя исходного файла берётся целиком, с расширением: у photo.jpg и
+    photo.png копии разные, и delete_variants не удалит чужие файлы.
+    """
+    path = Path(name)
+    return str(path.parent / 'derived' / f'{path.name}_{variant}.{fmt}')
+
+
+def variants_srcset(variants, fmt, url):
+    """
+    Значение атрибута srcset ('url 320w, url 640w, ...') по описанию
+    вариантов из generate_derivatives; url - функция путь -> URL.
+    """
+    entries = []
+    for data in variants.values():
+        if isinstance(data, dict) and data.get(fmt):
+            entries.append(f"{url(data[fmt])} {data['width']}w")
+    return ', '.join(entries)
+
+
+def generate_derivatives(media_root, name, formats=None):
+    """
+    Создаёт все варианты для файла media_root/name.
+
+    Возвращает описание для CarImage.variants:
+    {'card': {'width': 640, 'height': 427, 'webp': 'car_images/derived/...', ...}, ...}
+    Изображения не увеличиваются: если оригинал уже, вариант сохраняется
+    в исходной ширине.
+    """
+    formats = formats or available_formats()
+    root = Path(media_root)
+    result = {}
+
+    with Image.open(root / name) as original:
+        # Фото с телефонов часто повёрнуты через EXIF
+        image = ImageOps.exif_transpose(original)
+        if image.mode not in ('RGB', 'RGBA'):
+            image = image.convert('RGBA' if 'transparency' in image.info else 'RGB')
+
+        for variant, target_width in VARIANT_WIDTHS.items():
+            resized = image.copy()
+            resized.thumbnail((target_width, target_width * 4), Image.Resampling.LANCZOS)
+            entry = {'width': resized.width, 'height': resized.height}
+            for fmt in formats:
+                target = derivative_name(name, variant, fmt)
+                (root / target).parent.mkdir(parents=True, exist_ok=True)
+                resized.save(root / target, **FORMAT_OPTIONS[fmt])
+                entry[fmt] = target
+            result[variant] = entry
+
+    return result
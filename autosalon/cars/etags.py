@@ -0,0 +1,57 @@
+"""
+Валидаторы условных GET (ETag, Last-Modified) для автомобилей.
+
+updated_at автомобиля - версия всей его карточки: его поднимают и
+изменения фотографий (включая готовые WebP/AVIF-копии), и правка марки
+(cars/listing.py). Списки и страницы с подборкой других машин зависят от
+всего каталога - их ETag строится от inventory_version (cars/cache.py).
+
+Ответ зависит и от пользователя (избранное, шапка страницы), поэтому
+его часть ответа тоже входит в ETag.
+"""
+import hashlib
+from calendar import timegm
+
+from django.conf import settings
+from django.contrib import messages
+from django.utils.http import http_date, quote_etag
+
+from .cache import inventory_version
+from .models import Car, Favorite
+
+
+def make_etag(*parts):
+    """Сильный ETag (в кавычках) из частей ответа"""
+    return quote_etag(hashlib.md5('|'.join(map(str, parts)).encode()).hexdigest())
+
+
+def timestamp(value):
+    return timegm(value.utctimetuple())
+
+
+def last_modified_header(value):
+    return http_date(timestamp(value))
+
+
+def car_updated_at(car_id, queryset=None):
+    """updated_at автомобиля - один запрос по первичному ключу; None, если его нет"""
+    queryset = Car.objects.all() if queryset is None else queryset.prefetch_related(None)
+    return queryset.filter(pk=car_id).values_list('updated_at', flat=True).first()
+
+
+def car_detail_etag(request, car_id):
+    """
+    ETag страницы автомобиля: карточка, похожие машины (каталог целиком),
+    пользователь с его избранным и CSRF-cookie, под которую отрисован токен формы.
+    Пока есть непоказанные flash-сообщения, страница рисуется заново.
+    Last-Modified у страницы нет: подборка меняется без updated_at машины.
+    """
+    updated_at = car_updated_at(car_id)
+    if updated_at is None or len(messages.get_messages(request)):
+        return None
+    user = request.user
+    is_favorite = user.is_authenticated and Favorite.objects.filter(user=user, car_id=car_id).exists()
+    return make_etag(
+        'car_detail', car_id, updated_at.isoformat(), inventory_version(),
+        user.pk, is_favorite, request.COOKIES.get(settings.CSRF_COOKIE_NAME, ''),
+    )
@@ -0,0 +1,227 @@
+"""
+Фасетный индекс каталога.
+
+Держит в памяти процесса компактные строки непроданных автомобилей и
+инвертированные списки по каждому фасету (марка, коробка, топливо, год,
+ценовой диапазон). Счётчики для боковой панели фильтров считаются
+пересечением множеств без обращения к таблице cars_car.
+
+Индекс обновляется инкрементально из сигналов Car (см. cars/signals.py),
+согласованность между воркерами - через общую версию (cars/inmemory.py).
+"""
+from bisect import bisect_left, bisect_right, insort
+
+from .inmemory import InMemoryIndex
+
+# Фасеты и позиция значения в строке индекса
+FACETS = ('brand', 'transmission', 'fuel_type', 'year', 'price')
+
+# Границы ценовых диапазонов (руб.): [0; 1 млн), [1 млн; 2 млн), ..., [10 млн; ∞)
+PRICE_BUCKETS = [1_000_000, 2_000_000, 3_000_000, 5_000_000, 10_000_000]
+
+
+def price_bucket(price):
+    """Номер ценового диапазона для цены"""
+    return bisect_right(PRICE_BUCKETS, price)
+
+
+def price_bucket_bounds(bucket):
+    """Границы диапазона (min, max); max=None для последнего"""
+    bounds = [0] + PRICE_BUCKETS
+    upper = PRICE_BUCKETS[bucket] if bucket < len(PRICE_BUCKETS) else None
+    return bounds[bucket], upper
+
+
+def _int_param(params, name):
+    value = params.get(name, '')
+    return int(value) if value and value.isdigit() else None
+
+
+def filters_from_params(params):
+    """
+    Разбирает GET-параметры каталога (те же, что у cars.views.home)
+    в словарь активных фильтров. Пустые значения отбрасываются.
+    """
+    filters = {
+        'brand': _int_param(params, 'brand'),
+        'transmission': params.get('transmission') or None,
+        'fuel_type': params.get('fuel') or None,
+        'min_price': _int_param(params, 'min_price'),
+        'max_price': _int_param(params, 'max_price'),
+        'min_year': _int_param(params, 'min_year'),
+        'max_year': _int_param(params, 'max_year'),
+    }
+    return {key: value for key, value in filters.items() if value is not None}
+
+
+def apply_filters(queryset, filters):
+    """Применяет словарь фильтров из filters_from_params к QuerySet автомобилей"""
+    lookups = {
+        'brand': 'brand_id',
+        'transmission': 'transmission',
+        'fuel_type': 'fuel_type',
+        'min_price': 'price__gte',
+        'max_price': 'price__lte',
+        'min_year': 'year__gte',
+        'max_year': 'year__lte',
+    }
+    return queryset.filter(**{lookups[key]: value for key, value in filters.items()})
+
+
+class FacetIndex(InMemoryIndex):
+    """Счётчики фасетов по непроданным автомобилям"""
+
+    version_key = 'cars:facets:version'
+
+    def __init__(self):
+        super().__init__()
+        self._rows = {}         # car_id -> (brand_id, transmission, fuel_type, year, price)
+        self._postings = {}     # фасет -> значение -> set(car_id)
+        self._by_price = []     # отсортированный список (price, car_id)
+
+    def _load(self):
+        from .models import Car
+
+        self._rows = {}
+        self._postings = {facet: {} for facet in FACETS}
+        self._by_price = []
+        queryset = Car.objects.filter(is_sold=False).order_by().values_list(
+            'id', 'brand_id', 'transmission', 'fuel_type', 'year', 'price'
+        )
+        for car_id, *row in queryset.iterator(chunk_size=2000):
+            self._add(car_id, tuple(row))
+
+    # --- ИНКРЕМЕНТАЛЬНЫЕ ОБНОВЛЕНИЯ ---
+
+    def _facet_values(self, row):
+        brand_id, transmission, fuel_type, year, price = row
+        return {
+            'brand': brand_id,
+            'transmission': transmission,
+            'fuel_type': fuel_type,
+            'year': year,
+            'price': price_bucket(price),
+        }
+
+    def _add(self, car_id, row):
+        self._rows[car_id] = row
+        for facet, value in self._facet_values(row).items():
+            self._postings[facet].setdefault(value, set()).add(car_id)
+        insort(self._by_price, (row[4], car_id))
+
+    def _remove(self, car_id):
+        row = self._rows.pop(car_id, None)
+        if row is None:
+            return
+        for facet, value in self._facet_values(row).items():
+            posting = self._postings[facet].get(value)
+            if posting is not None:
+                posting.discard(car_id)
+                if not posting:
+                    del self._postings[facet][value]
+        position = bisect_left(self._by_price, (row[4], car_id))
+        if position < len(self._by_price) and self._by_price[position] == (row[4], car_id):
+            del self._by_price[position]
+
+    def update_car(self, car):
+        """Отражает сохранение автомобиля (в т.ч. продажу) в индексе"""
+        def change():
+            self._remove(car.pk)
+            if not car.is_sold:
+                self._add(car.pk, (car.brand_id, car.transmission, car.fuel_type, car.year, car.price))
+        self._apply_change(change)
+
+    def remove_car(self, car_id):
+        """Убирает удалённый автомобиль из индекса"""
+        self._apply_change(lambda: self._remove(car_id))
+
+    # --- ПОДСЧЁТ ---
+
+    def _matches(self, filters):
+        """Множества car_id, удовлетворяющие каждому фасетному фильтру"""
+        matches = {}
+        for facet in ('brand', 'transmission', 'fuel_type'):
+            if facet in filters:
+                matches[facet] = self._postings[facet].get(filters[facet], set())
+
+        if 'min_year' in filters or 'max_year' in filters:
+            low = filters.get('min_year', float('-inf'))
+            high = filters.get('max_year', float('inf'))
+            matches['year'] = set().union(*(
+                ids for year, ids in self._postings['year'].items() if low <= year <= high
+            ))
+
+        if 'min_price' in filters or 'max_price' in filters:
+            start = 0
+            end = len(self._by_price)
+            if 'min_price' in filters:
+                start = bisect_left(self._by_price, (filters['min_price'],))
+            if 'max_price' in filters:
+                end = bisect_right(self._by_price, (filters['max_price'], float('inf')))
+            matches['price'] = {car_id for _, car_id in self._by_price[start:end]}
+
+        return matches
+
+    def counts(self, filters=None, car_ids=None):
+        """
+        Возвращает {фасет: {значение: количество}}.
+
+        Для каждого фасета учитываются все активные фильтры, кроме фильтра
+        по самому этому фасету - так в списке марок видно, сколько машин
+        даст выбор другой марки. car_ids дополнительно ограничивает выборку
+        (например, результатами текстового поиска).
+        """
+        filters = filters or {}
+
+        with self._lock:
+            self._ensure_loaded()
+            matches = self._matches(filters)
+            result = {}
+            for position, facet in enumerate(FACETS):
+                constraints = [ids for name, ids in matches.items() if name != facet]
+                if car_ids is not None:
+                    constraints.append(car_ids)
+
+                if not constraints:
+                    result[facet] = {value: len(ids) for value, ids in self._postings[facet].items()}
+                    continue
+
+                base = set.intersection(*(set(ids) for ids in constraints))
+                counter = {}
+                for car_id in base:
+                    row = self._rows.get(car_id)
+                    if row is None:
+                        continue
+                    value = price_bucket(row[4]) if facet == 'price' else row[position]
+                    counter[value] = counter.get(value, 0) + 1
+                result[facet] = counter
+            return result
+
+    def total(self, filters=None, car_ids=None):
+        """Количество непроданных автомобилей, подходящих под все фильтры сразу"""
+        filters = filters or {}
+
+        with self._lock:
+            self._ensure_loaded()
+            constraints = list(self._matches(filters).values())
+            if car_ids is not None:
+                constraints.append(set(car_ids) & self._rows.keys())
+            if not constraints:
+                return len(self._rows)
+            return len(set.intersection(*(set(ids) for ids in constraints)))
+
+    def serialize(self, filters=None, car_ids=None):
+        """Счётчики в виде, пригодном для JSON-ответа API"""
+        counts = self.counts(filters, car_ids)
+        data = {
+            facet: [{'value': value, 'count': count} for value, count in sorted(values.items())]
+            for facet, values in counts.items() if facet != 'price'
+        }
+        data['price'] = []
+        for bucket, count in sorted(counts['price'].items()):
+            low, high = price_bucket_bounds(bucket)
+            data['price'].append({'min': low, 'max': high, 'count': count})
+        return data
+
+
+facet_index = FacetIndex()
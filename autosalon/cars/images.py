@@ -0,0 +1,134 @@
+"""Вспомогательные функции для фотографий автомобилей"""
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from pathlib import Path
+from threading import Lock
+
+from django.conf import settings
+from django.db import close_old_connections
+from django.core.files.storage import default_storage
+from django.db.models import OuterRef, Prefetch, Subquery
+
+from .cache import bump_inventory_version
+from .derivatives import generate_derivatives
+from .listing import refresh_car_images
+from .models import CarImage
+
+logger = logging.getLogger(__name__)
+
+
+def images_prefetch(lookup='images'):
+    """
+    Prefetch фотографий с уже применённой сортировкой (основное фото первым),
+    чтобы сериализаторы и шаблоны не делали отдельный запрос на каждый автомобиль
+    """
+    return Prefetch(lookup, queryset=CarImage.objects.order_by('-is_main', 'uploaded_at'))
+
+
+def main_image_subquery(car_lookup='car'):
+    """
+    Путь основного фото автомобиля подзапросом - для .annotate(), чтобы
+    список из нескольких карточек обходился одним SELECT без prefetch
+    """
+    images = CarImage.objects.filter(car=OuterRef(car_lookup)).order_by('-is_main', 'uploaded_at', 'id')
+    return Subquery(images.values('image')[:1])
+
+
+def add_main_image_urls(objects, attname='main_image'):
+    """Проставляет main_image_url объектам, аннотированным main_image_subquery()"""
+    for obj in objects:
+        path = getattr(obj, attname)
+        obj.main_image_url = default_storage.url(path) if path else None
+    return objects
+
+
+@lru_cache(maxsize=1)
+def settings_base_url():
+    """Абсолютный адрес сайта из настроек - вычисляется один раз за процесс"""
+    scheme = 'https' if settings.SECURE_SSL_REDIRECT else 'http'
+    host = settings.ALLOWED_HOSTS[0] if settings.ALLOWED_HOSTS else '127.0.0.1'
+    port = ':8000' if host in ['127.0.0.1', 'localhost'] else ''
+    return f"{scheme}://{host}{port}"
+
+
+def media_base_url(request=None):
+    """
+    Абсолютный адрес сайта для ссылок на медиафайлы.
+    Для запроса вычисляется один раз и кэшируется на объекте request.
+    """
+    if request is None:
+        return settings_base_url()
+    base_url = getattr(request, '_media_base_url', None)
+    if base_url is None:
+        try:
+            base_url = request.build_absolute_uri('/').rstrip('/')
+        except Exception:
+            # Недопустимый Host и т.п. - берём адрес из настроек
+            base_url = settings_base_url()
+        request._media_base_url = base_url
+    return base_url
+
+
+# --- ПРОИЗВОДНЫЕ ИЗОБРАЖЕНИЯ ---
+
+_executor = None
+_executor_lock = Lock()
+
+
+def get_executor():
+    """
+    Пул процессов для перекодирования фото (создаётся при первой загрузке).
+    Pillow держит GIL на время кодирования, поэтому нужны именно процессы;
+    spawn, а не fork - родитель многопоточный (runserver, gunicorn threads).
+    """
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ProcessPoolExecutor(
+                max_workers=getattr(settings, 'CAR_IMAGE_WORKERS', 2),
+                mp_context=multiprocessing.get_context('spawn'),
+            )
+        return _executor
+
+
+def _store_variants(image_id, source, variants):
+    variants = {'source': source, **variants}
+    # update(), а не save(): не вызываем сигналы и не перетираем остальные поля
+    updated = CarImage.objects.filter(pk=image_id, image=source).update(variants=variants)
+    if updated:
+        # Сигналы не срабатывают - сами сбрасываем кэши с URL фотографий
+        car_id = CarImage.objects.filter(pk=image_id).values_list('car_id', flat=True).first()
+        if car_id is not None:
+            refresh_car_images(car_id)
+        bump_inventory_version()
+
+
+def _variants_done(image_id, source, future):
+    # Колбэк выполняется в служебном потоке пула - со своим соединением с БД
+    try:
+        _store_variants(image_id, source, future.result())
+    except Exception:
+        logger.exception('Не удалось построить производные для фото %s (%s)', image_id, source)
+    finally:
+        close_old_connections()
+
+
+def schedule_variants(image):
+    """Ставит построение производных для фото в очередь пула процессов"""
+    source = image.image.name
+    future = get_executor().submit(generate_derivatives, settings.MEDIA_ROOT, source)
+    future.add_done_callback(lambda done: _variants_done(image.pk, source, done))
+    return future
+
+
+def delete_variants(variants):
+    """Удаляет файлы производных с диска"""
+    root = Path(settings.MEDIA_ROOT)
+    for data in variants.values():
+        if not isinstance(data, dict):
+            continue
+        for key, path in data.items():
+            if key not in ('width', 'height'):
+                (root / path).unlink(missing_ok=True)
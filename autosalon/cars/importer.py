@@ -0,0 +1,360 @@
+"""
+Массовый импорт складских остатков (команда import_inventory).
+
+Лента - CSV или NDJSON произвольного размера - читается потоком и
+обрабатывается пачками по chunk_size строк: в памяти только текущая
+пачка и справочник марок. Ключ автомобиля - складской номер stock_id из
+ленты. Новые номера вставляются, изменённые строки обновляются, а
+неизменённые не пишутся вовсе - повторный импорт той же ленты ничего
+не меняет.
+
+Пачка - одна транзакция: bulk_create(update_conflicts=True) по stock_id,
+новые фотографии и всё, что для одиночных изменений делают сигналы
+Car/CarImage (bulk-операции их не шлют): строки проекции каталога,
+поисковый индекс, живые изменения для открытых страниц, версия
+инвентаря. Индексы в памяти процессов (фасеты, похожие) после импорта
+перечитываются целиком - и тогда, когда импорт прервался после уже
+зафиксированных пачек. WebP/AVIF-копии новых фото строит команда
+generate_image_variants.
+
+Импорт идёт в отдельном процессе: веб-воркеры узнают о нём только через
+общий кэш (версии) и общий слой каналов (живые изменения). С бэкендами в
+памяти процесса (locmem, LocalChannelLayer) они ничего не заметят до
+перезапуска - см. process_local_backends().
+"""
+import csv
+import gzip
+import io
+import json
+import sys
+import time
+from dataclasses import dataclass, field
+from decimal import Decimal, InvalidOperation
+from pathlib import Path
+
+from channels.layers import InMemoryChannelLayer, get_channel_layer
+from django.core.cache import DEFAULT_CACHE_ALIAS, caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.files import File
+from django.core.files.storage import default_storage
+from django.db import reset_queries, transaction
+from django.utils import timezone
+from django.utils.text import get_valid_filename
+
+from . import live
+from .cache import bump_inventory_version
+from .facets import facet_index
+from .listing import sync_cars
+from .models import Brand, Car, CarImage
+from .reference import FUEL_LABELS, TRANSMISSION_LABELS, get_brands
+from .search import get_search_backend
+from .similarity import similarity_index
+
+# Поля Car, которые задаёт лента
+IMPORT_FIELDS = (
+    'brand_id', 'model', 'year', 'price', 'mileage', 'color', 'transmission',
+    'fuel_type', 'engine_volume', 'horsepower', 'is_sold',
+)
+
+IMAGES_UPLOAD_TO = 'car_images/import'
+
+MAX_ERROR_MESSAGES = 20
+
+_TRUE = {'1', 'true', 'yes', 'да', 'y'}
+_FALSE = {'', '0', 'false', 'no', 'нет', 'n'}
+
+
+class ImportRowError(ValueError):
+    """Строку ленты нельзя импортировать; остальные строки продолжают загружаться"""
+
+
+@dataclass
+class ImportStats:
+    read: int = 0
+    created: int = 0
+    updated: int = 0
+    unchanged: int = 0
+    images: int = 0
+    errors: int = 0
+    messages: list = field(default_factory=list)
+    started: float = field(default_factory=time.monotonic)
+
+    def error(self, line, message):
+        self.errors += 1
+        if len(self.messages) < MAX_ERROR_MESSAGES:
+            self.messages.append(f'строка {line}: {message}')
+
+    @property
+    def rate(self):
+        elapsed = time.monotonic() - self.started
+        return self.read / elapsed if elapsed else 0.0
+
+
+def process_local_backends():
+    """Названия настроек, чьи бэкенды не видны другим процессам (CACHES, CHANNEL_LAYERS)"""
+    local = []
+    if isinstance(caches[DEFAULT_CACHE_ALIAS], LocMemCache):
+        local.append('CACHES')
+    if isinstance(get_channel_layer(), InMemoryChannelLayer):
+        local.append('CHANNEL_LAYERS')
+    return local
+
+
+# --- ЧТЕНИЕ ЛЕНТЫ ---
+
+def open_feed(path):
+    """Текстовый поток ленты: файл (в т.ч. .gz) или '-' - стандартный ввод"""
+    if path == '-':
+        return io.TextIOWrapper(sys.stdin.buffer, encoding='utf-8-sig', newline='')
+    if path.endswith('.gz'):
+        return gzip.open(path, 'rt', encoding='utf-8-sig', newline='')
+    return open(path, encoding='utf-8-sig', newline='')
+
+
+def feed_format(path):
+    name = path.removesuffix('.gz')
+    if name.endswith('.csv'):
+        return 'csv'
+    if name.endswith(('.ndjson', '.jsonl')):
+        return 'ndjson'
+    return None
+
+
+def read_rows(stream, fmt):
+    """(номер строки, dict) по одной строке ленты"""
+    if fmt == 'csv':
+        reader = csv.DictReader(stream)
+        for row in reader:
+            yield reader.line_num, row
+        return
+    for line, text in enumerate(stream, start=1):
+        if not text.strip():
+            continue
+        try:
+            row = json.loads(text)
+        except ValueError as exc:
+            row = exc
+        yield line, row
+
+
+# --- РАЗБОР СТРОКИ ---
+
+def _text(row, name, max_length, required=True):
+    value = row.get(name)
+    value = '' if value is None else str(value).strip()
+    if required and not value:
+        raise ImportRowError(f'не заполнено поле {name}')
+    if len(value) > max_length:
+        raise ImportRowError(f'{name}: длиннее {max_length} символов')
+    return value
+
+
+def _number(row, name, kind, default=None):
+    value = row.get(name)
+    if value is None or str(value).strip() == '':
+        if default is None:
+            raise ImportRowError(f'не заполнено поле {name}')
+        return default
+    try:
+        return kind(str(value).strip().replace(',', '.').replace(' ', ''))
+    except (ValueError, InvalidOperation):
+        raise ImportRowError(f'{name}: не число {value!r}')
+
+
+def _choice(row, name, labels, codes_by_label):
+    value = _text(row, name, 50)
+    if value in labels:
+        return value
+    code = codes_by_label.get(value.casefold())
+    if code is None:
+        raise ImportRowError(f'{name}: неизвестное значение {value!r}')
+    return code
+
+
+def _flag(row, name):
+    value = row.get(name)
+    if isinstance(value, bool):
+        return value
+    value = '' if value is None else str(value).strip().casefold()
+    if value in _TRUE:
+        return True
+    if value in _FALSE:
+        return False
+    raise ImportRowError(f'{name}: ожидается да/нет, получено {value!r}')
+
+
+def _image_paths(row):
+    value = row.get('images') or []
+    if isinstance(value, str):
+        value = value.replace(';', '|').split('|')
+    return [str(path).strip() for path in value if str(path).strip()]
+
+
+_TRANSMISSIONS_BY_LABEL = {label.casefold(): code for code, label in TRANSMISSION_LABELS.items()}
+_FUELS_BY_LABEL = {label.casefold(): code for code, label in FUEL_LABELS.items()}
+
+
+class InventoryImporter:
+    def __init__(self, chunk_size=1000, images_root=None, progress=None):
+        self.chunk_size = chunk_size
+        self.images_root = Path(images_root) if images_root else Path.cwd()
+        self.progress = progress
+        self.stats = ImportStats()
+        # Марки по названию без учёта регистра; недостающие создаются по ходу импорта
+        self._brand_ids = {brand.name.casefold(): brand.pk for brand in get_brands()}
+
+    def run(self, rows):
+        """rows - из read_rows(); возвращает ImportStats"""
+        chunk = {}
+        try:
+            for line, row in rows:
+                self.stats.read += 1
+                try:
+                    if not isinstance(row, dict):
+                        raise ImportRowError(f'не разобрана строка ленты ({row})')
+                    stock_id, values, images = self.parse_row(row)
+                except ImportRowError as exc:
+                    self.stats.error(line, exc)
+                    continue
+                # Повтор номера внутри пачки - побеждает последняя строка
+                chunk.pop(stock_id, None)
+                chunk[stock_id] = (line, values, images)
+                if len(chunk) >= self.chunk_size:
+                    self._flush(chunk)
+                    chunk = {}
+            if chunk:
+                self._flush(chunk)
+        finally:
+            # Счётчики растут только после фиксации пачки
+            if self.stats.created or self.stats.updated:
+                facet_index.invalidate_everywhere()
+                similarity_index.invalidate_everywhere()
+        return self.stats
+
+    def parse_row(self, row):
+        stock_id = _text(row, 'stock_id', 64)
+        brand = _text(row, 'brand', 100)
+        country = _text(row, 'brand_country', 50, required=False)
+        price = _number(row, 'price', Decimal)
+        if not price.is_finite() or not 0 <= price < 10 ** 8:
+            raise ImportRowError(f'price: вне допустимого диапазона ({price})')
+        values = {
+            'model': _text(row, 'model', 100),
+            'year': _number(row, 'year', int),
+            'price': price.quantize(Decimal('0.01')),
+            'mileage': _number(row, 'mileage', int, default=0),
+            'color': _text(row, 'color', 50),
+            'transmission': _choice(row, 'transmission', TRANSMISSION_LABELS, _TRANSMISSIONS_BY_LABEL),
+            'fuel_type': _choice(row, 'fuel_type', FUEL_LABELS, _FUELS_BY_LABEL),
+            'engine_volume': _number(row, 'engine_volume', float),
+            'horsepower': _number(row, 'horsepower', int),
+            'is_sold': _flag(row, 'is_sold'),
+        }
+        # Марка создаётся только для прошедшей проверку строки
+        values['brand_id'] = self._brand_id(brand, country)
+        return stock_id, values, _image_paths(row)
+
+    def _brand_id(self, name, country):
+        key = name.casefold()
+        brand_id = self._brand_ids.get(key)
+        if brand_id is None:
+            brand_id = self._brand_ids[key] = Brand.objects.create(name=name, country=country).pk
+        return brand_id
+
+    # --- ЗАПИСЬ ПАЧКИ ---
+
+    def _flush(self, chunk):
+        existing = {
+            row.pop('stock_id'): row
+            for row in Car.objects.filter(stock_id__in=list(chunk)).values('id', 'stock_id', *IMPORT_FIELDS)
+        }
+        to_write, created, changed = [], [], {}
+        for stock_id, (line, values, images) in chunk.items():
+            current = existing.get(stock_id)
+            if current is None:
+                created.append(stock_id)
+            else:
+                fields = {name for name in IMPORT_FIELDS if current[name] != values[name]}
+                if not fields:
+                    self.stats.unchanged += 1
+                    continue
+                changed[current['id']] = fields
+            to_write.append(Car(stock_id=stock_id, **values))
+
+        with transaction.atomic():
+            if to_write:
+                Car.objects.bulk_create(
+                    to_write, update_conflicts=True, unique_fields=['stock_id'],
+                    update_fields=[*IMPORT_FIELDS, 'updated_at'],
+                )
+            car_ids = dict(Car.objects.filter(stock_id__in=list(chunk)).values_list('stock_id', 'id'))
+            created_ids = [car_ids[stock_id] for stock_id in created]
+            imaged_ids = self._attach_images(chunk, car_ids)
+
+            touched = set(created_ids) | set(changed) | imaged_ids
+            if touched:
+                sync_cars(touched)
+                transaction.on_commit(bump_inventory_version)
+            written = set(created_ids) | set(changed)
+            if written:
+                get_search_backend().index_cars(Car.objects.filter(pk__in=written).select_related('brand'))
+            live.cars_created(created_ids)
+            for car_id, fields in changed.items():
+                live_fields = fields & set(live.LIVE_FIELDS)
+                if live_fields:
+                    live.cars_changed([car_id], live_fields)
+
+        self.stats.created += len(created)
+        self.stats.updated += len(changed)
+        # С DEBUG=True Django копит текст всех запросов - память росла бы с размером ленты
+        reset_queries()
+        if self.progress:
+            self.progress(self.stats)
+
+    def _attach_images(self, chunk, car_ids):
+        """
+        Добавляет фото из локальных файлов. Имя в хранилище строится по
+        stock_id и имени файла, поэтому уже загруженные фото пропускаются.
+        Возвращает id автомобилей, у которых появились фото.
+        """
+        wanted = {car_ids[stock_id]: (stock_id, line, images) for stock_id, (line, _, images) in chunk.items() if images}
+        if not wanted:
+            return set()
+        stored = {}
+        for car_id, name in CarImage.objects.filter(car_id__in=list(wanted)).values_list('car_id', 'image'):
+            stored.setdefault(car_id, set()).add(name)
+
+        new_images = []
+        for car_id, (stock_id, line, paths) in wanted.items():
+            names = stored.setdefault(car_id, set())
+            for path in paths:
+                source = Path(path)
+                if not source.is_absolute():
+                    source = self.images_root / source
+                name = f'{IMAGES_UPLOAD_TO}/{get_valid_filename(stock_id)}/{get_valid_filename(source.name)}'
+                if name in names:
+                    continue
+                try:
+                    name = self._store_image(source, name)
+                except OSError as exc:
+                    self.stats.error(line, f'фото {path}: {exc.strerror or exc}')
+                    continue
+                new_images.append(CarImage(car_id=car_id, image=name, is_main=not names))
+                names.add(name)
+
+        if not new_images:
+            return set()
+        CarImage.objects.bulk_create(new_images)
+        imaged_ids = {image.car_id for image in new_images}
+        # Как refresh_car_images: по updated_at строятся ключи кэша карточек и ETag
+        Car.objects.filter(pk__in=imaged_ids).update(updated_at=timezone.now())
+        self.stats.images += len(new_images)
+        return imaged_ids
+
+    @staticmethod
+    def _store_image(source, name):
+        # Файл мог остаться от прерванного импорта - используем его
+        if default_storage.exists(name):
+            return name
+        with source.open('rb') as file:
+            return default_storage.save(name, File(file))
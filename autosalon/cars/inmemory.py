@@ -0,0 +1,67 @@
+"""
+Базовый класс для индексов каталога, которые живут в памяти процесса.
+
+Индекс загружается лениво одним запросом и дальше обновляется
+инкрементально из сигналов. Чтобы изменение на одном воркере увидели
+остальные, в общем кэше хранится счётчик версии: при его расхождении
+с локальной версией индекс перечитывается целиком.
+"""
+import threading
+
+from .cache import bump_version, get_version
+
+
+class InMemoryIndex:
+    """Наследники задают version_key и реализуют _load()"""
+
+    version_key = None
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._version = None
+        self._loaded = False
+
+    def _load(self):
+        """Полностью перечитывает данные индекса из БД"""
+        raise NotImplementedError
+
+    def _shared_version(self):
+        return get_version(self.version_key)
+
+    def _bump_version(self):
+        """Увеличивает общую версию; возвращает новое значение"""
+        return bump_version(self.version_key)
+
+    def _ensure_loaded(self):
+        """Вызывается под self._lock перед чтением индекса"""
+        version = self._shared_version()
+        if not self._loaded or version != self._version:
+            self._load()
+            self._loaded = True
+            self._version = version
+
+    def invalidate(self):
+        """Сбрасывает локальный индекс; он перечитается при следующем обращении"""
+        with self._lock:
+            self._loaded = False
+
+    def invalidate_everywhere(self):
+        """
+        Массовое изменение в обход сигналов (импорт): индекс перечитывают
+        все процессы - построчные изменения дороже полной загрузки
+        """
+        with self._lock:
+            self._loaded = False
+            self._bump_version()
+
+    def _apply_change(self, change):
+        """Применяет инкрементальное изменение и поднимает общую версию"""
+        with self._lock:
+            if self._loaded:
+                change()
+            new_version = self._bump_version()
+            # Если между нашими изменениями версию поднял другой воркер,
+            # локальный индекс неполон - перечитаем его при следующем обращении
+            if self._version is None or new_version != self._version + 1:
+                self._loaded = False
+            self._version = new_version
@@ -0,0 +1,148 @@
+"""
+Проекция каталога (CarListing).
+
+Списки автомобилей (cars.views.home, /api/cars/) читают одну узкую таблицу
+через .values(): поля карточки, название марки и путь к основному фото
+уже лежат в строке - без JOIN с маркой, без отдельного запроса фотографий
+и без создания экземпляров моделей.
+
+Таблица обновляется сигналами Car/CarImage/Brand в той же транзакции,
+что и исходное изменение (см. cars/signals.py); rebuild_listings()
+перестраивает её целиком (команда rebuild_car_listings).
+"""
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .derivatives import variants_srcset
+from .models import Car, CarImage, CarListing
+
+# Поля, которые копируются из Car как есть
+CAR_FIELDS = (
+    'brand_id', 'model', 'year', 'price', 'mileage', 'color', 'transmission',
+    'fuel_type', 'engine_volume', 'horsepower', 'created_at', 'updated_at',
+)
+
+# Поля строки карточки, которые отдают listing_values()
+CARD_FIELDS = CAR_FIELDS + ('brand_name', 'main_image', 'main_image_variants')
+
+
+def listing_values(queryset=None, fields=CARD_FIELDS):
+    """
+    Строки карточек в виде dict; id автомобиля - под ключом 'id'.
+    fields - подмножество CARD_FIELDS, если нужны не все колонки.
+    """
+    if queryset is None:
+        queryset = CarListing.objects.all()
+    return queryset.values(*fields, id=F('car_id'))
+
+
+def add_image_urls(rows, base_url=''):
+    """Дополняет строки URL основного фото и srcset его WebP/AVIF-копий"""
+    def url(path):
+        return f'{base_url}{default_storage.url(path)}'
+
+    for row in rows:
+        image = row['main_image']
+        variants = row['main_image_variants'] if image else {}
+        if variants.get('source') != image:
+            # Копии построены для другого (заменённого) файла
+            variants = {}
+        row['image_url'] = url(image) if image else None
+        card = variants.get('card', {}).get('webp')
+        row['card_url'] = url(card) if card else row['image_url']
+        row['webp_srcset'] = variants_srcset(variants, 'webp', url)
+        row['avif_srcset'] = variants_srcset(variants, 'avif', url)
+    return rows
+
+
+# --- ПОДДЕРЖАНИЕ ПРОЕКЦИИ ---
+
+def _main_images(car_ids=None):
+    """car_id -> (путь, variants) основного фото: первое в порядке -is_main, uploaded_at"""
+    queryset = CarImage.objects.order_by('car_id', '-is_main', 'uploaded_at', 'id')
+    if car_ids is not None:
+        queryset = queryset.filter(car_id__in=car_ids)
+    result = {}
+    for car_id, image, variants in queryset.values_list('car_id', 'image', 'variants').iterator(chunk_size=2000):
+        result.setdefault(car_id, (image, variants))
+    return result
+
+
+def _image_fields(main_image):
+    image, variants = main_image or ('', {})
+    return {'main_image': image, 'main_image_variants': variants}
+
+
+def sync_car(car):
+    """Отражает сохранение автомобиля: вставка/обновление строки или удаление проданного"""
+    if car.is_sold:
+        CarListing.objects.filter(car_id=car.pk).delete()
+        return
+    fields = {name: getattr(car, name) for name in CAR_FIELDS}
+    fields['brand_name'] = car.brand.name
+    fields.update(_image_fields(_main_images([car.pk]).get(car.pk)))
+    CarListing.objects.update_or_create(car_id=car.pk, defaults=fields)
+
+
+def sync_cars(car_ids):
+    """
+    sync_car для пачки автомобилей - для массовых изменений в обход
+    сигналов (команда import_inventory): три запроса на пачку
+    """
+    car_ids = list(car_ids)
+    main_images = _main_images(car_ids)
+    cars = (
+        Car.objects.filter(pk__in=car_ids, is_sold=False).order_by()
+        .values('id', *CAR_FIELDS, brand_name=F('brand__name'))
+    )
+    rows = []
+    for values in cars:
+        car_id = values.pop('id')
+        rows.append(CarListing(car_id=car_id, **values, **_image_fields(main_images.get(car_id))))
+    listed = {row.car_id for row in rows}
+    CarListing.objects.filter(car_id__in=[car_id for car_id in car_ids if car_id not in listed]).delete()
+    CarListing.objects.bulk_create(
+        rows, update_conflicts=True, unique_fields=['car'],
+        update_fields=[*CAR_FIELDS, 'brand_name', 'main_image', 'main_image_variants'],
+    )
+
+
+def refresh_car_images(car_id):
+    """
+    Пересчитывает основное фото после изменения фотографий автомобиля.
+    updated_at автомобиля и строки поднимается - по нему строится ключ
+    кэша карточки в шаблонах.
+    """
+    now = timezone.now()
+    Car.objects.filter(pk=car_id).update(updated_at=now)
+    fields = _image_fields(_main_images([car_id]).get(car_id))
+    CarListing.objects.filter(car_id=car_id).update(updated_at=now, **fields)
+
+
+def refresh_brand(brand):
+    """Переименование марки: название хранится в строках проекции"""
+    now = timezone.now()
+    brand.cars.update(updated_at=now)
+    CarListing.objects.filter(brand=brand).update(brand_name=brand.name, updated_at=now)
+
+
+def rebuild_listings(batch_size=2000):
+    """Полностью перестраивает проекцию по таблицам cars_car и cars_carimage"""
+    with transaction.atomic():
+        CarListing.objects.all().delete()
+        main_images = _main_images()
+        cars = (
+            Car.objects.filter(is_sold=False).order_by()
+            .values('id', *CAR_FIELDS, brand_name=F('brand__name'))
+        )
+        batch = []
+        for values in cars.iterator(chunk_size=batch_size):
+            car_id = values.pop('id')
+            batch.append(CarListing(car_id=car_id, **values, **_image_fields(main_images.get(car_id))))
+            if len(batch) >= batch_size:
+                CarListing.objects.bulk_create(batch)
+                batch = []
+        if batch:
+            CarListing.objects.bulk_create(batch)
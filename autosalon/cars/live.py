@@ -0,0 +1,167 @@
+"""
+Живые изменения каталога для открытых страниц (вместо перезапроса /api/cars/).
+
+Сигналы Car отмечают, какие поля каких автомобилей изменились; после
+фиксации транзакции все отметки уходят одним сообщением в группу
+INVENTORY_GROUP слоя каналов. Значения полей читаются из БД в момент
+отправки (одним запросом), так что и отметки из откатившейся точки
+сохранения отправят лишь актуальные данные. Правка сотни машин в админке - одно
+сообщение, а InventoryConsumer (cars/consumers.py) дополнительно
+объединяет сообщения за INVENTORY_PUSH_INTERVAL секунд в один кадр
+для клиента.
+
+Изменение в сообщении: {"id", "op": "created" | "updated" | "deleted",
+"fields": {поле: значение}, "is_sold"}. Для созданных автомобилей полей
+нет - карточку целиком клиент берёт из /api/cars/<id>/.
+
+QuerySet.update(), bulk_create() и bulk_update() сигналов не шлют - такой
+код сообщает об изменениях сам через cars_changed() и cars_created().
+"""
+import logging
+import threading
+import weakref
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.db import transaction
+
+from .models import Car
+
+logger = logging.getLogger(__name__)
+
+INVENTORY_GROUP = 'inventory'
+
+LIVE_FIELDS = Car.LIVE_FIELDS
+
+CREATED = 'created'
+UPDATED = 'updated'
+DELETED = 'deleted'
+
+_local = threading.local()
+
+
+class _Batch:
+    """Отметки одной транзакции: {car_id: (op, поля)}"""
+
+    def __init__(self):
+        self.changes = {}
+        self.published = False
+
+    def publish(self):
+        self.published = True
+        if self.changes:
+            publish_changes(self.changes)
+
+
+def _current_batch(using=None):
+    """
+    Пакет текущей транзакции; new=True - пакет только что создан.
+
+    Сильная ссылка на пакет есть только у его on_commit-колбэка, у потока -
+    слабая. Колбэк выполняется после фиксации или выбрасывается Django при
+    откате транзакции (или точки сохранения, в которой пакет создан) - в
+    обоих случаях следующая отметка начинает новый пакет.
+    """
+    connection = transaction.get_connection(using)
+    refs = getattr(_local, 'batches', None)
+    if refs is None:
+        refs = _local.batches = {}
+    batch = refs.get(connection.alias, lambda: None)()
+    if batch is not None and not batch.published:
+        return batch, False
+    batch = _Batch()
+    refs[connection.alias] = weakref.ref(batch)
+    return batch, True
+
+
+def loaded_values(car):
+    """Значения LIVE_FIELDS на момент загрузки из БД (см. Car.from_db)"""
+    return getattr(car, '_live_values', None)
+
+
+def changed_fields(car):
+    loaded = loaded_values(car)
+    if loaded is None:
+        return set(LIVE_FIELDS)
+    return {name for name in LIVE_FIELDS if getattr(car, name) != loaded[name]}
+
+
+def car_saved(car, created):
+    if created:
+        _mark(car.pk, CREATED, ())
+    else:
+        fields = changed_fields(car)
+        if fields:
+            _mark(car.pk, UPDATED, fields)
+    car._live_values = {name: getattr(car, name) for name in LIVE_FIELDS}
+
+
+def car_deleted(car_id):
+    _mark(car_id, DELETED, ())
+
+
+def cars_created(car_ids):
+    """Для массовой вставки (bulk_create) - сигналы post_save не приходят"""
+    for car_id in car_ids:
+        _mark(car_id, CREATED, ())
+
+
+def cars_changed(car_ids, fields=LIVE_FIELDS):
+    """Для массовых изменений в обход сигналов (QuerySet.update, bulk_update)"""
+    for car_id in car_ids:
+        _mark(car_id, UPDATED, fields)
+
+
+def _mark(car_id, op, fields):
+    batch, new = _current_batch()
+    previous = batch.changes.get(car_id)
+    if previous is None or op == DELETED:
+        batch.changes[car_id] = (op, set(fields))
+    elif previous[0] != DELETED:
+        # created + updated = created: полей у созданного всё равно нет
+        batch.changes[car_id] = (previous[0], previous[1] | set(fields))
+    if new:
+        # Вне транзакции on_commit срабатывает сразу - после добавления отметки.
+        # Колбэк держит пакет (см. _current_batch)
+        transaction.on_commit(batch.publish)
+
+
+def build_changes(changes):
+    """Сообщения об изменениях по отметкам {car_id: (op, поля)} - один запрос к БД"""
+    rows = {row['id']: row for row in Car.objects.filter(pk__in=list(changes)).values('id', *LIVE_FIELDS)}
+    result = []
+    for car_id, (op, fields) in changes.items():
+        row = rows.get(car_id)
+        if row is None:
+            # Удалён (или создание откатилось) - с витрины убираем
+            result.append({'id': car_id, 'op': DELETED, 'fields': {}, 'is_sold': True})
+            continue
+        if op == DELETED:
+            # Удаление откатилось внутри сохранённой транзакции - шлём карточку целиком
+            op, fields = UPDATED, LIVE_FIELDS
+        result.append({
+            'id': car_id,
+            'op': op,
+            'fields': {name: _plain(row[name]) for name in sorted(fields)},
+            'is_sold': row['is_sold'],
+        })
+    return result
+
+
+def _plain(value):
+    # Decimal цены - строкой, как в API (и сериализуемо для Redis)
+    return value if isinstance(value, (int, float, str, bool)) or value is None else str(value)
+
+
+def publish_changes(changes):
+    channel_layer = get_channel_layer()
+    if channel_layer is None:
+        return
+    try:
+        async_to_sync(channel_layer.group_send)(INVENTORY_GROUP, {
+            'type': 'inventory_changes',
+            'changes': build_changes(changes),
+        })
+    except Exception:
+        # Живое обновление - не повод ронять сохранение
+        logger.exception('Не удалось разослать изменения каталога')
@@ -0,0 +1,124 @@
+import random
+import statistics
+import time
+
+from django.core.cache import cache
+from django.core.cache.utils import make_template_fragment_key
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import Client
+from django.test.utils import override_settings
+
+from cars.derivatives import VARIANT_WIDTHS
+from cars.facets import facet_index
+from cars.listing import rebuild_listings
+from cars.models import Brand, Car, CarImage
+from cars.similarity import similarity_index
+
+from .bench_search import BRANDS, MODELS
+
+
+class Command(BaseCommand):
+    help = (
+        'Замеряет время отдачи страницы каталога с кэшем карточек и без него. '
+        'Работает на временной тестовой базе, рабочие данные не затрагиваются.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--cars', type=int, default=2000, help='Сколько автомобилей сгенерировать')
+        parser.add_argument('--page-size', type=int, default=48, help='Карточек на странице')
+        parser.add_argument('--repeat', type=int, default=30, help='Повторов каждого замера')
+
+    def handle(self, *args, **options):
+        old_name = connection.settings_dict['NAME']
+        connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            self._populate(options['cars'])
+            self._run(options['page_size'], options['repeat'])
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+
+    def _populate(self, count):
+        self.stdout.write(f'Генерация {count} автомобилей с фотографиями...')
+        brands = Brand.objects.bulk_create(Brand(name=name, country=country) for name, country in BRANDS)
+        rng = random.Random(42)
+        cars = Car.objects.bulk_create(
+            (
+                Car(
+                    brand=rng.choice(brands),
+                    model=rng.choice(MODELS),
+                    year=rng.randint(2005, 2025),
+                    price=rng.randint(300_000, 15_000_000),
+                    mileage=rng.randint(0, 300_000),
+                    color='Черный',
+                    transmission=rng.choice(Car.TRANSMISSION_CHOICES)[0],
+                    fuel_type=rng.choice(Car.FUEL_CHOICES)[0],
+                    engine_volume=2.0,
+                    horsepower=150,
+                )
+                for _ in range(count)
+            ),
+            batch_size=2000,
+        )
+        images = []
+        for car in cars:
+            name = f'car_images/bench_{car.pk}.jpg'
+            variants = {'source': name}
+            for variant, width in VARIANT_WIDTHS.items():
+                variants[variant] = {
+                    'width': width,
+                    'height': width * 2 // 3,
+                    'webp': f'car_images/derived/bench_{car.pk}_{variant}.webp',
+                    'avif': f'car_images/derived/bench_{car.pk}_{variant}.avif',
+                }
+            images.append(CarImage(car=car, image=name, is_main=True, variants=variants))
+        CarImage.objects.bulk_create(images, batch_size=2000)
+        # bulk_create не вызывает сигналы - проекцию строим целиком
+        rebuild_listings()
+        facet_index.invalidate()
+        similarity_index.invalidate()
+
+    def _timeit(self, func, repeat):
+        timings = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            func()
+            timings.append((time.perf_counter() - started) * 1000)
+        return statistics.median(timings)
+
+    def _run(self, page_size, repeat):
+        client = Client()
+        params = {'page_size': page_size}
+
+        def get_page():
+            response = client.get('/cars/', params)
+            assert response.status_code == 200, response.status_code
+
+        # Ключи карточек первой страницы (см. {% cache %} в cars/home.html)
+        page = Car.objects.filter(is_sold=False).order_by('-created_at', '-pk')[:page_size]
+        card_keys = [
+            make_template_fragment_key('car_card', [car.pk, car.updated_at.timestamp(), False])
+            for car in page
+        ]
+
+        # Прогрев: шаблоны, индексы фасетов
+        get_page()
+
+        # С нулевым таймаутом карточки не сохраняются, но уже лежащие в кэше
+        # читались бы - поэтому сначала удаляем их
+        cache.delete_many(card_keys)
+        with override_settings(CAR_CARD_CACHE_TIMEOUT=0):
+            without_cache = self._timeit(get_page, repeat)
+
+        def cold():
+            cache.delete_many(card_keys)
+            get_page()
+
+        cold_cache = self._timeit(cold, repeat)
+        get_page()
+        warm_cache = self._timeit(get_page, repeat)
+
+        self.stdout.write(f'Карточек на странице: {page_size}, медиана из {repeat} запусков, мс')
+        self.stdout.write(f'{"без кэша карточек":<28}{without_cache:>10.2f}')
+        self.stdout.write(f'{"кэш пуст (заполнение)":<28}{cold_cache:>10.2f}')
+        self.stdout.write(f'{"кэш заполнен":<28}{warm_cache:>10.2f}')
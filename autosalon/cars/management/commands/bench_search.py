@@ -0,0 +1,101 @@
+import random
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection, models
+
+from cars.models import Brand, Car
+from cars.pagination import paginate_ranked
+from cars.search import get_search_backend
+
+BRANDS = [
+    ('Toyota', 'Япония'), ('BMW', 'Германия'), ('Mercedes-Benz', 'Германия'),
+    ('Audi', 'Германия'), ('Kia', 'Корея'), ('Hyundai', 'Корея'), ('Lada', 'Россия'),
+    ('Volkswagen', 'Германия'), ('Skoda', 'Чехия'), ('Nissan', 'Япония'),
+]
+MODELS = [
+    'Camry', 'Corolla', 'RAV4', 'X5', 'X3', 'E-Class', 'C-Class', 'A6', 'Q7', 'Rio',
+    'Sportage', 'Solaris', 'Creta', 'Vesta', 'Granta', 'Polo', 'Tiguan', 'Octavia',
+    'Kodiaq', 'Qashqai', 'X-Trail', 'Land Cruiser', 'Outlander', 'Cerato',
+]
+QUERIES = ['camry', 'toyota', 'bmw x5', 'герман', 'land cruiser', 'octavia', 'kia rio', 'so']
+
+
+class Command(BaseCommand):
+    help = (
+        'Сравнивает полнотекстовый поиск с прежним icontains-запросом. '
+        'Работает на временной тестовой базе, рабочие данные не затрагиваются.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--cars', type=int, default=100_000, help='Сколько автомобилей сгенерировать')
+        parser.add_argument('--repeat', type=int, default=20, help='Повторов каждого запроса')
+
+    def handle(self, *args, **options):
+        old_name = connection.settings_dict['NAME']
+        connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            self._populate(options['cars'])
+            self._run(options['repeat'])
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+
+    def _populate(self, count):
+        self.stdout.write(f'Генерация {count} автомобилей...')
+        brands = Brand.objects.bulk_create(
+            Brand(name=name, country=country, description=f'{name} - автомобили из страны {country}')
+            for name, country in BRANDS
+        )
+        rng = random.Random(42)
+        batch = []
+        for _ in range(count):
+            batch.append(Car(
+                brand=rng.choice(brands),
+                model=rng.choice(MODELS),
+                year=rng.randint(2005, 2025),
+                price=rng.randint(300_000, 15_000_000),
+                color='Черный',
+                transmission=rng.choice(Car.TRANSMISSION_CHOICES)[0],
+                fuel_type=rng.choice(Car.FUEL_CHOICES)[0],
+                engine_volume=2.0,
+                horsepower=150,
+            ))
+            if len(batch) == 5000:
+                Car.objects.bulk_create(batch)
+                batch = []
+        if batch:
+            Car.objects.bulk_create(batch)
+
+        started = time.perf_counter()
+        get_search_backend().rebuild()
+        self.stdout.write(f'Индекс построен за {time.perf_counter() - started:.2f} с')
+
+    def _timeit(self, func, repeat):
+        timings = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            func()
+            timings.append((time.perf_counter() - started) * 1000)
+        return statistics.median(timings)
+
+    def _run(self, repeat):
+        backend = get_search_backend()
+        base = Car.objects.filter(is_sold=False).select_related('brand')
+
+        def like_page(query):
+            queryset = base.filter(
+                models.Q(model__icontains=query) | models.Q(brand__name__icontains=query)
+            ).order_by('-created_at')
+            return list(queryset[:6])
+
+        def search_page(query):
+            # Как в каталоге: ранжированные id и первая страница по ним
+            return list(paginate_ranked(backend.filter_matches(base, query), backend.search(query), page_size=6))
+
+        self.stdout.write(f'Бэкенд: {type(backend).__name__}, медиана из {repeat} запусков, мс')
+        self.stdout.write(f'{"запрос":<16}{"LIKE":>10}{"поиск":>10}')
+        for query in QUERIES:
+            like_ms = self._timeit(lambda: like_page(query), repeat)
+            search_ms = self._timeit(lambda: search_page(query), repeat)
+            self.stdout.write(f'{query:<16}{like_ms:>10.2f}{search_ms:>10.2f}')
@@ -0,0 +1,63 @@
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from cars.cache import bump_inventory_version
+from cars.derivatives import generate_derivatives
+from cars.listing import sync_cars
+from cars.models import Car, CarImage
+
+BATCH_SIZE = 500
+
+
+class Command(BaseCommand):
+    help = 'Строит WebP/AVIF-копии фотографий автомобилей, для которых их ещё нет'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true', help='Перестроить копии для всех фото')
+        parser.add_argument(
+            '--workers', type=int, default=getattr(settings, 'CAR_IMAGE_WORKERS', 2),
+            help='Количество процессов'
+        )
+
+    def handle(self, *args, **options):
+        images = [
+            image for image in CarImage.objects.only('id', 'car_id', 'image', 'variants').order_by('id')
+            if image.image and (options['all'] or not image.has_variants())
+        ]
+        if not images:
+            self.stdout.write('Все фото уже обработаны')
+            return
+
+        done, failed = [], 0
+        with ProcessPoolExecutor(
+            max_workers=options['workers'], mp_context=multiprocessing.get_context('spawn')
+        ) as executor:
+            futures = {
+                executor.submit(generate_derivatives, settings.MEDIA_ROOT, image.image.name): image
+                for image in images
+            }
+            for future in as_completed(futures):
+                image = futures[future]
+                try:
+                    image.variants = {'source': image.image.name, **future.result()}
+                except Exception as exc:
+                    failed += 1
+                    self.stderr.write(f'Фото {image.pk} ({image.image.name}): {exc}')
+                    continue
+                done.append(image)
+
+        CarImage.objects.bulk_update(done, ['variants'], batch_size=BATCH_SIZE)
+        # bulk_update не шлёт сигналов - как refresh_car_images, но пачками:
+        # updated_at (ключи кэша карточек, ETag), строки проекции, версия инвентаря
+        car_ids = sorted({image.car_id for image in done})
+        for start in range(0, len(car_ids), BATCH_SIZE):
+            batch = car_ids[start:start + BATCH_SIZE]
+            Car.objects.filter(pk__in=batch).update(updated_at=timezone.now())
+            sync_cars(batch)
+        if car_ids:
+            bump_inventory_version()
+        self.stdout.write(self.style.SUCCESS(f'Обработано фото: {len(done)}, ошибок: {failed}'))
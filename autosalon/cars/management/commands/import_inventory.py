@@ -0,0 +1,66 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from cars.importer import InventoryImporter, feed_format, open_feed, process_local_backends, read_rows
+
+
+class Command(BaseCommand):
+    help = (
+        'Импортирует складские остатки из CSV/NDJSON (в т.ч. .gz, "-" - стандартный ввод). '
+        'Колонки: stock_id, brand, brand_country, model, year, price, mileage, color, '
+        'transmission, fuel_type, engine_volume, horsepower, is_sold, images '
+        '(пути к фото через "|"). Автомобили сопоставляются по stock_id. '
+        'Работающий сайт увидит импорт только с общими CACHES и CHANNEL_LAYERS '
+        '(не locmem и не LocalChannelLayer).'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Файл ленты или "-"')
+        parser.add_argument('--format', choices=('csv', 'ndjson'), help='По умолчанию - по расширению файла')
+        parser.add_argument('--chunk-size', type=int, default=1000, help='Строк в одной транзакции')
+        parser.add_argument('--images-root', help='Каталог, от которого считаются относительные пути фото')
+
+    def handle(self, *args, **options):
+        self.verbosity = options['verbosity']
+        path = options['path']
+        fmt = options['format'] or feed_format(path)
+        if fmt is None:
+            raise CommandError('Не удалось определить формат ленты - укажите --format')
+        if options['chunk_size'] < 1:
+            raise CommandError('--chunk-size должен быть положительным')
+
+        local = process_local_backends()
+        if local:
+            self.stderr.write(self.style.WARNING(
+                f'{", ".join(local)}: бэкенд в памяти процесса - версии каталога, индексы и '
+                'живые изменения не дойдут до работающих веб-процессов, пока они не перезапустятся'
+            ))
+
+        importer = InventoryImporter(
+            chunk_size=options['chunk_size'], images_root=options['images_root'], progress=self._progress,
+        )
+        try:
+            with open_feed(path) as stream:
+                stats = importer.run(read_rows(stream, fmt))
+        except OSError as exc:
+            raise CommandError(f'Не удалось прочитать ленту: {exc}')
+
+        for message in stats.messages:
+            self.stderr.write(message)
+        if stats.errors > len(stats.messages):
+            self.stderr.write(f'... и ещё {stats.errors - len(stats.messages)} ошибок')
+        self.stdout.write(self.style.SUCCESS(
+            f'Импорт завершён: {self._summary(stats)}, фото: {stats.images}'
+        ))
+        if stats.images:
+            self.stdout.write('WebP/AVIF-копии новых фото: manage.py generate_image_variants')
+
+    @staticmethod
+    def _summary(stats):
+        return (
+            f'прочитано {stats.read}, новых {stats.created}, обновлено {stats.updated}, '
+            f'без изменений {stats.unchanged}, ошибок {stats.errors} ({stats.rate:.0f} строк/с)'
+        )
+
+    def _progress(self, stats):
+        if self.verbosity >= 1:
+            self.stdout.write(self._summary(stats))
@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+
+from cars.listing import rebuild_listings
+from cars.models import CarListing
+
+
+class Command(BaseCommand):
+    help = 'Перестраивает проекцию каталога (CarListing) по таблицам автомобилей и фотографий'
+
+    def handle(self, *args, **options):
+        rebuild_listings()
+        self.stdout.write(self.style.SUCCESS(f'Проекция каталога перестроена: {CarListing.objects.count()} карточек'))
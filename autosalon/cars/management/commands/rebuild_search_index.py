@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+
+from cars.search import get_search_backend
+
+
+class Command(BaseCommand):
+    help = 'Перестраивает полнотекстовый индекс каталога по таблице cars_car'
+
+    def handle(self, *args, **options):
+        backend = get_search_backend()
+        backend.rebuild()
+        self.stdout.write(self.style.SUCCESS(f'Поисковый индекс перестроен ({type(backend).__name__})'))
@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+
+from cars.models import UserStats
+from cars.stats import rebuild_stats
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает счётчики профиля (UserStats) по таблицам избранного и заявок'
+
+    def handle(self, *args, **options):
+        rebuild_stats()
+        self.stdout.write(self.style.SUCCESS(f'Счётчики пересчитаны: {UserStats.objects.count()} строк'))
@@ -0,0 +1,64 @@
+from django.db import migrations
+
+# DDL и заполнение индекса - на момент этой миграции, независимо от cars/search.py
+
+SQLITE_CREATE = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS cars_car_fts USING fts5("
+    "model, brand_name, brand_country, brand_description, "
+    "tokenize = 'unicode61 remove_diacritics 2')",
+    "INSERT INTO cars_car_fts (rowid, model, brand_name, brand_country, brand_description) "
+    "SELECT car.id, car.model, brand.name, brand.country, brand.description "
+    "FROM cars_car car JOIN cars_brand brand ON brand.id = car.brand_id "
+    "WHERE NOT car.is_sold",
+]
+
+SQLITE_DROP = ["DROP TABLE IF EXISTS cars_car_fts"]
+
+POSTGRES_CREATE = [
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    "CREATE TABLE IF NOT EXISTS cars_car_search ("
+    "car_id bigint PRIMARY KEY REFERENCES cars_car (id) ON DELETE CASCADE DEFERRABLE INITIALLY DEFERRED, "
+    "document tsvector NOT NULL, "
+    "content text NOT NULL)",
+    "CREATE INDEX IF NOT EXISTS cars_car_search_document_gin ON cars_car_search USING gin (document)",
+    "CREATE INDEX IF NOT EXISTS cars_car_search_content_trgm ON cars_car_search USING gin (content gin_trgm_ops)",
+    "INSERT INTO cars_car_search (car_id, document, content) "
+    "SELECT car.id, "
+    "setweight(to_tsvector('simple', car.model), 'A') || "
+    "setweight(to_tsvector('simple', brand.name), 'A') || "
+    "setweight(to_tsvector('simple', brand.country), 'B') || "
+    "setweight(to_tsvector('russian', brand.description), 'C'), "
+    "lower(car.model || ' ' || brand.name || ' ' || brand.country) "
+    "FROM cars_car car JOIN cars_brand brand ON brand.id = car.brand_id "
+    "WHERE NOT car.is_sold",
+]
+
+POSTGRES_DROP = ["DROP TABLE IF EXISTS cars_car_search"]
+
+STATEMENTS = {
+    'sqlite': (SQLITE_CREATE, SQLITE_DROP),
+    'postgresql': (POSTGRES_CREATE, POSTGRES_DROP),
+}
+
+
+def create_search_index(apps, schema_editor):
+    create, _ = STATEMENTS.get(schema_editor.connection.vendor, ((), ()))
+    for statement in create:
+        schema_editor.execute(statement)
+
+
+def drop_search_index(apps, schema_editor):
+    _, drop = STATEMENTS.get(schema_editor.connection.vendor, ((), ()))
+    for statement in drop:
+        schema_editor.execute(statement)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cars', '0003_favorite'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 6.0 on 2026-10-18 12:09
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cars', '0004_car_search_index'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='car',
+            index=models.Index(fields=['is_sold', 'created_at', 'id'], name='cars_car_is_sold_dbaae1_idx'),
+        ),
+    ]
@@ -0,0 +1,76 @@
+# Generated by Django 6.0 on 2026-10-18 12:22
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+# Поля проекции, которые копируются из Car как есть, - на момент этой миграции
+CAR_FIELDS = (
+    'brand_id', 'model', 'year', 'price', 'mileage', 'color', 'transmission',
+    'fuel_type', 'engine_volume', 'horsepower', 'created_at', 'updated_at',
+)
+
+
+def populate_listings(apps, schema_editor):
+    Car = apps.get_model('cars', 'Car')
+    CarImage = apps.get_model('cars', 'CarImage')
+    CarListing = apps.get_model('cars', 'CarListing')
+    db_alias = schema_editor.connection.alias
+
+    # Основное фото - первое в порядке -is_main, uploaded_at
+    main_images = {}
+    images = CarImage.objects.using(db_alias).order_by('car_id', '-is_main', 'uploaded_at', 'id')
+    for car_id, image, variants in images.values_list('car_id', 'image', 'variants').iterator(chunk_size=2000):
+        main_images.setdefault(car_id, (image, variants))
+
+    cars = (
+        Car.objects.using(db_alias).filter(is_sold=False).order_by()
+        .values('id', *CAR_FIELDS, brand_name=models.F('brand__name'))
+    )
+    batch = []
+    for values in cars.iterator(chunk_size=2000):
+        car_id = values.pop('id')
+        image, variants = main_images.get(car_id, ('', {}))
+        batch.append(CarListing(car_id=car_id, **values, main_image=image, main_image_variants=variants))
+        if len(batch) >= 2000:
+            CarListing.objects.using(db_alias).bulk_create(batch)
+            batch = []
+    if batch:
+        CarListing.objects.using(db_alias).bulk_create(batch)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cars', '0006_carimage_variants'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CarListing',
+            fields=[
+                ('car', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='listing', serialize=False, to='cars.car', verbose_name='Автомобиль')),
+                ('brand_name', models.CharField(max_length=100, verbose_name='Название марки')),
+                ('model', models.CharField(max_length=100, verbose_name='Модель')),
+                ('year', models.IntegerField(verbose_name='Год выпуска')),
+                ('price', models.DecimalField(decimal_places=2, max_digits=10, verbose_name='Цена')),
+                ('mileage', models.IntegerField(verbose_name='Пробег (км)')),
+                ('color', models.CharField(max_length=50, verbose_name='Цвет')),
+                ('transmission', models.CharField(choices=[('manual', 'Механическая'), ('automatic', 'Автоматическая'), ('robot', 'Роботизированная'), ('variator', 'Вариатор')], max_length=20, verbose_name='Коробка передач')),
+                ('fuel_type', models.CharField(choices=[('petrol', 'Бензин'), ('diesel', 'Дизель'), ('electric', 'Электрический'), ('hybrid', 'Гибрид')], max_length=20, verbose_name='Тип топлива')),
+                ('engine_volume', models.FloatField(verbose_name='Объем двигателя (л)')),
+                ('horsepower', models.IntegerField(verbose_name='Лошадиные силы')),
+                ('created_at', models.DateTimeField(verbose_name='Дата добавления')),
+                ('updated_at', models.DateTimeField(verbose_name='Дата обновления')),
+                ('main_image', models.CharField(blank=True, max_length=100, verbose_name='Основное фото')),
+                ('main_image_variants', models.JSONField(blank=True, default=dict, verbose_name='Производные основного фото')),
+                ('brand', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='cars.brand', verbose_name='Марка')),
+            ],
+            options={
+                'verbose_name': 'Карточка каталога',
+                'verbose_name_plural': 'Карточки каталога',
+                'indexes': [models.Index(fields=['created_at', 'car'], name='cars_carlis_created_cf39d2_idx')],
+            },
+        ),
+        migrations.RunPython(populate_listings, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,70 @@
+# Generated by Django 6.0 on 2026-10-18 12:32
+
+import django.db.models.deletion
+import django.db.models.functions.comparison
+from django.conf import settings
+from django.db import migrations, models
+
+
+STATUSES = ('new', 'in_progress', 'approved', 'rejected', 'completed')
+
+
+def populate_stats(apps, schema_editor):
+    User = apps.get_model(*settings.AUTH_USER_MODEL.split('.'))
+    Favorite = apps.get_model('cars', 'Favorite')
+    PurchaseRequest = apps.get_model('cars', 'PurchaseRequest')
+    UserStats = apps.get_model('cars', 'UserStats')
+    db_alias = schema_editor.connection.alias
+
+    # Строка на каждого пользователя и общая (user=NULL)
+    rows = {None: {'favorites_count': 0, 'requests_total': 0, **{f'requests_{status}': 0 for status in STATUSES}}}
+    for user_id in User.objects.using(db_alias).values_list('pk', flat=True).iterator(chunk_size=2000):
+        rows[user_id] = dict(rows[None])
+
+    favorites = Favorite.objects.using(db_alias).order_by().values_list('user_id').annotate(count=models.Count('pk'))
+    for user_id, count in favorites:
+        for key in (user_id, None):
+            rows[key]['favorites_count'] += count
+    requests = (
+        PurchaseRequest.objects.using(db_alias).order_by()
+        .values_list('user_id', 'status').annotate(count=models.Count('pk'))
+    )
+    for user_id, status, count in requests:
+        for key in (user_id, None):
+            rows[key][f'requests_{status}'] += count
+            rows[key]['requests_total'] += count
+
+    UserStats.objects.using(db_alias).bulk_create(
+        [UserStats(user_id=user_id, **values) for user_id, values in rows.items()], batch_size=2000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cars', '0008_purchaserequest_created_index'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('favorites_count', models.IntegerField(default=0, verbose_name='В избранном')),
+                ('requests_total', models.IntegerField(default=0, verbose_name='Всего заявок')),
+                ('requests_new', models.IntegerField(default=0, verbose_name='Новых')),
+                ('requests_in_progress', models.IntegerField(default=0, verbose_name='В обработке')),
+                ('requests_approved', models.IntegerField(default=0, verbose_name='Одобренных')),
+                ('requests_rejected', models.IntegerField(default=0, verbose_name='Отклонённых')),
+                ('requests_completed', models.IntegerField(default=0, verbose_name='Завершённых')),
+                ('user', models.OneToOneField(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='stats', to=settings.AUTH_USER_MODEL, verbose_name='Пользователь')),
+            ],
+            options={
+                'verbose_name': 'Статистика пользователя',
+                'verbose_name_plural': 'Статистика пользователей',
+                'constraints': [models.UniqueConstraint(django.db.models.functions.comparison.Coalesce('user', models.Value(0)), name='cars_userstats_single_global')],
+            },
+        ),
+        migrations.RunPython(populate_stats, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 6.0 on 2026-10-18 17:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cars', '0009_userstats'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='car',
+            name='stock_id',
+            field=models.CharField(blank=True, max_length=64, null=True, unique=True, verbose_name='Складской номер'),
+        ),
+    ]
@@ -1,4 +1,7 @@
 from django.db import models
+from django.db.models.functions import Coalesce
+
+from .derivatives import variants_srcset
 
 class Brand(models.Model):
     """Модель для марок автомобилей"""
@@ -33,6 +36,12 @@ class Car(models.Model):
         ('hybrid', 'Гибрид'),
     ]
 
+    # Поля карточки каталога, изменения которых рассылаются открытым страницам (cars/live.py)
+    LIVE_FIELDS = (
+        'price', 'mileage', 'is_sold', 'model', 'year', 'color',
+        'transmission', 'fuel_type', 'engine_volume', 'horsepower',
+    )
+
     brand = models.ForeignKey(
         Brand,
         on_delete=models.CASCADE,
@@ -61,6 +70,8 @@ class Car(models.Model):
     engine_volume = models.FloatField(verbose_name="Объем двигателя (л)")
     horsepower = models.IntegerField(verbose_name="Лошадиные силы")
     is_sold = models.BooleanField(default=False, verbose_name="Продан")
+    # Номер автомобиля во внешней складской системе - ключ импорта (команда import_inventory)
+    stock_id = models.CharField(max_length=64, unique=True, null=True, blank=True, verbose_name="Складской номер")
     created_at = models.DateTimeField(auto_now_add=True, verbose_name="Дата добавления")
     updated_at = models.DateTimeField(auto_now=True, verbose_name="Дата обновления")
 
@@ -68,6 +79,18 @@ class Car(models.Model):
         verbose_name = "Автомобиль"
         verbose_name_plural = "Автомобили"
         ordering = ['-created_at']
+        indexes = [
+            # Keyset-пагинация каталога: WHERE is_sold = false ORDER BY created_at, id
+            models.Index(fields=['is_sold', 'created_at', 'id']),
+        ]
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Значения на момент загрузки - по ним сигнал находит изменённые поля (cars/live.py)
+        if all(name in instance.__dict__ for name in cls.LIVE_FIELDS):
+            instance._live_values = {name: instance.__dict__[name] for name in cls.LIVE_FIELDS}
+        return instance
 
     def __str__(self):
         return f"{self.brand.name} {self.model} ({self.year})"
@@ -98,6 +121,14 @@ class CarImage(models.Model):
         auto_now_add=True,
         verbose_name="Дата загрузки"
     )
+    # Уменьшенные копии в WebP/AVIF (см. cars/derivatives.py):
+    # {'source': исходный файл, 'card': {'width': 640, 'height': ..., 'webp': путь, 'avif': путь}, ...}
+    variants = models.JSONField(
+        default=dict,
+        blank=True,
+        editable=False,
+        verbose_name="Производные изображения"
+    )
 
     class Meta:
         verbose_name = "Фотография автомобиля"
@@ -107,6 +138,81 @@ class CarImage(models.Model):
     def __str__(self):
         return f"Фото {self.car.brand.name} {self.car.model}"
 
+    def has_variants(self):
+        """Производные построены для текущего файла (а не для заменённого)"""
+        return bool(self.image) and self.variants.get('source') == self.image.name
+
+    def variant_url(self, variant, fmt='webp'):
+        """URL варианта; если он ещё не готов - URL оригинала"""
+        if self.has_variants():
+            path = self.variants.get(variant, {}).get(fmt)
+            if path:
+                return self.image.storage.url(path)
+        return self.image.url
+
+    def srcset(self, fmt='webp', base_url=''):
+        """Значение атрибута srcset: 'url 320w, url 640w, ...'"""
+        if not self.has_variants():
+            return ''
+        return variants_srcset(self.variants, fmt, lambda path: f"{base_url}{self.image.storage.url(path)}")
+
+    @property
+    def webp_srcset(self):
+        return self.srcset('webp')
+
+    @property
+    def avif_srcset(self):
+        return self.srcset('avif')
+
+    @property
+    def thumb_url(self):
+        return self.variant_url('thumb')
+
+    @property
+    def card_url(self):
+        return self.variant_url('card')
+
+
+class CarListing(models.Model):
+    """
+    Проекция каталога: ровно поля карточки автомобиля и основное фото.
+    Только непроданные автомобили; поддерживается сигналами (cars/listing.py),
+    перестраивается командой rebuild_car_listings.
+    """
+    car = models.OneToOneField(
+        Car,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='listing',
+        verbose_name="Автомобиль"
+    )
+    brand = models.ForeignKey(Brand, on_delete=models.CASCADE, related_name='+', verbose_name="Марка")
+    brand_name = models.CharField(max_length=100, verbose_name="Название марки")
+    model = models.CharField(max_length=100, verbose_name="Модель")
+    year = models.IntegerField(verbose_name="Год выпуска")
+    price = models.DecimalField(max_digits=10, decimal_places=2, verbose_name="Цена")
+    mileage = models.IntegerField(verbose_name="Пробег (км)")
+    color = models.CharField(max_length=50, verbose_name="Цвет")
+    transmission = models.CharField(max_length=20, choices=Car.TRANSMISSION_CHOICES, verbose_name="Коробка передач")
+    fuel_type = models.CharField(max_length=20, choices=Car.FUEL_CHOICES, verbose_name="Тип топлива")
+    engine_volume = models.FloatField(verbose_name="Объем двигателя (л)")
+    horsepower = models.IntegerField(verbose_name="Лошадиные силы")
+    created_at = models.DateTimeField(verbose_name="Дата добавления")
+    updated_at = models.DateTimeField(verbose_name="Дата обновления")
+    main_image = models.CharField(max_length=100, blank=True, verbose_name="Основное фото")
+    main_image_variants = models.JSONField(default=dict, blank=True, verbose_name="Производные основного фото")
+
+    class Meta:
+        verbose_name = "Карточка каталога"
+        verbose_name_plural = "Карточки каталога"
+        indexes = [
+            # Keyset-пагинация каталога: ORDER BY created_at, car_id
+            models.Index(fields=['created_at', 'car']),
+        ]
+
+    def __str__(self):
+        return f"{self.brand_name} {self.model} ({self.year})"
+
 
 class Favorite(models.Model):
     """Модель избранных автомобилей пользователя"""
@@ -191,6 +297,8 @@ class PurchaseRequest(models.Model):
         indexes = [
             models.Index(fields=['status', 'created_at']),
             models.Index(fields=['user', 'created_at']),
+            # Список заявок менеджера без фильтра по статусу: ORDER BY created_at, id
+            models.Index(fields=['created_at', 'id']),
         ]
 
     def __str__(self):
@@ -202,4 +310,53 @@ class PurchaseRequest(models.Model):
 
     def can_be_processed_by_user(self, user):
         """Может ли пользователь обрабатывать заявку (менеджер/админ)"""
-        return user.is_manager() and self.status != 'completed'
\ No newline at end of file
+        return user.is_manager() and self.status != 'completed'
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Статус на момент загрузки - по нему сигнал пересчитывает счётчики (cars/stats.py)
+        instance._loaded_status = instance.__dict__.get('status')
+        return instance
+
+
+class UserStats(models.Model):
+    """
+    Счётчики для страницы профиля: избранное и заявки по статусам.
+    Строка с user=NULL - общие счётчики по всем заявкам (для менеджеров).
+    Поддерживаются сигналами Favorite/PurchaseRequest, см. cars/stats.py.
+    """
+    user = models.OneToOneField(
+        'accounts.CustomUser',
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+        related_name='stats',
+        verbose_name='Пользователь'
+    )
+    favorites_count = models.IntegerField(default=0, verbose_name='В избранном')
+    requests_total = models.IntegerField(default=0, verbose_name='Всего заявок')
+    requests_new = models.IntegerField(default=0, verbose_name='Новых')
+    requests_in_progress = models.IntegerField(default=0, verbose_name='В обработке')
+    requests_approved = models.IntegerField(default=0, verbose_name='Одобренных')
+    requests_rejected = models.IntegerField(default=0, verbose_name='Отклонённых')
+    requests_completed = models.IntegerField(default=0, verbose_name='Завершённых')
+
+    class Meta:
+        verbose_name = 'Статистика пользователя'
+        verbose_name_plural = 'Статистика пользователей'
+        constraints = [
+            # Общая строка (user=NULL) - ровно одна
+            models.UniqueConstraint(
+                Coalesce('user', models.Value(0)),
+                name='cars_userstats_single_global',
+            ),
+        ]
+
+    def __str__(self):
+        return f"Статистика {self.user}" if self.user_id else "Общая статистика"
+
+    @property
+    def active_requests(self):
+        """Заявки, которые ещё ждут решения"""
+        return self.requests_new + self.requests_in_progress
\ No newline at end of file
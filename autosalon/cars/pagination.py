@@ -0,0 +1,176 @@
+"""
+Keyset-пагинация каталога.
+
+Вместо OFFSET страница выбирается условием по последнему показанному
+автомобилю: (created_at, id) < (created_at последнего, id последнего).
+Запрос для сотой страницы стоит столько же, сколько для первой, а курсоры
+не «съезжают», когда в начало каталога добавляются новые машины.
+
+Курсор - непрозрачная строка base64 с направлением и ключом записи.
+Для результатов полнотекстового поиска (уже упорядоченных по
+релевантности) ключом служит id последнего автомобиля в ранжированном списке.
+"""
+import base64
+import json
+from dataclasses import dataclass, field
+
+from django.db import models
+from django.utils.dateparse import parse_datetime
+
+DEFAULT_PAGE_SIZE = 6
+MAX_PAGE_SIZE = 100
+
+FORWARD = 'n'
+BACKWARD = 'p'
+
+
+class InvalidCursor(ValueError):
+    """Курсор повреждён или сформирован не этим модулем"""
+
+
+def encode_cursor(payload):
+    raw = json.dumps(payload, separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except (ValueError, TypeError) as exc:
+        raise InvalidCursor(cursor) from exc
+    if not isinstance(payload, dict) or payload.get('d') not in (FORWARD, BACKWARD):
+        raise InvalidCursor(cursor)
+    if not isinstance(payload.get('i'), int):
+        raise InvalidCursor(cursor)
+    return payload
+
+
+def page_size_from_params(params, default=DEFAULT_PAGE_SIZE):
+    value = params.get('page_size', '')
+    if value.isdigit() and int(value) > 0:
+        return min(int(value), MAX_PAGE_SIZE)
+    return default
+
+
+@dataclass
+class KeysetPage:
+    """Страница каталога (по интерфейсу похожа на django.core.paginator.Page)"""
+    object_list: list
+    next_cursor: str = None
+    previous_cursor: str = None
+    extra: dict = field(default_factory=dict)
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+
+def _row_id(row):
+    # Строки бывают моделями или dict из .values() (см. cars.listing)
+    return row['id'] if isinstance(row, dict) else row.pk
+
+
+def _created_key(row, field):
+    created_at = row[field] if isinstance(row, dict) else getattr(row, field)
+    return {'c': created_at.isoformat(), 'i': _row_id(row)}
+
+
+def paginate_by_created(queryset, cursor=None, page_size=DEFAULT_PAGE_SIZE, field='created_at'):
+    """
+    Страница queryset (моделей или .values()) в порядке (-created_at, -id).
+    field - другое поле даты с тем же смыслом (например, timestamp сообщения).
+    """
+    payload = decode_cursor(cursor) if cursor else None
+
+    if payload is None or payload['d'] == FORWARD:
+        if payload is not None:
+            created_at = parse_datetime(payload.get('c', ''))
+            if created_at is None:
+                raise InvalidCursor(cursor)
+            queryset = queryset.filter(
+                models.Q(**{f'{field}__lt': created_at}) |
+                models.Q(**{field: created_at, 'pk__lt': payload['i']})
+            )
+        rows = list(queryset.order_by(f'-{field}', '-pk')[:page_size + 1])
+        has_next = len(rows) > page_size
+        rows = rows[:page_size]
+        has_previous = payload is not None
+    else:
+        created_at = parse_datetime(payload.get('c', ''))
+        if created_at is None:
+            raise InvalidCursor(cursor)
+        queryset = queryset.filter(
+            models.Q(**{f'{field}__gt': created_at}) |
+            models.Q(**{field: created_at, 'pk__gt': payload['i']})
+        )
+        rows = list(queryset.order_by(field, 'pk')[:page_size + 1])
+        has_previous = len(rows) > page_size
+        rows = rows[:page_size][::-1]
+        has_next = True
+
+    page = KeysetPage(rows)
+    if rows and has_next:
+        page.next_cursor = encode_cursor({'d': FORWARD, **_created_key(rows[-1], field)})
+    if rows and has_previous:
+        page.previous_cursor = encode_cursor({'d': BACKWARD, **_created_key(rows[0], field)})
+    return page
+
+
+def _ranked_rows(queryset, ids, count):
+    """
+    Первые count строк queryset в порядке ids. id проверяются пачками,
+    растущими вдвое, - запрос не тянет все совпадения ради одной страницы.
+    """
+    rows = []
+    start, size = 0, 2 * count
+    while start < len(ids) and len(rows) < count:
+        chunk = ids[start:start + size]
+        found = {_row_id(row): row for row in queryset.filter(pk__in=chunk)}
+        rows += [found[row_id] for row_id in chunk if row_id in found]
+        start, size = start + size, size * 2
+    return rows[:count]
+
+
+def paginate_ranked(queryset, ranked_ids, cursor=None, page_size=DEFAULT_PAGE_SIZE):
+    """
+    Страница результатов поиска в порядке ranked_ids.
+
+    queryset уже ограничен поиском (SearchBackend.filter_matches) и фильтрами;
+    из него читаются только строки страницы (и одна лишняя - есть ли следующая).
+    """
+    payload = decode_cursor(cursor) if cursor else None
+    position = None
+    if payload is not None:
+        try:
+            position = ranked_ids.index(payload['i'])
+        except ValueError:
+            # Автомобиль с курсора пропал из выдачи (продан) - начинаем сначала
+            payload = None
+
+    if payload is None or payload['d'] == FORWARD:
+        start = 0 if position is None else position + 1
+        rows = _ranked_rows(queryset, ranked_ids[start:], page_size + 1)
+        has_next = len(rows) > page_size
+        rows = rows[:page_size]
+        has_previous = payload is not None
+    else:
+        rows = _ranked_rows(queryset, ranked_ids[:position][::-1], page_size + 1)
+        has_previous = len(rows) > page_size
+        rows = rows[:page_size][::-1]
+        has_next = True
+
+    page = KeysetPage(rows)
+    if rows and has_next:
+        page.next_cursor = encode_cursor({'d': FORWARD, 'i': _row_id(rows[-1])})
+    if rows and has_previous:
+        page.previous_cursor = encode_cursor({'d': BACKWARD, 'i': _row_id(rows[0])})
+    return page
@@ -0,0 +1,156 @@
+"""
+Фильтры, статистика и смена статусов заявок на покупку.
+
+Разбивка по статусам считается одним запросом GROUP BY status: для
+менеджера (вся таблица) он читает только индекс (status, created_at),
+не обращаясь к строкам. Фильтр по дате задаётся полуинтервалом по
+created_at, а не через __date, чтобы тот же индекс работал и для списка.
+"""
+from collections import Counter
+from datetime import datetime, time, timedelta
+
+from django.db import transaction
+from django.db.models import Count
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+from notifications.models import Notification
+
+from .models import PurchaseRequest
+from .stats import apply_status_changes
+
+STATUSES = [value for value, _ in PurchaseRequest.STATUS_CHOICES]
+STATUS_LABELS = dict(PurchaseRequest.STATUS_CHOICES)
+
+# Допустимые переходы: завершённая заявка - конечное состояние
+# (то же правило, что в PurchaseRequest.can_be_processed_by_user)
+STATUS_TRANSITIONS = {
+    status: set() if status == 'completed' else set(STATUSES) - {status}
+    for status in STATUSES
+}
+
+# Причины, по которым заявка пропущена при массовой смене статуса
+SKIP_NOT_FOUND = 'not_found'
+SKIP_UNCHANGED = 'unchanged'
+SKIP_NOT_ALLOWED = 'not_allowed'
+
+
+def _day_start(day):
+    return timezone.make_aware(datetime.combine(day, time.min))
+
+
+def request_filters_from_params(params):
+    """GET-параметры списка заявок -> словарь активных фильтров"""
+    filters = {}
+    status = params.get('status', '')
+    if status in STATUSES:
+        filters['status'] = status
+    brand = params.get('brand', '')
+    if brand.isdigit():
+        filters['brand'] = int(brand)
+    for name in ('date_from', 'date_to'):
+        try:
+            day = parse_date(params.get(name, ''))
+        except ValueError:
+            day = None
+        if day is not None:
+            filters[name] = day
+    return filters
+
+
+def apply_request_filters(queryset, filters):
+    if 'status' in filters:
+        queryset = queryset.filter(status=filters['status'])
+    if 'brand' in filters:
+        queryset = queryset.filter(car__brand_id=filters['brand'])
+    if 'date_from' in filters:
+        queryset = queryset.filter(created_at__gte=_day_start(filters['date_from']))
+    if 'date_to' in filters:
+        # Включительно: до начала следующего дня
+        queryset = queryset.filter(created_at__lt=_day_start(filters['date_to'] + timedelta(days=1)))
+    return queryset
+
+
+def status_counts(queryset):
+    """{'total': N, 'new': ..., 'in_progress': ..., ...} одним запросом"""
+    counts = dict.fromkeys(STATUSES, 0)
+    rows = queryset.order_by().values_list('status').annotate(count=Count('pk'))
+    for status, count in rows:
+        counts[status] = count
+    counts['total'] = sum(counts.values())
+    return counts
+
+
+# --- СМЕНА СТАТУСА ---
+
+def status_notification(user_id, car_title, old_status, new_status, manager_comment=''):
+    """Несохранённое уведомление клиенту о смене статуса его заявки"""
+    message = (
+        f"Статус вашей заявки на {car_title} изменен с "
+        f"'{STATUS_LABELS[old_status]}' на '{STATUS_LABELS[new_status]}'"
+    )
+    if manager_comment:
+        message += f". Комментарий менеджера: {manager_comment}"
+    return Notification(
+        user_id=user_id,
+        title='Изменение статуса заявки',
+        message=message,
+        notification_type='request_status_update',
+    )
+
+
+def notify_status_change(purchase_request, old_status):
+    """Уведомление после сохранения одной заявки формой менеджера"""
+    car = purchase_request.car
+    status_notification(
+        purchase_request.user_id, f'{car.brand.name} {car.model}',
+        old_status, purchase_request.status, purchase_request.manager_comment,
+    ).save()
+
+
+def transition_requests(request_ids, status, manager_comment=None):
+    """
+    Массовая смена статуса заявок.
+
+    Допустимость перехода проверяется для каждой заявки; подходящие
+    обновляются одним UPDATE, уведомления клиентам создаются одним INSERT,
+    счётчики профиля - через apply_status_changes(). manager_comment=None
+    оставляет комментарии заявок как есть.
+
+    Возвращает {'updated': [id, ...], 'skipped': {id: причина}}.
+    """
+    if status not in STATUS_LABELS:
+        raise ValueError(f'Неизвестный статус: {status}')
+    request_ids = set(request_ids)
+    updated, skipped, notifications = [], {}, []
+    changes = Counter()
+
+    with transaction.atomic():
+        rows = (
+            PurchaseRequest.objects.select_for_update(of=('self',))
+            .filter(pk__in=request_ids).order_by('pk')
+            .values_list('pk', 'user_id', 'status', 'car__brand__name', 'car__model')
+        )
+        for pk, user_id, old_status, brand_name, model in rows:
+            request_ids.discard(pk)
+            if old_status == status:
+                skipped[pk] = SKIP_UNCHANGED
+            elif status not in STATUS_TRANSITIONS[old_status]:
+                skipped[pk] = SKIP_NOT_ALLOWED
+            else:
+                updated.append(pk)
+                changes[user_id, old_status] += 1
+                notifications.append(status_notification(
+                    user_id, f'{brand_name} {model}', old_status, status, manager_comment,
+                ))
+        skipped.update(dict.fromkeys(request_ids, SKIP_NOT_FOUND))
+
+        if updated:
+            fields = {'status': status, 'updated_at': timezone.now()}
+            if manager_comment is not None:
+                fields['manager_comment'] = manager_comment
+            PurchaseRequest.objects.filter(pk__in=updated).update(**fields)
+            apply_status_changes(changes, status)
+            Notification.objects.bulk_create(notifications)
+
+    return {'updated': updated, 'skipped': skipped}
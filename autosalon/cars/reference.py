@@ -0,0 +1,113 @@
+"""
+Справочники каталога в памяти процесса: марки и подписи вариантов Car.
+
+Марки меняются редко, а читаются на каждой странице каталога и при каждой
+проверке brand_id в API. Процесс держит снимок всех марок и перед
+использованием сверяет его с версией в общем кэше (cars:brands:version) -
+одно чтение кэша вместо запроса к БД. Сохранение или удаление марки
+поднимает версию после фиксации транзакции (cars/signals.py), и каждый
+процесс перечитывает марки при следующем обращении.
+
+Пока в транзакции потока есть незафиксированное изменение марки, этот
+поток читает марки из БД мимо снимка: иначе снимок с незафиксированными
+данными остался бы в процессе и после отката.
+
+Снимок заменяется целиком, поэтому читать его можно из любых потоков.
+Экземпляры Brand в нём общие и не изменяются: get_brand отдаёт копию.
+"""
+import copy
+import threading
+import weakref
+from types import MappingProxyType
+
+from django.db import transaction
+from django.utils.functional import SimpleLazyObject
+
+from .cache import bump_version, get_version
+from .models import Brand, Car
+
+BRANDS_VERSION_KEY = 'cars:brands:version'
+
+TRANSMISSION_LABELS = MappingProxyType(dict(Car.TRANSMISSION_CHOICES))
+FUEL_LABELS = MappingProxyType(dict(Car.FUEL_CHOICES))
+
+
+class _BrandSnapshot:
+    __slots__ = ('version', 'brands', 'by_id')
+
+    def __init__(self, version, brands):
+        self.version = version
+        self.brands = tuple(brands)
+        self.by_id = MappingProxyType({brand.pk: brand for brand in self.brands})
+
+
+_snapshot = None
+_local = threading.local()
+
+
+class _PendingChange:
+    """Изменение марок в открытой транзакции; держит его только on_commit-колбэк"""
+
+    def __init__(self):
+        self.committed = False
+
+    def commit(self):
+        self.committed = True
+        bump_version(BRANDS_VERSION_KEY)
+
+
+def _has_pending_change():
+    # Колбэк выбрасывается при откате - объект освобождается вместе с ним
+    pending = getattr(_local, 'pending', None)
+    pending = pending and pending()
+    return pending is not None and not pending.committed
+
+
+def _brands_snapshot():
+    global _snapshot
+    if _has_pending_change():
+        return _BrandSnapshot(None, Brand.objects.all())
+    # Версия читается до марок: изменение между ними даст лишнюю перезагрузку, а не устаревший снимок
+    version = get_version(BRANDS_VERSION_KEY)
+    snapshot = _snapshot
+    if snapshot is None or snapshot.version != version:
+        snapshot = _snapshot = _BrandSnapshot(version, Brand.objects.all())
+    return snapshot
+
+
+def get_brands():
+    """Все марки в порядке Brand.Meta.ordering"""
+    return _brands_snapshot().brands
+
+
+def brands_by_id():
+    """{id: Brand} только для чтения"""
+    return _brands_snapshot().by_id
+
+
+def get_brand(pk):
+    """Копия марки по id или None"""
+    brand = brands_by_id().get(pk)
+    return copy.copy(brand) if brand is not None else None
+
+
+def brands_changed():
+    """
+    Марка сохранена или удалена: до конца транзакции поток читает марки
+    из БД, после фиксации все процессы узнают об изменении по версии
+    """
+    if _has_pending_change():
+        return
+    pending = _PendingChange()
+    _local.pending = weakref.ref(pending)
+    # Вне транзакции колбэк выполняется сразу
+    transaction.on_commit(pending.commit)
+
+
+def reference_data(request):
+    """Контекстный процессор: справочники в любом шаблоне, марки - только если их читают"""
+    return {
+        'catalog_brands': SimpleLazyObject(get_brands),
+        'TRANSMISSION_LABELS': TRANSMISSION_LABELS,
+        'FUEL_LABELS': FUEL_LABELS,
+    }
@@ -0,0 +1,263 @@
+"""
+Полнотекстовый поиск по каталогу.
+
+Поиск идёт по модели автомобиля и по названию, стране и описанию марки.
+Бэкенд выбирается по СУБД (или явно через settings.CARS_SEARCH_BACKEND):
+
+* SQLite - виртуальная таблица FTS5 cars_car_fts (rowid = id автомобиля),
+  ранжирование bm25 с весами колонок;
+* PostgreSQL - таблица cars_car_search с tsvector (GIN-индекс) и
+  триграммным индексом по тексту, ранжирование ts_rank + similarity;
+* остальные СУБД - прежний поиск через icontains.
+
+Индекс содержит только непроданные автомобили и обновляется из сигналов
+Car/Brand (см. cars/signals.py) в той же транзакции, что и изменение.
+Таблицы индекса создаёт миграция 0004_car_search_index.
+
+Каталог ищет без лимита: search(query) даёт весь ранжированный список id
+для фасетов и порядка страниц (cars.pagination.paginate_ranked), а filter_matches() ограничивает
+queryset подзапросом к индексу - фильтры применяются ко всем совпадениям.
+"""
+import re
+
+from django.conf import settings
+from django.db import connection, models
+from django.db.models.expressions import RawSQL
+from django.utils.module_loading import import_string
+
+_TERM_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def search_terms(query):
+    """Разбивает строку запроса на слова (без спецсимволов синтаксиса FTS)"""
+    return _TERM_RE.findall(query.lower())
+
+
+def _document(car):
+    brand = car.brand
+    return (car.model, brand.name, brand.country, brand.description)
+
+
+class SearchBackend:
+    """Базовый бэкенд поиска"""
+
+    def search(self, query, limit=None):
+        """Список id автомобилей, отсортированный по релевантности; limit=None - без ограничения"""
+        raise NotImplementedError
+
+    def filter_matches(self, queryset, query):
+        """
+        Оставляет в queryset (Car или CarListing) все найденные автомобили -
+        подзапросом к индексу, без передачи списка id в запрос
+        """
+        raise NotImplementedError
+
+    def index_cars(self, cars):
+        """Добавляет или обновляет автомобили в индексе (проданные удаляются)"""
+        raise NotImplementedError
+
+    def remove_cars(self, car_ids):
+        raise NotImplementedError
+
+    def rebuild(self):
+        """Полностью перестраивает индекс по таблице cars_car"""
+        from .models import Car
+
+        self.clear()
+        queryset = Car.objects.filter(is_sold=False).select_related('brand').order_by()
+        batch = []
+        for car in queryset.iterator(chunk_size=2000):
+            batch.append(car)
+            if len(batch) >= 2000:
+                self.index_cars(batch)
+                batch = []
+        if batch:
+            self.index_cars(batch)
+
+    def clear(self):
+        raise NotImplementedError
+
+
+class LikeSearchBackend(SearchBackend):
+    """Запасной вариант без индекса: icontains по модели и марке"""
+
+    def _q(self, query):
+        return models.Q(model__icontains=query) | models.Q(brand__name__icontains=query)
+
+    def search(self, query, limit=None):
+        from .models import Car
+
+        return list(
+            Car.objects.filter(self._q(query), is_sold=False).values_list('id', flat=True)[:limit]
+        )
+
+    def filter_matches(self, queryset, query):
+        from .models import Car
+
+        return queryset.filter(pk__in=Car.objects.filter(self._q(query), is_sold=False).values('id'))
+
+    def index_cars(self, cars):
+        pass
+
+    def remove_cars(self, car_ids):
+        pass
+
+    def clear(self):
+        pass
+
+
+class SQLiteFTSBackend(SearchBackend):
+    """SQLite FTS5"""
+
+    table = 'cars_car_fts'
+    # Веса колонок для bm25: модель, марка, страна, описание марки
+    weights = (10.0, 8.0, 2.0, 1.0)
+
+    def _match_expression(self, query):
+        # Каждое слово - префиксный поиск в кавычках, слова объединяются по AND
+        return ' '.join(f'"{term}"*' for term in search_terms(query))
+
+    def search(self, query, limit=None):
+        expression = self._match_expression(query)
+        if not expression:
+            return []
+        weights = ', '.join(str(weight) for weight in self.weights)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"SELECT rowid FROM {self.table} WHERE {self.table} MATCH %s "
+                f"ORDER BY bm25({self.table}, {weights}) LIMIT %s",
+                # LIMIT -1 в SQLite - без ограничения
+                [expression, -1 if limit is None else limit],
+            )
+            return [row[0] for row in cursor.fetchall()]
+
+    def filter_matches(self, queryset, query):
+        expression = self._match_expression(query)
+        if not expression:
+            return queryset.none()
+        return queryset.filter(pk__in=RawSQL(
+            f"SELECT rowid FROM {self.table} WHERE {self.table} MATCH %s", [expression],
+        ))
+
+    def index_cars(self, cars):
+        cars = list(cars)
+        sold = [car.pk for car in cars if car.is_sold]
+        rows = [(car.pk, *_document(car)) for car in cars if not car.is_sold]
+        with connection.cursor() as cursor:
+            if rows:
+                cursor.executemany(
+                    f"INSERT OR REPLACE INTO {self.table} "
+                    f"(rowid, model, brand_name, brand_country, brand_description) "
+                    f"VALUES (%s, %s, %s, %s, %s)",
+                    rows,
+                )
+        if sold:
+            self.remove_cars(sold)
+
+    def remove_cars(self, car_ids):
+        with connection.cursor() as cursor:
+            cursor.executemany(f"DELETE FROM {self.table} WHERE rowid = %s", [(car_id,) for car_id in car_ids])
+
+    def clear(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {self.table}")
+
+
+class PostgresSearchBackend(SearchBackend):
+    """PostgreSQL: tsvector + pg_trgm"""
+
+    table = 'cars_car_search'
+
+    # Модель и марка - вес A, страна - B, описание марки (русский текст) - C
+    document_sql = (
+        "setweight(to_tsvector('simple', %s), 'A') || "
+        "setweight(to_tsvector('simple', %s), 'A') || "
+        "setweight(to_tsvector('simple', %s), 'B') || "
+        "setweight(to_tsvector('russian', %s), 'C')"
+    )
+
+    def _tsquery(self, query):
+        return ' & '.join(f'{term}:*' for term in search_terms(query))
+
+    # Условие совпадения: префиксы слов в tsvector или похожий текст (триграммы)
+    match_sql = "document @@ to_tsquery('simple', %s) OR content %% %s"
+
+    def search(self, query, limit=None):
+        tsquery = self._tsquery(query)
+        if not tsquery:
+            return []
+        text = ' '.join(search_terms(query))
+        with connection.cursor() as cursor:
+            # LIMIT NULL в PostgreSQL - без ограничения
+            cursor.execute(
+                f"SELECT car_id FROM cars_car_search WHERE {self.match_sql} "
+                "ORDER BY ts_rank(document, to_tsquery('simple', %s)) + similarity(content, %s) DESC "
+                "LIMIT %s",
+                [tsquery, text, tsquery, text, limit],
+            )
+            return [row[0] for row in cursor.fetchall()]
+
+    def filter_matches(self, queryset, query):
+        tsquery = self._tsquery(query)
+        if not tsquery:
+            return queryset.none()
+        text = ' '.join(search_terms(query))
+        return queryset.filter(pk__in=RawSQL(
+            f"SELECT car_id FROM cars_car_search WHERE {self.match_sql}", [tsquery, text],
+        ))
+
+    def index_cars(self, cars):
+        cars = list(cars)
+        sold = [car.pk for car in cars if car.is_sold]
+        rows = []
+        for car in cars:
+            if car.is_sold:
+                continue
+            document = _document(car)
+            # В триграммный текст описание не включаем - оно длинное и шумное
+            content = ' '.join(document[:3]).lower()
+            rows.append((car.pk, *document, content))
+        with connection.cursor() as cursor:
+            if rows:
+                cursor.executemany(
+                    f"INSERT INTO cars_car_search (car_id, document, content) "
+                    f"VALUES (%s, {self.document_sql}, %s) "
+                    f"ON CONFLICT (car_id) DO UPDATE "
+                    f"SET document = EXCLUDED.document, content = EXCLUDED.content",
+                    rows,
+                )
+        if sold:
+            self.remove_cars(sold)
+
+    def remove_cars(self, car_ids):
+        with connection.cursor() as cursor:
+            cursor.execute("DELETE FROM cars_car_search WHERE car_id = ANY(%s)", [list(car_ids)])
+
+    def clear(self):
+        with connection.cursor() as cursor:
+            cursor.execute("TRUNCATE cars_car_search")
+
+
+BACKENDS_BY_VENDOR = {
+    'sqlite': SQLiteFTSBackend,
+    'postgresql': PostgresSearchBackend,
+}
+
+
+def backend_class_for(vendor):
+    """Класс бэкенда для СУБД (с учётом settings.CARS_SEARCH_BACKEND)"""
+    path = getattr(settings, 'CARS_SEARCH_BACKEND', None)
+    if path:
+        return import_string(path)
+    return BACKENDS_BY_VENDOR.get(vendor, LikeSearchBackend)
+
+
+_backend = None
+
+
+def get_search_backend():
+    """Бэкенд поиска для текущей базы данных"""
+    global _backend
+    if _backend is None:
+        _backend = backend_class_for(connection.vendor)()
+    return _backend
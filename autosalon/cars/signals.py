@@ -0,0 +1,126 @@
+from django.conf import settings
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .cache import bump_inventory_version
+from .facets import facet_index
+from .images import delete_variants, schedule_variants
+from .listing import refresh_brand, refresh_car_images, sync_car
+from . import live
+from .reference import brands_changed
+from .models import Brand, Car, CarImage, Favorite, PurchaseRequest, UserStats
+from .search import get_search_backend
+from .similarity import similarity_index
+from .stats import change_favorites, recount, request_added, request_removed, request_status_changed
+
+
+def _update_memory_indexes(car):
+    facet_index.update_car(car)
+    similarity_index.update_car(car)
+    bump_inventory_version()
+
+
+def _remove_from_memory_indexes(car_id):
+    facet_index.remove_car(car_id)
+    similarity_index.remove_car(car_id)
+    bump_inventory_version()
+
+
+@receiver(post_save, sender=Car)
+def car_saved(sender, instance, created, **kwargs):
+    # Поисковый индекс и проекция каталога лежат в той же БД - обновляем их в той же транзакции
+    get_search_backend().index_cars([instance])
+    sync_car(instance)
+    # Индексы в памяти процесса - только после фиксации транзакции
+    transaction.on_commit(lambda: _update_memory_indexes(instance))
+    # Открытые страницы каталога получат изменение после фиксации
+    live.car_saved(instance, created)
+
+
+@receiver(post_delete, sender=Car)
+def car_deleted(sender, instance, **kwargs):
+    car_id = instance.pk
+    get_search_backend().remove_cars([car_id])
+    transaction.on_commit(lambda: _remove_from_memory_indexes(car_id))
+    live.car_deleted(car_id)
+
+
+@receiver(post_save, sender=Brand)
+def brand_saved(sender, instance, created, **kwargs):
+    """Название, страна и описание марки входят в поисковые документы её автомобилей"""
+    transaction.on_commit(bump_inventory_version)
+    brands_changed()
+    if created:
+        return
+    refresh_brand(instance)
+    cars = instance.cars.filter(is_sold=False).select_related('brand')
+    get_search_backend().index_cars(cars.iterator(chunk_size=2000))
+
+
+@receiver(post_save, sender=CarImage)
+def car_image_saved(sender, instance, **kwargs):
+    """Новое или заменённое фото - строим WebP/AVIF-копии в пуле процессов"""
+    transaction.on_commit(bump_inventory_version)
+    refresh_car_images(instance.car_id)
+    if not instance.image or instance.has_variants():
+        return
+    transaction.on_commit(lambda: schedule_variants(instance))
+
+
+@receiver(post_delete, sender=CarImage)
+def car_image_deleted(sender, instance, **kwargs):
+    transaction.on_commit(bump_inventory_version)
+    refresh_car_images(instance.car_id)
+    variants = instance.variants
+    if variants:
+        transaction.on_commit(lambda: delete_variants(variants))
+
+
+@receiver(post_delete, sender=Brand)
+def brand_deleted(sender, instance, **kwargs):
+    transaction.on_commit(bump_inventory_version)
+    brands_changed()
+
+
+# --- СЧЁТЧИКИ ПРОФИЛЯ ---
+
+@receiver(post_save, sender=settings.AUTH_USER_MODEL)
+def user_saved(sender, instance, created, raw, **kwargs):
+    if created and not raw:
+        UserStats.objects.create(user=instance)
+
+
+@receiver(post_save, sender=Favorite)
+def favorite_saved(sender, instance, created, **kwargs):
+    if created:
+        change_favorites(instance.user_id, 1)
+
+
+@receiver(post_delete, sender=Favorite)
+def favorite_deleted(sender, instance, **kwargs):
+    change_favorites(instance.user_id, -1)
+
+
+@receiver(post_save, sender=PurchaseRequest)
+def purchase_request_saved(sender, instance, created, **kwargs):
+    if created:
+        request_added(instance.user_id, instance.status)
+    else:
+        old_status = getattr(instance, '_loaded_status', None)
+        if old_status is not None:
+            request_status_changed(instance.user_id, old_status, instance.status)
+        else:
+            # Экземпляр, созданный не из БД, прежнего статуса не знает
+            recount(instance.user_id)
+    instance._loaded_status = instance.status
+
+
+@receiver(post_delete, sender=PurchaseRequest)
+def purchase_request_deleted(sender, instance, **kwargs):
+    old_status = getattr(instance, '_loaded_status', None)
+    if old_status is not None:
+        request_removed(instance.user_id, old_status)
+    else:
+        # Строка уже удалена - пересчёт её не учтёт
+        recount(instance.user_id, create=False)
@@ -0,0 +1,169 @@
+"""
+Поиск похожих автомобилей.
+
+Для непроданных автомобилей в памяти держится матрица признаков NumPy:
+цена и пробег (в логарифмической шкале), год, мощность, объём двигателя -
+нормированные по среднему и стандартному отклонению, плюс one-hot по
+типу топлива и коробке передач. Ближайшие соседи ищутся векторно по
+евклидову расстоянию; автомобилям другой марки добавляется штраф, чтобы
+в первую очередь предлагались машины той же марки.
+
+Индекс обновляется инкрементально из сигналов Car (см. cars/signals.py).
+"""
+import numpy as np
+
+from .inmemory import InMemoryIndex
+from .models import Car
+
+FUELS = [value for value, _ in Car.FUEL_CHOICES]
+TRANSMISSIONS = [value for value, _ in Car.TRANSMISSION_CHOICES]
+
+# Числовые признаки: (поле, логарифмировать ли)
+NUMERIC_FEATURES = (
+    ('price', True),
+    ('year', False),
+    ('mileage', True),
+    ('horsepower', False),
+    ('engine_volume', False),
+)
+
+# Вес категориальных признаков и штраф за другую марку (в единицах станд. отклонения)
+CATEGORY_WEIGHT = 0.75
+OTHER_BRAND_PENALTY = 1.5
+
+MAX_NEIGHBOURS = 20
+
+
+def _raw_features(values):
+    """Сырой числовой вектор автомобиля из значений полей (без нормировки)"""
+    numeric = []
+    for name, use_log in NUMERIC_FEATURES:
+        value = float(values[name] or 0)
+        numeric.append(np.log1p(max(value, 0.0)) if use_log else value)
+    fuel = [CATEGORY_WEIGHT if values['fuel_type'] == option else 0.0 for option in FUELS]
+    transmission = [CATEGORY_WEIGHT if values['transmission'] == option else 0.0 for option in TRANSMISSIONS]
+    return numeric + fuel + transmission
+
+
+def _car_values(car):
+    fields = [name for name, _ in NUMERIC_FEATURES] + ['fuel_type', 'transmission']
+    return {name: getattr(car, name) for name in fields}
+
+
+class SimilarityIndex(InMemoryIndex):
+    """Матрица признаков непроданных автомобилей и поиск ближайших соседей"""
+
+    version_key = 'cars:similarity:version'
+
+    def __init__(self):
+        super().__init__()
+        width = len(NUMERIC_FEATURES) + len(FUELS) + len(TRANSMISSIONS)
+        self._ids = np.empty(0, dtype=np.int64)
+        self._brands = np.empty(0, dtype=np.int64)
+        self._raw = np.empty((0, width), dtype=np.float64)
+        self._vectors = np.empty((0, width), dtype=np.float32)
+        self._positions = {}
+        self._mean = np.zeros(len(NUMERIC_FEATURES))
+        self._std = np.ones(len(NUMERIC_FEATURES))
+
+    def _load(self):
+        fields = ['id', 'brand_id'] + [name for name, _ in NUMERIC_FEATURES] + ['fuel_type', 'transmission']
+        rows = list(Car.objects.filter(is_sold=False).order_by().values(*fields))
+
+        width = self._raw.shape[1]
+        self._ids = np.fromiter((row['id'] for row in rows), dtype=np.int64, count=len(rows))
+        self._brands = np.fromiter((row['brand_id'] for row in rows), dtype=np.int64, count=len(rows))
+        self._raw = np.array([_raw_features(row) for row in rows], dtype=np.float64).reshape(-1, width)
+        self._positions = {int(car_id): position for position, car_id in enumerate(self._ids)}
+
+        # Параметры нормировки фиксируются при полной загрузке; инкрементальные
+        # изменения их не пересчитывают - дрейф мал, а векторы остаются сравнимыми
+        numeric = self._raw[:, :len(NUMERIC_FEATURES)]
+        if len(rows):
+            self._mean = numeric.mean(axis=0)
+            std = numeric.std(axis=0)
+            self._std = np.where(std > 0, std, 1.0)
+        self._vectors = self._normalize(self._raw)
+
+    def _normalize(self, raw):
+        vectors = raw.astype(np.float64, copy=True)
+        count = len(NUMERIC_FEATURES)
+        vectors[:, :count] = (vectors[:, :count] - self._mean) / self._std
+        return vectors.astype(np.float32)
+
+    # --- ИНКРЕМЕНТАЛЬНЫЕ ОБНОВЛЕНИЯ ---
+
+    def _remove(self, car_id):
+        position = self._positions.pop(car_id, None)
+        if position is None:
+            return
+        last = len(self._ids) - 1
+        if position != last:
+            # Переносим последнюю строку на место удалённой
+            moved_id = int(self._ids[last])
+            for array in (self._ids, self._brands, self._raw, self._vectors):
+                array[position] = array[last]
+            self._positions[moved_id] = position
+        self._ids = self._ids[:last]
+        self._brands = self._brands[:last]
+        self._raw = self._raw[:last]
+        self._vectors = self._vectors[:last]
+
+    def _add(self, car):
+        raw = np.array([_raw_features(_car_values(car))], dtype=np.float64)
+        self._positions[car.pk] = len(self._ids)
+        self._ids = np.append(self._ids, car.pk)
+        self._brands = np.append(self._brands, car.brand_id)
+        self._raw = np.vstack([self._raw, raw])
+        self._vectors = np.vstack([self._vectors, self._normalize(raw)])
+
+    def update_car(self, car):
+        """Отражает сохранение автомобиля (в т.ч. продажу) в индексе"""
+        def change():
+            self._remove(car.pk)
+            if not car.is_sold:
+                self._add(car)
+        self._apply_change(change)
+
+    def remove_car(self, car_id):
+        self._apply_change(lambda: self._remove(car_id))
+
+    # --- ПОИСК ---
+
+    def similar_ids(self, car, k=3):
+        """
+        id k ближайших к car непроданных автомобилей, от самого похожего.
+        car может быть и проданным - вектор строится по его полям.
+        """
+        k = max(0, min(k, MAX_NEIGHBOURS))
+        with self._lock:
+            self._ensure_loaded()
+            if not k or not len(self._ids):
+                return []
+
+            query = self._normalize(np.array([_raw_features(_car_values(car))], dtype=np.float64))[0]
+            distances = np.square(self._vectors - query).sum(axis=1)
+            distances += np.where(self._brands == car.brand_id, 0.0, OTHER_BRAND_PENALTY ** 2)
+            # Сам автомобиль в выдачу не попадает
+            position = self._positions.get(car.pk)
+            if position is not None:
+                distances[position] = np.inf
+
+            count = min(k, len(distances) - (position is not None))
+            if count <= 0:
+                return []
+            nearest = np.argpartition(distances, count - 1)[:count]
+            nearest = nearest[np.argsort(distances[nearest], kind='stable')]
+            return [int(car_id) for car_id in self._ids[nearest]]
+
+
+def get_similar_cars(car, k=3, queryset=None):
+    """Похожие автомобили в порядке убывания сходства"""
+    car_ids = similarity_index.similar_ids(car, k)
+    if queryset is None:
+        queryset = Car.objects.select_related('brand')
+    objects = queryset.in_bulk(car_ids)
+    return [objects[car_id] for car_id in car_ids if car_id in objects]
+
+
+similarity_index = SimilarityIndex()
@@ -0,0 +1,141 @@
+"""
+Счётчики страницы профиля (UserStats).
+
+Сигналы Favorite/PurchaseRequest (cars/signals.py) меняют строку
+пользователя и общую строку (user=NULL) через UPDATE ... SET n = n + 1 в
+той же транзакции, что и само изменение, - профиль читает готовые числа
+одним запросом. QuerySet.update() сигналов не вызывает: массовая смена
+статуса (cars.purchase_requests.transition_requests) передаёт изменения
+в apply_status_changes(), другой массовый код вызывает recount().
+Если сохраняемая заявка не знает прежнего статуса (создана не из БД или
+загружена без поля status), счётчики её пользователя пересчитываются.
+"""
+from collections import Counter
+
+from django.db import transaction
+from django.db.models import Count, F, Q
+
+from .models import Favorite, PurchaseRequest, UserStats
+
+
+def status_field(status):
+    return f'requests_{status}'
+
+
+def _apply(user_id, deltas, create=True):
+    """
+    Прибавляет deltas к строке пользователя и к общей строке.
+    Отсутствующая строка создаётся пересчётом по исходным таблицам (уже с
+    учётом текущего изменения). При удалениях create=False: пользователь
+    может удаляться вместе со своими заявками, создавать ему строку нельзя.
+    """
+    updates = {name: F(name) + delta for name, delta in deltas.items() if delta}
+    if not updates:
+        return
+    for row_user_id in (user_id, None):
+        if UserStats.objects.filter(user_id=row_user_id).update(**updates):
+            continue
+        if create or row_user_id is None:
+            UserStats.objects.get_or_create(user_id=row_user_id, defaults=count_stats(row_user_id))
+
+
+def change_favorites(user_id, delta):
+    _apply(user_id, {'favorites_count': delta}, create=delta > 0)
+
+
+def request_added(user_id, status):
+    _apply(user_id, {'requests_total': 1, status_field(status): 1})
+
+
+def request_removed(user_id, status):
+    _apply(user_id, {'requests_total': -1, status_field(status): -1}, create=False)
+
+
+def request_status_changed(user_id, old_status, new_status):
+    if old_status != new_status:
+        _apply(user_id, {status_field(old_status): -1, status_field(new_status): 1})
+
+
+def recount(user_id, create=True):
+    """Пересчитывает по таблицам строку пользователя и общую строку"""
+    for row_user_id in (user_id, None):
+        values = count_stats(row_user_id)
+        if create or row_user_id is None:
+            UserStats.objects.update_or_create(user_id=row_user_id, defaults=values)
+        else:
+            UserStats.objects.filter(user_id=row_user_id).update(**values)
+
+
+def apply_status_changes(changes, status):
+    """Учитывает массовую смену статуса: один UPDATE на пользователя и один общий"""
+    per_user = {}
+    for (user_id, old_status), count in changes.items():
+        deltas = per_user.setdefault(user_id, Counter())
+        deltas[status_field(old_status)] -= count
+        deltas[status_field(status)] += count
+    for user_id, deltas in per_user.items():
+        _apply(user_id, deltas)
+
+
+def profile_stats(user, include_global=False):
+    """
+    (счётчики пользователя, общие счётчики или None) одним запросом.
+    Недостающая строка пользователя создаётся пересчётом.
+    """
+    condition = Q(user=user)
+    if include_global:
+        condition |= Q(user__isnull=True)
+    rows = {stats.user_id: stats for stats in UserStats.objects.filter(condition)}
+    if user.pk not in rows:
+        rows[user.pk], _ = UserStats.objects.get_or_create(user=user, defaults=count_stats(user.pk))
+    if include_global and None not in rows:
+        rows[None], _ = UserStats.objects.get_or_create(user=None, defaults=count_stats())
+    return rows[user.pk], rows.get(None)
+
+
+# --- ПОЛНЫЙ ПЕРЕСЧЁТ ---
+
+def count_stats(user_id=None):
+    """Значения всех счётчиков: по пользователю или общие (user_id=None)"""
+    favorites = Favorite.objects.all()
+    requests = PurchaseRequest.objects.order_by()
+    if user_id is not None:
+        favorites = favorites.filter(user_id=user_id)
+        requests = requests.filter(user_id=user_id)
+    values = {'favorites_count': favorites.count(), 'requests_total': 0}
+    values.update((status_field(status), 0) for status, _ in PurchaseRequest.STATUS_CHOICES)
+    for status, count in requests.values_list('status').annotate(count=Count('pk')):
+        values[status_field(status)] = count
+        values['requests_total'] += count
+    return values
+
+
+def rebuild_stats(batch_size=2000):
+    """Полностью пересчитывает счётчики по таблицам избранного и заявок"""
+    from accounts.models import CustomUser
+
+    rows = {}
+
+    def row(user_id):
+        if user_id not in rows:
+            rows[user_id] = UserStats(user_id=user_id)
+        return rows[user_id]
+
+    with transaction.atomic():
+        UserStats.objects.all().delete()
+        row(None)
+        for user_id in CustomUser.objects.values_list('pk', flat=True).iterator(chunk_size=batch_size):
+            row(user_id)
+        favorites = Favorite.objects.order_by().values_list('user_id').annotate(count=Count('pk'))
+        for user_id, count in favorites:
+            for stats in (row(user_id), row(None)):
+                stats.favorites_count += count
+        requests = (
+            PurchaseRequest.objects.order_by()
+            .values_list('user_id', 'status').annotate(count=Count('pk'))
+        )
+        for user_id, status, count in requests:
+            for stats in (row(user_id), row(None)):
+                setattr(stats, status_field(status), getattr(stats, status_field(status)) + count)
+                stats.requests_total += count
+        UserStats.objects.bulk_create(rows.values(), batch_size=batch_size)
@@ -1,3 +1,736 @@
-from django.test import TestCase
+import json
+from datetime import date, datetime
+import tempfile
+import warnings
+from io import StringIO
+from pathlib import Path
+from unittest import skipUnless
 
-# Create your tests here.
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from channels.routing import URLRouter
+from PIL import Image
+from django.db import connection, transaction
+from django.core.cache import cache
+from django.core.management import call_command
+from django.http import QueryDict
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+from rest_framework.exceptions import ValidationError
+
+from accounts.models import CustomUser
+from api.serializers import BrandIdField
+from cars.cache import bump_version, inventory_version
+from cars.derivatives import available_formats, generate_derivatives
+from cars.facets import apply_filters, facet_index, filters_from_params
+from cars.listing import listing_values, rebuild_listings
+from cars.images import _store_variants, delete_variants
+from cars.importer import InventoryImporter
+from cars.live import INVENTORY_GROUP
+from cars.purchase_requests import request_filters_from_params, status_counts
+from cars.reference import BRANDS_VERSION_KEY, get_brand, get_brands
+from cars.models import Brand, Car, CarImage, CarListing, PurchaseRequest
+from cars.pagination import InvalidCursor, encode_cursor, paginate_by_created, paginate_ranked
+from cars.routing import websocket_urlpatterns
+from cars.search import LikeSearchBackend, PostgresSearchBackend, SQLiteFTSBackend, get_search_backend
+from cars.similarity import similarity_index
+from chat.testing import SocketClient
+
+LOCAL_LAYER = {'default': {'BACKEND': 'chat.layers.LocalChannelLayer'}}
+
+
+def make_car(brand, **fields):
+    return Car.objects.create(**{
+        'brand': brand, 'model': 'Rio', 'year': 2021, 'price': 1_500_000, 'color': 'Серый',
+        'transmission': 'manual', 'fuel_type': 'petrol', 'engine_volume': 1.6, 'horsepower': 123,
+        **fields,
+    })
+
+
+@override_settings(CHANNEL_LAYERS=LOCAL_LAYER)
+class LiveInventoryPublishTest(TransactionTestCase):
+    """Изменения автомобилей за транзакцию - одно сообщение в группу каталога"""
+
+    def setUp(self):
+        self.layer = get_channel_layer()
+        self.channel = async_to_sync(self.layer.new_channel)()
+        async_to_sync(self.layer.group_add)(INVENTORY_GROUP, self.channel)
+        brand = Brand.objects.create(name='Kia')
+        self.cars = [make_car(brand, model=f'Rio {i}') for i in range(4)]
+        # Вне транзакции каждое создание уходит сразу
+        self.assertEqual([message['changes'][0]['op'] for message in self._received()], ['created'] * 4)
+
+    def _received(self):
+        messages = []
+        while self.layer.channels.get(self.channel):
+            messages.append(async_to_sync(self.layer.receive)(self.channel))
+        return messages
+
+    def test_transaction_published_once_with_changed_fields(self):
+        with transaction.atomic():
+            for car in Car.objects.filter(pk__in=[car.pk for car in self.cars[:3]]):
+                car.price = 1_400_000
+                car.save()
+            sold = Car.objects.get(pk=self.cars[0].pk)
+            sold.is_sold = True
+            sold.save()
+            Car.objects.get(pk=self.cars[3].pk).delete()
+
+        messages = self._received()
+        self.assertEqual(len(messages), 1)
+        changes = {change['id']: change for change in messages[0]['changes']}
+        self.assertEqual(changes[self.cars[0].pk], {
+            'id': self.cars[0].pk, 'op': 'updated',
+            'fields': {'is_sold': True, 'price': '1400000.00'}, 'is_sold': True,
+        })
+        self.assertEqual(changes[self.cars[1].pk]['fields'], {'price': '1400000.00'})
+        self.assertEqual(changes[self.cars[3].pk]['op'], 'deleted')
+
+    def test_unchanged_save_not_published(self):
+        Car.objects.get(pk=self.cars[0].pk).save()
+        self.assertEqual(self._received(), [])
+
+    def test_rolled_back_changes_dropped(self):
+        try:
+            with transaction.atomic():
+                car = Car.objects.get(pk=self.cars[0].pk)
+                car.price = 1
+                car.save()
+                raise RuntimeError
+        except RuntimeError:
+            pass
+        car = Car.objects.get(pk=self.cars[1].pk)
+        car.mileage = 500
+        car.save()
+        self.assertEqual(
+            [message['changes'] for message in self._received()],
+            [[{'id': car.pk, 'op': 'updated', 'fields': {'mileage': 500}, 'is_sold': False}]],
+        )
+
+    def test_batch_started_in_rolled_back_savepoint(self):
+        with transaction.atomic():
+            try:
+                with transaction.atomic():
+                    car = Car.objects.get(pk=self.cars[0].pk)
+                    car.price = 1
+                    car.save()
+                    raise RuntimeError
+            except RuntimeError:
+                pass
+            car = Car.objects.get(pk=self.cars[1].pk)
+            car.mileage = 500
+            car.save()
+        self.assertEqual(
+            [message['changes'] for message in self._received()],
+            [[{'id': car.pk, 'op': 'updated', 'fields': {'mileage': 500}, 'is_sold': False}]],
+        )
+
+
+@override_settings(CHANNEL_LAYERS=LOCAL_LAYER, INVENTORY_PUSH_INTERVAL=0.1)
+class InventoryConsumerTest(TransactionTestCase):
+    def test_changes_merged_per_tick(self):
+        async def scenario():
+            socket = SocketClient(URLRouter(websocket_urlpatterns), '/ws/inventory/')
+            await socket.connect()
+            layer = get_channel_layer()
+            for price in ('1000.00', '900.00'):
+                await layer.group_send(INVENTORY_GROUP, {'type': 'inventory_changes', 'changes': [
+                    {'id': 1, 'op': 'updated', 'fields': {'price': price}, 'is_sold': False},
+                ]})
+            await layer.group_send(INVENTORY_GROUP, {'type': 'inventory_changes', 'changes': [
+                {'id': 1, 'op': 'updated', 'fields': {'mileage': 10}, 'is_sold': False},
+                {'id': 2, 'op': 'deleted', 'fields': {}, 'is_sold': True},
+            ]})
+            frame = await socket.receive_json()
+            quiet = await socket.receive_nothing(0.3)
+            await socket.disconnect()
+            return frame, quiet
+
+        frame, quiet = async_to_sync(scenario)()
+        self.assertEqual(frame['changes'], [
+            {'id': 1, 'op': 'updated', 'fields': {'price': '900.00', 'mileage': 10}, 'is_sold': False},
+            {'id': 2, 'op': 'deleted', 'fields': {}, 'is_sold': True},
+        ])
+        self.assertTrue(quiet)
+
+
+class BrandReferenceCacheTest(TestCase):
+    """Справочник марок в памяти процесса"""
+
+    @classmethod
+    def setUpTestData(cls):
+        with cls.captureOnCommitCallbacks(execute=True):
+            cls.kia = Brand.objects.create(name='Kia', country='Корея')
+            cls.audi = Brand.objects.create(name='Audi', country='Германия')
+
+    def setUp(self):
+        cache.clear()
+
+    def test_read_without_queries(self):
+        self.assertEqual([brand.name for brand in get_brands()], ['Audi', 'Kia'])
+        with self.assertNumQueries(0):
+            self.assertEqual(get_brand(self.kia.pk).country, 'Корея')
+            self.assertIsNone(get_brand(0))
+            self.assertEqual(len(get_brands()), 2)
+            self.assertEqual(BrandIdField(queryset=Brand.objects.all()).to_internal_value(str(self.audi.pk)), self.audi)
+            with self.assertRaises(ValidationError):
+                BrandIdField(queryset=Brand.objects.all()).to_internal_value(0)
+
+    def test_save_invalidates(self):
+        get_brands()
+        with self.captureOnCommitCallbacks(execute=True):
+            Brand.objects.create(name='BMW')
+        self.assertEqual([brand.name for brand in get_brands()], ['Audi', 'BMW', 'Kia'])
+
+    def test_rolled_back_change_not_cached(self):
+        get_brands()
+        try:
+            with transaction.atomic():
+                Brand.objects.create(name='BMW')
+                # Внутри транзакции видна своя незафиксированная марка
+                self.assertEqual([brand.name for brand in get_brands()], ['Audi', 'BMW', 'Kia'])
+                raise RuntimeError
+        except RuntimeError:
+            pass
+        with self.assertNumQueries(0):
+            self.assertEqual([brand.name for brand in get_brands()], ['Audi', 'Kia'])
+
+    def test_version_from_other_worker(self):
+        get_brands()
+        # Другой процесс изменил марку и поднял версию в общем кэше
+        Brand.objects.filter(pk=self.kia.pk).update(country='Южная Корея')
+        self.assertEqual(get_brand(self.kia.pk).country, 'Корея')
+        bump_version(BRANDS_VERSION_KEY)
+        self.assertEqual(get_brand(self.kia.pk).country, 'Южная Корея')
+
+
+class InventoryImportTest(TestCase):
+    """Команда import_inventory"""
+
+    HEADER = 'stock_id,brand,model,year,price,mileage,color,transmission,fuel_type,engine_volume,horsepower,images\n'
+
+    def setUp(self):
+        cache.clear()
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.root = Path(tmp.name)
+        (self.root / 'photo.jpg').write_bytes(b'jpeg')
+        media = self.settings(MEDIA_ROOT=str(self.root / 'media'))
+        media.enable()
+        self.addCleanup(media.disable)
+        Brand.objects.create(name='Kia', country='Корея')
+
+    def _import(self, name, content, **options):
+        path = self.root / name
+        path.write_text(content, encoding='utf-8')
+        stdout, stderr = StringIO(), StringIO()
+        call_command('import_inventory', str(path), images_root=str(self.root), stdout=stdout, stderr=stderr, **options)
+        return stdout.getvalue(), stderr.getvalue()
+
+    def test_csv_upsert_is_idempotent(self):
+        feed = self.HEADER + (
+            'A-1,kia,Rio,2021,1500000,10000,Серый,Механическая,petrol,1.6,123,photo.jpg\n'
+            'A-2,Haval,Jolion,2023,2100000,0,Белый,robot,Бензин,1.5,150,\n'
+            'A-3,Kia,Ceed,год,1,0,Серый,manual,petrol,1.6,123,\n'
+        )
+        stdout, stderr = self._import('feed.csv', feed, chunk_size=1)
+        self.assertIn('новых 2', stdout)
+        self.assertIn('строка 4: year', stderr)
+        # Тестовые настройки - locmem и LocalChannelLayer
+        self.assertIn('CACHES, CHANNEL_LAYERS: бэкенд в памяти процесса', stderr)
+        self.assertEqual(Brand.objects.count(), 2)
+
+        rio = Car.objects.get(stock_id='A-1')
+        self.assertEqual((rio.brand.name, rio.transmission), ('Kia', 'manual'))
+        image = CarImage.objects.get(car=rio)
+        self.assertTrue(image.is_main)
+        # Сигналы не сработали - проекция и поиск обновлены импортом
+        listing = CarListing.objects.get(car=rio)
+        self.assertEqual(listing.main_image, image.image.name)
+        self.assertIn(rio.pk, get_search_backend().search('Rio'))
+
+        stdout, _ = self._import('feed.csv', feed)
+        self.assertIn('новых 0, обновлено 0, без изменений 2', stdout)
+        self.assertEqual(CarImage.objects.count(), 1)
+
+    def test_ndjson_updates_and_sells(self):
+        make_car(Brand.objects.get(), stock_id='B-1')
+        rows = [
+            {'stock_id': 'B-1', 'brand': 'Kia', 'model': 'Rio', 'year': 2021, 'price': 1_400_000, 'color': 'Серый',
+             'transmission': 'manual', 'fuel_type': 'petrol', 'engine_volume': 1.6, 'horsepower': 123},
+            {'stock_id': 'B-2', 'brand': 'Kia', 'model': 'K5', 'year': 2022, 'price': 3_000_000, 'color': 'Черный',
+             'transmission': 'automatic', 'fuel_type': 'petrol', 'engine_volume': 2.5, 'horsepower': 194, 'is_sold': True},
+        ]
+        stdout, _ = self._import('feed.ndjson', '\n'.join(json.dumps(row) for row in rows) + '\n{broken\n')
+        self.assertIn('новых 1, обновлено 1', stdout)
+        self.assertIn('ошибок 1', stdout)
+        self.assertEqual(str(Car.objects.get(stock_id='B-1').price), '1400000.00')
+        self.assertEqual(CarListing.objects.get(car__stock_id='B-1').price, 1_400_000)
+        self.assertFalse(CarListing.objects.filter(car__stock_id='B-2').exists())
+
+    def test_indexes_reloaded_after_failed_import(self):
+        def rows():
+            yield 1, {'stock_id': 'C-1', 'brand': 'Kia', 'model': 'Rio', 'year': 2021, 'price': 1_400_000,
+                      'color': 'Серый', 'transmission': 'manual', 'fuel_type': 'petrol',
+                      'engine_volume': 1.6, 'horsepower': 123}
+            raise EOFError('лента оборвалась')
+
+        self.assertEqual(facet_index.total(), 0)
+        with self.assertRaises(EOFError):
+            InventoryImporter(chunk_size=1).run(rows())
+        # Первая пачка зафиксирована - индексы перечитываются
+        self.assertEqual(facet_index.total(), 1)
+
+
+class FacetIndexTest(TestCase):
+    """Счётчики фасетов в памяти процесса"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.kia = Brand.objects.create(name='Kia')
+        cls.bmw = Brand.objects.create(name='BMW')
+        cls.rio = make_car(cls.kia, price=900_000, year=2019)
+        cls.k5 = make_car(cls.kia, model='K5', price=2_500_000, year=2022, transmission='automatic')
+        cls.x5 = make_car(cls.bmw, model='X5', price=8_000_000, year=2022, transmission='automatic', fuel_type='diesel')
+        make_car(cls.bmw, model='X3', price=5_000_000, is_sold=True)
+
+    def setUp(self):
+        cache.clear()
+        facet_index.invalidate()
+
+    def test_counts_exclude_own_filter(self):
+        counts = facet_index.counts({'transmission': 'automatic'})
+        # Фильтр по коробке не сужает сам фасет коробки
+        self.assertEqual(counts['transmission'], {'manual': 1, 'automatic': 2})
+        self.assertEqual(counts['brand'], {self.kia.pk: 1, self.bmw.pk: 1})
+        self.assertEqual(counts['price'], {2: 1, 4: 1})
+        self.assertEqual(facet_index.total({'transmission': 'automatic'}), 2)
+        self.assertEqual(facet_index.total(), 3)
+
+    def test_ranges_and_search_ids(self):
+        filters = filters_from_params(QueryDict('min_price=1000000&max_year=2022&brand='))
+        self.assertEqual(filters, {'min_price': 1_000_000, 'max_year': 2022})
+        self.assertEqual(facet_index.total(filters), 2)
+        counts = facet_index.counts(filters, car_ids={self.k5.pk, self.rio.pk})
+        self.assertEqual(counts['brand'], {self.kia.pk: 1})
+        self.assertEqual(counts['year'], {2022: 1})
+        # Фильтр по цене не действует на ценовой фасет, поиск - действует
+        self.assertEqual(counts['price'], {0: 1, 2: 1})
+        self.assertEqual(facet_index.total(filters, car_ids={self.rio.pk}), 0)
+
+    def test_incremental_save_sell_and_delete(self):
+        facet_index.total()
+        with self.captureOnCommitCallbacks(execute=True):
+            make_car(self.bmw, model='X1', price=4_000_000)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.k5.price = 3_500_000
+            self.k5.save()
+        with self.assertNumQueries(0):
+            counts = facet_index.counts()
+        self.assertEqual(counts['brand'], {self.kia.pk: 2, self.bmw.pk: 2})
+        self.assertEqual(counts['price'], {0: 1, 3: 2, 4: 1})
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.rio.is_sold = True
+            self.rio.save()
+        with self.captureOnCommitCallbacks(execute=True):
+            Car.objects.get(pk=self.x5.pk).delete()
+        self.assertEqual(facet_index.counts()['brand'], {self.kia.pk: 1, self.bmw.pk: 1})
+        self.assertEqual(facet_index.total({'fuel_type': 'diesel'}), 0)
+
+    def test_api_list_returns_facets(self):
+        response = self.client.get('/api/cars/', {'brand': self.kia.pk})
+        self.assertEqual(response.data['count'], 2)
+        self.assertEqual(len(response.data['results']), 2)
+        self.assertEqual(
+            response.data['facets']['brand'],
+            [{'value': self.kia.pk, 'count': 2}, {'value': self.bmw.pk, 'count': 1}],
+        )
+        self.assertEqual(response.data['facets']['price'][0], {'min': 0, 'max': 1_000_000, 'count': 1})
+
+
+class SearchBackendTests:
+    """Общие проверки бэкендов поиска; наследник задаёт backend_class"""
+
+    backend_class = None
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.kia = Brand.objects.create(name='Kia', country='Корея', description='Корейские автомобили')
+        cls.toyota = Brand.objects.create(name='Toyota', country='Япония', description='Конкурент Sportage')
+        cls.rio = make_car(cls.kia, price=1_200_000)
+        cls.sportage = make_car(cls.kia, model='Sportage', price=3_000_000)
+        cls.corolla = make_car(cls.toyota, model='Corolla Rio', price=2_000_000)
+        cls.sold = make_car(cls.kia, model='Rio X', is_sold=True)
+
+    def setUp(self):
+        self.backend = self.backend_class()
+        self.backend.rebuild()
+
+    def test_search_skips_sold_and_limits(self):
+        self.assertEqual(set(self.backend.search('kia')), {self.rio.pk, self.sportage.pk})
+        self.assertEqual(len(self.backend.search('kia', limit=1)), 1)
+        self.assertEqual(len(self.backend.search('kia', limit=None)), 2)
+        self.assertEqual(self.backend.search('nothing'), [])
+
+    def test_filter_matches_combines_with_filters(self):
+        queryset = apply_filters(listing_values(), {'min_price': 1_500_000})
+        rows = self.backend.filter_matches(queryset, 'rio')
+        self.assertEqual({row['id'] for row in rows}, {self.corolla.pk})
+        self.assertFalse(self.backend.filter_matches(Car.objects.all(), 'nothing').exists())
+
+
+class LikeSearchBackendTest(SearchBackendTests, TestCase):
+    backend_class = LikeSearchBackend
+
+
+class IndexedSearchBackendTests(SearchBackendTests):
+    """Бэкенды с собственным индексом: ранжирование и синхронизация из сигналов"""
+
+    def test_model_ranked_above_description(self):
+        # Sportage - модель одного автомобиля и описание марки другого
+        self.assertEqual(self.backend.search('sportage'), [self.sportage.pk, self.corolla.pk])
+        self.assertEqual(set(self.backend.search('корейск')), {self.rio.pk, self.sportage.pk})
+
+    def test_index_follows_save_and_delete(self):
+        if get_search_backend().__class__ is not self.backend_class:
+            self.skipTest('сигналы обновляют бэкенд текущей СУБД')
+        car = make_car(self.toyota, model='Camry')
+        self.assertEqual(self.backend.search('camry'), [car.pk])
+        car.model = 'Crown'
+        car.save()
+        self.assertEqual(self.backend.search('camry'), [])
+        self.assertEqual(self.backend.search('crown'), [car.pk])
+        car.is_sold = True
+        car.save()
+        self.assertEqual(self.backend.search('crown'), [])
+        self.rio.delete()
+        self.assertEqual(self.backend.search('rio'), [self.corolla.pk])
+
+
+@skipUnless(connection.vendor == 'sqlite', 'FTS5 - только SQLite')
+class SQLiteFTSBackendTest(IndexedSearchBackendTests, TestCase):
+    backend_class = SQLiteFTSBackend
+
+
+@skipUnless(connection.vendor == 'postgresql', 'tsvector - только PostgreSQL')
+class PostgresSearchBackendTest(IndexedSearchBackendTests, TestCase):
+    backend_class = PostgresSearchBackend
+
+
+class CatalogSearchFiltersTest(TestCase):
+    """Поиск вместе с фильтрами в каталоге и /api/cars/"""
+
+    @classmethod
+    def setUpTestData(cls):
+        kia = Brand.objects.create(name='Kia')
+        cls.cheap = [make_car(kia, price=1_000_000 + i) for i in range(3)]
+        cls.expensive = [make_car(kia, model='K5', price=3_000_000 + i) for i in range(4)]
+        make_car(Brand.objects.create(name='BMW'), model='X5', price=3_500_000)
+
+    def setUp(self):
+        cache.clear()
+        facet_index.invalidate()
+
+    def test_api_search_with_price_filter(self):
+        response = self.client.get('/api/cars/', {'search': 'kia', 'min_price': 2_000_000, 'page_size': 3})
+        self.assertEqual(response.data['count'], 4)
+        ids = [car['id'] for car in response.data['results']]
+        ids += [car['id'] for car in self.client.get(response.data['next']).data['results']]
+        self.assertEqual(sorted(ids), [car.pk for car in self.expensive])
+        price_facet = {bucket['min']: bucket['count'] for bucket in response.data['facets']['price']}
+        # Ценовой фасет не сужается фильтром по цене, но сужается поиском
+        self.assertEqual(price_facet, {1_000_000: 3, 3_000_000: 4})
+
+    def test_catalog_page_search_with_filter(self):
+        response = self.client.get('/cars/', {'search': 'kia', 'max_price': 2_000_000})
+        self.assertEqual(response.context['total_cars'], 3)
+        self.assertEqual({car['id'] for car in response.context['cars']}, {car.pk for car in self.cheap})
+
+
+class KeysetPaginationTest(TestCase):
+    """Курсоры каталога: (created_at, id) и порядок релевантности"""
+
+    @classmethod
+    def setUpTestData(cls):
+        brand = Brand.objects.create(name='Kia')
+        cls.cars = [make_car(brand, model=f'Rio {i}') for i in range(7)]
+        # Четыре машины добавлены в одну и ту же секунду - порядок решает id
+        moment = timezone.now()
+        tied = [car.pk for car in cls.cars[1:5]]
+        Car.objects.filter(pk__in=tied).update(created_at=moment)
+        CarListing.objects.filter(car_id__in=tied).update(created_at=moment)
+        cls.expected = list(Car.objects.order_by('-created_at', '-pk').values_list('pk', flat=True))
+
+    def _ids(self, page):
+        return [car.pk for car in page]
+
+    def test_forward_and_backward_round_trip(self):
+        pages = [paginate_by_created(Car.objects.all(), page_size=3)]
+        while pages[-1].has_next():
+            pages.append(paginate_by_created(Car.objects.all(), pages[-1].next_cursor, page_size=3))
+        self.assertEqual([self._ids(page) for page in pages], [self.expected[:3], self.expected[3:6], self.expected[6:]])
+        self.assertFalse(pages[0].has_previous())
+
+        previous = paginate_by_created(Car.objects.all(), pages[2].previous_cursor, page_size=3)
+        self.assertEqual(self._ids(previous), self._ids(pages[1]))
+        first = paginate_by_created(Car.objects.all(), previous.previous_cursor, page_size=3)
+        self.assertEqual(self._ids(first), self._ids(pages[0]))
+        self.assertFalse(first.has_previous())
+
+    def test_invalid_cursor(self):
+        for cursor in ('garbage', encode_cursor({'d': 'x', 'i': 1}), encode_cursor({'d': 'n', 'i': 1, 'c': 'вчера'})):
+            with self.assertRaises(InvalidCursor):
+                paginate_by_created(Car.objects.all(), cursor)
+        self.assertEqual(self.client.get('/api/cars/', {'cursor': 'garbage'}).status_code, 404)
+
+    def test_ranked_pages_follow_relevance(self):
+        ranked = [car.pk for car in self.cars[::-1]]
+        queryset = Car.objects.exclude(pk=self.cars[3].pk)
+        ordered = [car_id for car_id in ranked if car_id != self.cars[3].pk]
+        with self.assertNumQueries(1):
+            first = paginate_ranked(queryset, ranked, page_size=4)
+        self.assertEqual(self._ids(first), ordered[:4])
+        self.assertFalse(first.has_previous())
+        second = paginate_ranked(queryset, ranked, first.next_cursor, page_size=4)
+        self.assertEqual(self._ids(second), ordered[4:])
+        self.assertFalse(second.has_next())
+        self.assertEqual(self._ids(paginate_ranked(queryset, ranked, second.previous_cursor, page_size=4)), ordered[:4])
+
+    def test_api_pages_over_ties(self):
+        cache.clear()
+        response = self.client.get('/api/cars/', {'page_size': 2})
+        ids = []
+        while True:
+            ids += [car['id'] for car in response.data['results']]
+            if not response.data['next']:
+                break
+            response = self.client.get(response.data['next'])
+        self.assertEqual(ids, self.expected)
+        back = self.client.get(response.data['previous'])
+        self.assertEqual([car['id'] for car in back.data['results']], self.expected[4:6])
+
+
+class ImageDerivativesTest(TestCase):
+    """WebP-копии фото и их использование в карточке каталога"""
+
+    def setUp(self):
+        cache.clear()
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.root = Path(tmp.name)
+        media = self.settings(MEDIA_ROOT=tmp.name)
+        media.enable()
+        self.addCleanup(media.disable)
+        (self.root / 'car_images').mkdir()
+        Image.new('RGB', (1000, 500), 'red').save(self.root / 'car_images/photo.jpg')
+        self.car = make_car(Brand.objects.create(name='Kia'))
+        self.image = CarImage.objects.create(car=self.car, image='car_images/photo.jpg', is_main=True)
+
+    def test_formats_checked_without_warnings(self):
+        with warnings.catch_warnings():
+            warnings.simplefilter('error')
+            self.assertIn('webp', available_formats())
+
+    def test_variants_generated_and_stored(self):
+        variants = generate_derivatives(self.root, 'car_images/photo.jpg', formats=['webp'])
+        # Уменьшается до целевой ширины, но не увеличивается
+        self.assertEqual({name: data['width'] for name, data in variants.items()}, {'thumb': 320, 'card': 640, 'full': 1000})
+        self.assertEqual(variants['card']['height'], 320)
+        self.assertTrue((self.root / variants['card']['webp']).exists())
+
+        self.assertFalse(self.image.has_variants())
+        _store_variants(self.image.pk, 'car_images/photo.jpg', variants)
+        image = CarImage.objects.get(pk=self.image.pk)
+        self.assertTrue(image.has_variants())
+        self.assertEqual(image.srcset('webp'), (
+            '/media/car_images/derived/photo.jpg_thumb.webp 320w, '
+            '/media/car_images/derived/photo.jpg_card.webp 640w, '
+            '/media/car_images/derived/photo.jpg_full.webp 1000w'
+        ))
+        self.assertEqual(image.srcset('avif'), '')
+        self.assertEqual(image.variant_url('card'), '/media/car_images/derived/photo.jpg_card.webp')
+
+    def test_same_stem_sources_do_not_share_copies(self):
+        Image.new('RGB', (100, 50), 'blue').save(self.root / 'car_images/photo.png')
+        jpg = generate_derivatives(self.root, 'car_images/photo.jpg', formats=['webp'])
+        png = generate_derivatives(self.root, 'car_images/photo.png', formats=['webp'])
+        self.assertNotEqual(jpg['card']['webp'], png['card']['webp'])
+        delete_variants(png)
+        self.assertTrue((self.root / jpg['card']['webp']).exists())
+
+    def test_command_refreshes_listing_and_version(self):
+        updated_at = Car.objects.get(pk=self.car.pk).updated_at
+        version = inventory_version()
+        call_command('generate_image_variants', workers=1, stdout=StringIO())
+        self.assertTrue(CarImage.objects.get(pk=self.image.pk).has_variants())
+        self.assertGreater(Car.objects.get(pk=self.car.pk).updated_at, updated_at)
+        listing = CarListing.objects.get(car=self.car)
+        self.assertEqual(listing.main_image_variants['card']['webp'], 'car_images/derived/photo.jpg_card.webp')
+        self.assertNotEqual(inventory_version(), version)
+
+    def test_card_falls_back_to_card_copy_not_original(self):
+        response = self.client.get('/cars/')
+        self.assertContains(response, 'src="/media/car_images/photo.jpg"')
+
+        variants = generate_derivatives(self.root, 'car_images/photo.jpg', formats=['webp'])
+        _store_variants(self.image.pk, 'car_images/photo.jpg', variants)
+        cache.clear()
+        response = self.client.get('/cars/')
+        self.assertContains(response, 'src="/media/car_images/derived/photo.jpg_card.webp"')
+        self.assertNotContains(response, 'src="/media/car_images/photo.jpg"')
+        self.assertContains(response, 'photo.jpg_thumb.webp 320w')
+
+
+class CarListingSyncTest(TestCase):
+    """Проекция каталога следует за Car, CarImage и Brand"""
+
+    def setUp(self):
+        self.brand = Brand.objects.create(name='Kia')
+        self.car = make_car(self.brand)
+
+    def _listing(self):
+        return CarListing.objects.get(car=self.car)
+
+    def test_car_save_and_sale(self):
+        self.assertEqual((self._listing().model, self._listing().brand_name), ('Rio', 'Kia'))
+        self.car.price = 1_300_000
+        self.car.save()
+        self.assertEqual(self._listing().price, 1_300_000)
+
+        self.car.is_sold = True
+        self.car.save()
+        self.assertFalse(CarListing.objects.filter(car=self.car).exists())
+        self.car.is_sold = False
+        self.car.save()
+        self.assertEqual(self._listing().price, 1_300_000)
+        self.car.delete()
+        self.assertFalse(CarListing.objects.exists())
+
+    def test_main_image_follows_images(self):
+        first = CarImage.objects.create(car=self.car, image='car_images/a.jpg')
+        self.assertEqual(self._listing().main_image, 'car_images/a.jpg')
+        CarImage.objects.create(car=self.car, image='car_images/b.jpg', is_main=True)
+        listing = self._listing()
+        self.assertEqual(listing.main_image, 'car_images/b.jpg')
+        # Смена фото поднимает updated_at - по нему версионируются карточки
+        self.assertEqual(listing.updated_at, Car.objects.get(pk=self.car.pk).updated_at)
+
+        CarImage.objects.get(image='car_images/b.jpg').delete()
+        self.assertEqual(self._listing().main_image, first.image.name)
+        first.delete()
+        self.assertEqual(self._listing().main_image, '')
+
+    def test_brand_rename_and_rebuild(self):
+        self.brand.name = 'KIA Motors'
+        self.brand.save()
+        self.assertEqual(self._listing().brand_name, 'KIA Motors')
+
+        CarListing.objects.all().delete()
+        make_car(self.brand, model='K5', is_sold=True)
+        rebuild_listings()
+        self.assertEqual(list(CarListing.objects.values_list('car_id', 'brand_name')), [(self.car.pk, 'KIA Motors')])
+
+
+class PurchaseRequestListTest(TestCase):
+    """Разбивка заявок по статусам и список с фильтрами по курсору"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.manager = CustomUser.objects.create_user(username='manager', password='secret', role='manager')
+        cls.client_user = CustomUser.objects.create_user(username='client', password='secret')
+        other = CustomUser.objects.create_user(username='other', password='secret')
+        cls.kia = Brand.objects.create(name='Kia')
+        rio = make_car(cls.kia)
+        x5 = make_car(Brand.objects.create(name='BMW'), model='X5')
+        statuses = ['new', 'new', 'approved', 'rejected', 'in_progress', 'new', 'approved']
+        cls.requests = []
+        for i, status in enumerate(statuses):
+            cls.requests.append(PurchaseRequest.objects.create(
+                user=cls.client_user if i % 2 else other, car=rio if i < 5 else x5, status=status,
+                contact_name='Пётр', contact_phone='+70000000000', contact_email='petr@example.com',
+            ))
+        # По одной заявке в день: 1-7 марта
+        for day, request in enumerate(cls.requests, start=1):
+            created_at = timezone.make_aware(datetime(2026, 3, day, 12))
+            PurchaseRequest.objects.filter(pk=request.pk).update(created_at=created_at)
+
+    def test_status_counts_single_query(self):
+        with self.assertNumQueries(1):
+            counts = status_counts(PurchaseRequest.objects.all())
+        self.assertEqual(counts, {'new': 3, 'in_progress': 1, 'approved': 2, 'rejected': 1, 'completed': 0, 'total': 7})
+        counts = status_counts(PurchaseRequest.objects.filter(user=self.client_user))
+        self.assertEqual((counts['new'], counts['approved'], counts['total']), (2, 0, 3))
+
+    def test_filters_from_params(self):
+        filters = request_filters_from_params(QueryDict('status=new&brand=x&date_from=2026-03-02&date_to=2026-13-01'))
+        self.assertEqual(filters, {'status': 'new', 'date_from': date(2026, 3, 2)})
+
+    def _pages(self, params):
+        response = self.client.get('/cars/purchase-requests/', params)
+        pages = [response]
+        while response.context['page_obj'].has_next():
+            response = self.client.get(
+                '/cars/purchase-requests/', {**params, 'cursor': response.context['page_obj'].next_cursor},
+            )
+            pages.append(response)
+        return pages
+
+    def test_filtered_cursor_pages(self):
+        self.client.force_login(self.manager)
+        pages = self._pages({'brand': self.kia.pk, 'date_from': '2026-03-02', 'date_to': '2026-03-05', 'page_size': 3})
+        self.assertEqual(
+            [[request.pk for request in page.context['purchase_requests']] for page in pages],
+            [[self.requests[4].pk, self.requests[3].pk, self.requests[2].pk], [self.requests[1].pk]],
+        )
+        # Счётчики - по всем заявкам, без фильтров
+        self.assertEqual((pages[0].context['total_requests'], pages[0].context['pending_requests']), (7, 3))
+
+        pages = self._pages({'status': 'new', 'page_size': 2})
+        self.assertEqual(
+            [request.pk for page in pages for request in page.context['purchase_requests']],
+            [self.requests[5].pk, self.requests[1].pk, self.requests[0].pk],
+        )
+
+    def test_client_sees_own_requests(self):
+        self.client.force_login(self.client_user)
+        pages = self._pages({'page_size': 2})
+        self.assertEqual(
+            [request.pk for page in pages for request in page.context['purchase_requests']],
+            [self.requests[5].pk, self.requests[3].pk, self.requests[1].pk],
+        )
+        self.assertEqual(pages[0].context['total_requests'], 3)
+
+
+class CarDetailPagesTest(TestCase):
+    """Страница автомобиля: /cars/car/<id>/ и /car/<id>/ рисуют один шаблон"""
+
+    URLS = ('/cars/car/{}/', '/car/{}/')
+
+    @classmethod
+    def setUpTestData(cls):
+        kia = Brand.objects.create(name='Kia')
+        cls.car = make_car(kia, model='Rio')
+        cls.similar = make_car(kia, model='Ceed')
+
+    def setUp(self):
+        cache.clear()
+        similarity_index.invalidate()
+
+    def test_gallery_on_both_pages(self):
+        CarImage.objects.create(car=self.car, image='car_images/rio.jpg', is_main=True)
+        for url in self.URLS:
+            with self.subTest(url=url):
+                response = self.client.get(url.format(self.car.pk))
+                self.assertContains(response, 'src="/media/car_images/rio.jpg" class="d-block w-100 car-image"')
+                self.assertNotContains(response, 'Фотографии временно недоступны')
+
+    def test_similar_cards_cached(self):
+        for url in self.URLS:
+            with self.subTest(url=url):
+                cache.clear()
+                self.assertContains(self.client.get(url.format(self.car.pk)), 'Kia Ceed')
+                # Фрагмент карточки берётся из кэша, пока не изменился updated_at
+                Car.objects.filter(pk=self.similar.pk).update(model='Sportage')
+                self.assertContains(self.client.get(url.format(self.car.pk)), 'Kia Ceed')
+                Car.objects.filter(pk=self.similar.pk).update(model='Ceed')
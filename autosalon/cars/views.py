@@ -1,91 +1,102 @@
-from django.db import models  # ← добавьте эту строку
+from django.conf import settings
+from django.db import transaction
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.mixins import LoginRequiredMixin
 from django.views.generic import ListView, CreateView, UpdateView, DetailView
 from django.urls import reverse_lazy
 from django.contrib import messages
-from django.core.paginator import Paginator, EmptyPage, PageNotAnInteger
-
-from .models import Car, Brand, PurchaseRequest, Favorite
+from django.views.decorators.http import condition
+
+from .etags import car_detail_etag
+from .facets import apply_filters, facet_index, filters_from_params, price_bucket_bounds
+from .images import images_prefetch
+from .listing import add_image_urls, listing_values
+from .models import Car, PurchaseRequest, Favorite
+from .pagination import InvalidCursor, page_size_from_params, paginate_by_created, paginate_ranked
+from .purchase_requests import (
+    apply_request_filters, notify_status_change, request_filters_from_params, status_counts,
+)
+from .reference import FUEL_LABELS, TRANSMISSION_LABELS, get_brands
+from .search import get_search_backend
+from .similarity import get_similar_cars
 from .forms import PurchaseRequestForm, PurchaseRequestUpdateForm
 
 
-def home(request):
-    """Главная страница - список автомобилей с поиском и фильтрацией"""
+def _query_without_cursor(request):
+    """Текущие GET-параметры каталога без курсора страницы"""
+    params = request.GET.copy()
+    params.pop('cursor', None)
+    params.pop('page', None)
+    return params.urlencode()
 
-    # Получаем все автомобили (которые не проданы)
-    cars = Car.objects.filter(is_sold=False).select_related('brand')
 
-    # Получаем все марки для фильтрации
-    brands = Brand.objects.all()
+def home(request):
+    """Главная страница - список автомобилей с поиском и фильтрацией"""
 
-    # Инициализируем переменные поиска
-    search_query = ''
-    min_price = ''
-    max_price = ''
-    min_year = ''
-    max_year = ''
+    # Карточки непроданных автомобилей - строки проекции каталога (dict, без моделей)
+    cars = listing_values()
 
-    # --- ФИЛЬТРАЦИЯ ПО МАРКЕ ---
-    brand_filter = request.GET.get('brand')
-    if brand_filter:
-        cars = cars.filter(brand_id=brand_filter)
+    # Все марки для фильтрации - из справочника в памяти процесса
+    brands = get_brands()
 
-    # --- ПОИСК ПО МОДЕЛИ И МАРКЕ ---
+    # Значения полей формы поиска (для повторного отображения)
     search_query = request.GET.get('search', '')
-    if search_query:
-        cars = cars.filter(
-            models.Q(model__icontains=search_query) |
-            models.Q(brand__name__icontains=search_query)
-        )
-
-    # --- ФИЛЬТРАЦИЯ ПО ЦЕНЕ ---
+    brand_filter = request.GET.get('brand')
     min_price = request.GET.get('min_price', '')
     max_price = request.GET.get('max_price', '')
-
-    if min_price and min_price.isdigit():
-        cars = cars.filter(price__gte=int(min_price))
-
-    if max_price and max_price.isdigit():
-        cars = cars.filter(price__lte=int(max_price))
-
-    # --- ФИЛЬТРАЦИЯ ПО ГОДУ ---
     min_year = request.GET.get('min_year', '')
     max_year = request.GET.get('max_year', '')
-
-    if min_year and min_year.isdigit():
-        cars = cars.filter(year__gte=int(min_year))
-
-    if max_year and max_year.isdigit():
-        cars = cars.filter(year__lte=int(max_year))
-
-    # --- ФИЛЬТРАЦИЯ ПО ТИПУ КОРОБКИ ПЕРЕДАЧ ---
     transmission_filter = request.GET.get('transmission')
-    if transmission_filter:
-        cars = cars.filter(transmission=transmission_filter)
-
-    # --- ФИЛЬТРАЦИЯ ПО ТИПУ ТОПЛИВА ---
     fuel_filter = request.GET.get('fuel')
-    if fuel_filter:
-        cars = cars.filter(fuel_type=fuel_filter)
-
-    # Сортируем по дате добавления (новые сверху)
-    cars = cars.order_by('-created_at')
-
-    # Подсчитываем общее количество после фильтрации
-    total_cars = cars.count()
 
-    # --- ПАГИНАЦИЯ ---
-    page = request.GET.get('page', 1)
-    paginator = Paginator(cars, 6)  # 6 автомобилей на странице
+    # --- ФИЛЬТРАЦИЯ ПО МАРКЕ, ЦЕНЕ, ГОДУ, КОРОБКЕ И ТОПЛИВУ ---
+    active_filters = filters_from_params(request.GET)
+    cars = apply_filters(cars, active_filters)
 
+    # --- ПОЛНОТЕКСТОВЫЙ ПОИСК ПО МОДЕЛИ И МАРКЕ ---
+    search_ids = None
+    if search_query:
+        backend = get_search_backend()
+        # Все совпадения, отсортированные по релевантности: фильтры и счётчики
+        # применяются к полной выдаче, а не к её началу
+        ranked_ids = backend.search(search_query, limit=None)
+        search_ids = set(ranked_ids)
+        cars = backend.filter_matches(cars, search_query)
+
+    # --- СЧЁТЧИКИ ДЛЯ ПАНЕЛИ ФИЛЬТРОВ (из фасетного индекса, без запросов к cars_car) ---
+    facets = facet_index.counts(active_filters, car_ids=search_ids)
+    brand_options = [(brand, facets['brand'].get(brand.id, 0)) for brand in brands]
+    transmission_options = [
+        (value, label, facets['transmission'].get(value, 0))
+        for value, label in Car.TRANSMISSION_CHOICES
+    ]
+    fuel_options = [
+        (value, label, facets['fuel_type'].get(value, 0))
+        for value, label in Car.FUEL_CHOICES
+    ]
+    year_options = sorted(facets['year'].items(), reverse=True)
+    price_options = [
+        (*price_bucket_bounds(bucket), count)
+        for bucket, count in sorted(facets['price'].items())
+    ]
+
+    # Общее количество после фильтрации - из фасетного индекса, без COUNT(*)
+    total_cars = facet_index.total(active_filters, car_ids=search_ids)
+
+    # --- KEYSET-ПАГИНАЦИЯ ---
+    # Без поиска - по дате добавления (новые сверху), с поиском - по релевантности
+    cursor = request.GET.get('cursor')
+    page_size = page_size_from_params(request.GET)
     try:
-        cars = paginator.page(page)
-    except PageNotAnInteger:
-        cars = paginator.page(1)
-    except EmptyPage:
-        cars = paginator.page(paginator.num_pages)
+        if search_query:
+            cars = paginate_ranked(cars, ranked_ids, cursor, page_size=page_size)
+        else:
+            cars = paginate_by_created(cars, cursor, page_size=page_size)
+    except InvalidCursor:
+        return redirect(f"{request.path}?{_query_without_cursor(request)}")
+
+    add_image_urls(cars.object_list)
 
     # Передаем данные в шаблон
     context = {
@@ -102,13 +113,20 @@ def home(request):
         'total_cars': total_cars,
         'TRANSMISSION_CHOICES': Car.TRANSMISSION_CHOICES,
         'FUEL_CHOICES': Car.FUEL_CHOICES,
-        'paginator': paginator,
+        'brand_options': brand_options,
+        'transmission_options': transmission_options,
+        'fuel_options': fuel_options,
+        'year_options': year_options,
+        'price_options': price_options,
         'page_obj': cars,
+        'query_without_cursor': _query_without_cursor(request),
+        'card_cache_timeout': settings.CAR_CARD_CACHE_TIMEOUT,
     }
 
     return render(request, 'cars/home.html', context)
 
 
+@condition(etag_func=car_detail_etag)
 def car_detail(request, car_id):
     """Страница с подробной информацией об автомобиле"""
 
@@ -120,16 +138,15 @@ def car_detail(request, car_id):
         images = car.images.all()
 
         # Получаем основной вариант передачи (для удобства)
-        transmission_display = dict(Car.TRANSMISSION_CHOICES).get(car.transmission, car.transmission)
+        transmission_display = TRANSMISSION_LABELS.get(car.transmission, car.transmission)
 
         # Получаем основной вариант топлива (для удобства)
-        fuel_display = dict(Car.FUEL_CHOICES).get(car.fuel_type, car.fuel_type)
+        fuel_display = FUEL_LABELS.get(car.fuel_type, car.fuel_type)
 
-        # Получаем похожие автомобили (той же марки, но не проданные)
-        similar_cars = list(Car.objects.filter(
-            brand=car.brand,
-            is_sold=False
-        ).exclude(id=car.id).order_by('?')[:3])  # 3 случайных авто
+        # Похожие непроданные автомобили (ближайшие по характеристикам, сначала той же марки)
+        similar_cars = get_similar_cars(
+            car, 3, queryset=Car.objects.select_related('brand').prefetch_related(images_prefetch())
+        )
 
         # Проверяем, добавлен ли автомобиль в избранное
         is_favorite = False
@@ -143,6 +160,7 @@ def car_detail(request, car_id):
             'fuel_display': fuel_display,
             'similar_cars': similar_cars,
             'is_favorite': is_favorite,
+            'card_cache_timeout': settings.CAR_CARD_CACHE_TIMEOUT,
         }
 
         return render(request, 'cars/car_detail.html', context)
@@ -185,23 +203,42 @@ def purchase_request_list(request):
     """Список заявок пользователя"""
     if request.user.is_manager():
         # Менеджеры видят все заявки
-        purchase_requests = PurchaseRequest.objects.all().select_related('user', 'car', 'car__brand')
+        purchase_requests = PurchaseRequest.objects.all()
     else:
         # Обычные пользователи видят только свои заявки
-        purchase_requests = PurchaseRequest.objects.filter(user=request.user).select_related('car', 'car__brand')
-
-    # Подсчитываем статистику по статусам
-    total_requests = purchase_requests.count()
-    pending_requests = purchase_requests.filter(status='new').count()
-    approved_requests = purchase_requests.filter(status='approved').count()
-    rejected_requests = purchase_requests.filter(status='rejected').count()
+        purchase_requests = PurchaseRequest.objects.filter(user=request.user)
+
+    # Статистика по статусам - один агрегирующий запрос по всем заявкам (без фильтров)
+    stats = status_counts(purchase_requests)
+
+    # --- ФИЛЬТРЫ И KEYSET-ПАГИНАЦИЯ ---
+    active_filters = request_filters_from_params(request.GET)
+    page_queryset = (
+        apply_request_filters(purchase_requests, active_filters)
+        .select_related('user', 'car', 'car__brand')
+        .prefetch_related(images_prefetch('car__images'))
+    )
+    try:
+        page = paginate_by_created(
+            page_queryset, request.GET.get('cursor'), page_size_from_params(request.GET, default=20)
+        )
+    except InvalidCursor:
+        return redirect(f"{request.path}?{_query_without_cursor(request)}")
 
     return render(request, 'cars/purchase_request_list.html', {
-        'purchase_requests': purchase_requests,
-        'total_requests': total_requests,
-        'pending_requests': pending_requests,
-        'approved_requests': approved_requests,
-        'rejected_requests': rejected_requests,
+        'purchase_requests': page,
+        'page_obj': page,
+        'total_requests': stats['total'],
+        'pending_requests': stats['new'],
+        'approved_requests': stats['approved'],
+        'rejected_requests': stats['rejected'],
+        'brands': get_brands(),
+        'STATUS_CHOICES': PurchaseRequest.STATUS_CHOICES,
+        'status_filter': active_filters.get('status', ''),
+        'brand_filter': active_filters.get('brand'),
+        'date_from': request.GET.get('date_from', ''),
+        'date_to': request.GET.get('date_to', ''),
+        'query_without_cursor': _query_without_cursor(request),
     })
 
 
@@ -233,32 +270,16 @@ def update_purchase_request(request, pk):
         messages.error(request, 'У вас нет прав для выполнения этого действия')
         return redirect('cars:purchase_request_list')
 
-    purchase_request = get_object_or_404(PurchaseRequest, pk=pk)
+    purchase_request = get_object_or_404(PurchaseRequest.objects.select_related('car__brand'), pk=pk)
 
     if request.method == 'POST':
         form = PurchaseRequestUpdateForm(request.POST, instance=purchase_request)
         if form.is_valid():
             old_status = purchase_request.status
-            form.save()
-
-            # Отправка уведомления пользователю (если есть система уведомлений)
-            try:
-                from notifications.models import Notification
-                new_status_display = purchase_request.get_status_display()
-                old_status_display = dict(PurchaseRequest.STATUS_CHOICES)[old_status]
-
-                message = f"Статус вашей заявки на {purchase_request.car.brand.name} {purchase_request.car.model} изменен с '{old_status_display}' на '{new_status_display}'"
-                if purchase_request.manager_comment:
-                    message += f". Комментарий менеджера: {purchase_request.manager_comment}"
-
-                Notification.objects.create(
-                    user=purchase_request.user,
-                    title='Изменение статуса заявки',
-                    message=message,
-                    notification_type='request_status_update'
-                )
-            except ImportError:
-                pass  # Если модуль уведомлений не найден, пропускаем
+            # Уведомление попадает в очередь доставки вместе с изменением заявки
+            with transaction.atomic():
+                form.save()
+                notify_status_change(purchase_request, old_status)
 
             messages.success(request, 'Заявка успешно обновлена')
             return redirect('cars:purchase_request_detail', pk=pk)
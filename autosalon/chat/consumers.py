@@ -1,29 +1,113 @@
 import json
+import time
+
+from channels.db import database_sync_to_async
 from channels.generic.websocket import AsyncWebsocketConsumer
+from django.utils import timezone
+
+from .history import chats_for
+from .models import Message
+from .persistence import get_buffer
+from .presence import SNAPSHOT_TTL, get_tracker, group_name, merge_snapshots
+
+MAX_MESSAGE_LENGTH = 4000
 
 
 class ChatConsumer(AsyncWebsocketConsumer):
+    """
+    От клиента: {"message": ...} - сообщение, {"type": "typing", "active": true|false} -
+    набор текста, {"type": "ping"} - heartbeat. Клиенту: {"type": "message", ...} и
+    {"type": "presence", "users": [...]} - только при изменении (см. chat.presence).
+    """
+
     async def connect(self):
-        self.chat_id = self.scope['url_route']['kwargs']['chat_id']
-        self.chat_group_name = f'chat_{self.chat_id}'
+        self.chat_id = int(self.scope['url_route']['kwargs']['chat_id'])
+        self.chat_group_name = group_name(self.chat_id)
+        self.user = self.scope.get('user')
+        self.presence = None
+        self.node_snapshots = {}
+        self.sent_presence = None
+
+        if not await self.has_access():
+            await self.close()
+            return
 
         await self.channel_layer.group_add(
             self.chat_group_name,
             self.channel_name
         )
         await self.accept()
+        self.presence = get_tracker(self.channel_layer)
+        self.presence.join(self.chat_id, self.channel_name, self.user)
+
+    @database_sync_to_async
+    def has_access(self):
+        """Клиент - в своём чате, менеджер - в любом"""
+        if self.user is None or not self.user.is_authenticated:
+            return False
+        return chats_for(self.user).filter(pk=self.chat_id).exists()
+
+    async def disconnect(self, close_code):
+        if self.presence is not None:
+            self.presence.leave(self.chat_id, self.channel_name)
+        if hasattr(self, 'chat_group_name') and self.channel_layer is not None:
+            await self.channel_layer.group_discard(self.chat_group_name, self.channel_name)
+        # Несохранённые сообщения этого сокета пишутся сразу, не дожидаясь таймера
+        await get_buffer().flush_for(self.channel_name)
 
     async def receive(self, text_data):
         text_data_json = json.loads(text_data)
-        message = text_data_json['message']
+        event_type = text_data_json.get('type', 'message')
+        if event_type == 'ping':
+            self.presence.heartbeat(self.chat_id, self.channel_name)
+            return
+        if event_type == 'typing':
+            self.presence.typing(self.chat_id, self.channel_name, bool(text_data_json.get('active', True)))
+            return
+
+        message = str(text_data_json.get('message', '')).strip()[:MAX_MESSAGE_LENGTH]
+        if not message:
+            return
+        # Сообщение отправлено - индикатор набора гаснет
+        self.presence.typing(self.chat_id, self.channel_name, active=False)
 
-        # Сохраняем сообщение в БД
-        # Отправляем уведомление через Telegram
+        # Сохраняем сообщение в БД - пачкой, не задерживая рассылку
+        timestamp = timezone.now()
+        get_buffer().add(Message(
+            chat_id=self.chat_id, sender_id=self.user.pk, content=message, timestamp=timestamp,
+        ), owner=self.channel_name)
 
         await self.channel_layer.group_send(
             self.chat_group_name,
             {
                 'type': 'chat_message',
-                'message': message
+                'message': message,
+                'sender_id': self.user.pk,
+                'sender': self.user.get_username(),
+                'timestamp': timestamp.isoformat(),
             }
-        )
\ No newline at end of file
+        )
+
+    async def chat_message(self, event):
+        await self.send(text_data=json.dumps({
+            'type': 'message',
+            'message': event['message'],
+            'sender_id': event['sender_id'],
+            'sender': event['sender'],
+            'timestamp': event['timestamp'],
+        }))
+
+    async def presence_snapshot(self, event):
+        now = time.monotonic()
+        self.node_snapshots[event['node']] = (event['users'], now)
+        self.node_snapshots = {
+            node: snapshot for node, snapshot in self.node_snapshots.items() if now - snapshot[1] < SNAPSHOT_TTL
+        }
+        users = merge_snapshots(self.node_snapshots)
+        if users != self.sent_presence:
+            self.sent_presence = users
+            await self.send(text_data=json.dumps({'type': 'presence', 'users': users}))
+
+    async def presence_evict(self, event):
+        """Heartbeat не приходил - соединение считается оборванным"""
+        await self.close()
@@ -0,0 +1,111 @@
+"""
+История сообщений чата и счётчики непрочитанного.
+
+Сообщения сохраняются пачками (chat.persistence) через save_messages: в
+той же транзакции чатам увеличиваются счётчики непрочитанного и
+сдвигается last_activity_at. Счётчиков два: client_unread - сообщения
+клиенту от менеджеров, manager_unread - сообщения клиента, общие для
+всех менеджеров. Сообщения нельзя создавать в обход save_messages -
+счётчики разойдутся с is_read.
+"""
+from collections import Counter, defaultdict
+
+from django.db import transaction
+from django.db.models import Case, F, OuterRef, PositiveIntegerField, Q, Subquery, Sum, When
+from django.db.models.functions import Coalesce, Greatest
+
+from .models import Message, SupportChat
+
+
+def chats_for(user):
+    """Чаты, доступные пользователю: клиенту - свои, менеджеру - все"""
+    chats = SupportChat.objects.all()
+    if not user.is_manager():
+        chats = chats.filter(Q(user=user) | Q(manager=user))
+    return chats
+
+
+def last_message(field='content'):
+    """Подзапрос: поле последнего сообщения чата (индекс chat, timestamp, id)"""
+    return Subquery(
+        Message.objects.filter(chat=OuterRef('pk')).order_by('-timestamp', '-pk').values(field)[:1]
+    )
+
+
+def manager_inbox():
+    """Активные чаты от последней активности к давней, с последним сообщением - один запрос"""
+    return (
+        SupportChat.objects.filter(is_active=True)
+        .select_related('user', 'manager')
+        .annotate(last_message=last_message())
+    )
+
+
+def _increment(field, counts):
+    # Чаты с одинаковым приростом - одной веткой CASE
+    chats_by_delta = defaultdict(list)
+    for chat_id, delta in counts.items():
+        chats_by_delta[delta].append(chat_id)
+    if not chats_by_delta:
+        return F(field)
+    return Case(
+        *(When(pk__in=chat_ids, then=F(field) + delta) for delta, chat_ids in chats_by_delta.items()),
+        default=F(field),
+        output_field=PositiveIntegerField(),
+    )
+
+
+def save_messages(messages):
+    """Сохраняет пачку Message: INSERT сообщений и один UPDATE их чатов"""
+    if not messages:
+        return
+    with transaction.atomic():
+        Message.objects.bulk_create(messages)
+        clients = dict(
+            SupportChat.objects.filter(pk__in={message.chat_id for message in messages})
+            .values_list('pk', 'user_id')
+        )
+        to_client, to_manager = Counter(), Counter()
+        for message in messages:
+            if message.sender_id == clients.get(message.chat_id):
+                to_manager[message.chat_id] += 1
+            else:
+                to_client[message.chat_id] += 1
+        SupportChat.objects.filter(pk__in=list(clients)).update(
+            client_unread=_increment('client_unread', to_client),
+            manager_unread=_increment('manager_unread', to_manager),
+            last_activity_at=last_message('timestamp'),
+        )
+
+
+def mark_read(chat, user, up_to):
+    """
+    Отмечает прочитанными сообщения собеседника в chat до сообщения up_to
+    включительно (в порядке истории) одним UPDATE и уменьшает счётчик
+    читающей стороны. Возвращает число отмеченных сообщений.
+    """
+    timestamp = Message.objects.filter(chat=chat, pk=up_to).values_list('timestamp', flat=True).first()
+    if timestamp is None:
+        return 0
+    if user.pk == chat.user_id:
+        incoming, counter = ~Q(sender_id=chat.user_id), 'client_unread'
+    else:
+        incoming, counter = Q(sender_id=chat.user_id), 'manager_unread'
+    with transaction.atomic():
+        marked = (
+            Message.objects.filter(incoming, chat=chat, is_read=False)
+            .filter(Q(timestamp__lt=timestamp) | Q(timestamp=timestamp, pk__lte=up_to))
+            .update(is_read=True)
+        )
+        if marked:
+            SupportChat.objects.filter(pk=chat.pk).update(**{counter: Greatest(F(counter) - marked, 0, output_field=PositiveIntegerField())})
+    return marked
+
+
+def unread_total(user):
+    """Всего непрочитанных: клиенту - по его чатам, менеджеру - по активным"""
+    if user.is_manager():
+        total = SupportChat.objects.filter(is_active=True).aggregate(total=Coalesce(Sum('manager_unread'), 0))
+    else:
+        total = SupportChat.objects.filter(user=user).aggregate(total=Coalesce(Sum('client_unread'), 0))
+    return total['total']
@@ -0,0 +1,37 @@
+"""
+Слой каналов в памяти процесса для одного воркера.
+
+InMemoryChannelLayer из channels перед каждым send/receive/group_send
+обходит все каналы и группы в поисках просроченного (_clean_expired) -
+на тысяче сокетов рассылка в чат становится квадратичной. Срок жизни
+сообщений здесь - десятки секунд, поэтому уборка раз в
+cleanup_interval секунд ничего не меняет по смыслу. group_send кладёт
+сообщение в очереди напрямую, без отдельной задачи на каждый канал.
+"""
+import time
+
+from channels.exceptions import ChannelFull
+from channels.layers import InMemoryChannelLayer
+
+
+class LocalChannelLayer(InMemoryChannelLayer):
+    def __init__(self, cleanup_interval=1.0, **kwargs):
+        super().__init__(**kwargs)
+        self.cleanup_interval = cleanup_interval
+        self._cleaned_at = 0.0
+
+    def _clean_expired(self):
+        now = time.monotonic()
+        if now - self._cleaned_at >= self.cleanup_interval:
+            self._cleaned_at = now
+            super()._clean_expired()
+
+    async def group_send(self, group, message):
+        assert isinstance(message, dict), 'Message is not a dict'
+        self.require_valid_group_name(group)
+        self._clean_expired()
+        for channel in list(self.groups.get(group, ())):
+            try:
+                await self.send(channel, message)
+            except ChannelFull:
+                pass
@@ -0,0 +1,88 @@
+import asyncio
+import statistics
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.module_loading import import_string
+
+
+class Command(BaseCommand):
+    help = (
+        'Замеряет задержку рассылки по группам (group_send) в слое каналов: '
+        'groups групп по members каналов, в каждом раунде - сообщение в каждую '
+        'группу. По умолчанию - слой из CHANNEL_LAYERS, --backend/--hosts '
+        'позволяют сравнить с другим (например, локальным Redis).'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--backend', help='Класс слоя каналов (по умолчанию - из CHANNEL_LAYERS)')
+        parser.add_argument('--hosts', help='Адреса сервера слоя через запятую, например redis://127.0.0.1:6379')
+        parser.add_argument('--groups', type=int, default=100, help='Сколько групп (чатов)')
+        parser.add_argument('--members', type=int, default=10, help='Каналов (сокетов) в группе')
+        parser.add_argument('--rounds', type=int, default=20, help='Сколько раз разослать во все группы')
+
+    def handle(self, *args, **options):
+        config = dict(settings.CHANNEL_LAYERS['default'])
+        backend = options['backend'] or config['BACKEND']
+        layer_config = dict(config.get('CONFIG', {}))
+        if options['hosts']:
+            layer_config['hosts'] = options['hosts'].split(',')
+        try:
+            layer = import_string(backend)(**layer_config)
+        except ImportError as exc:
+            raise CommandError(f'Слой каналов {backend} недоступен: {exc}')
+
+        latencies, elapsed = asyncio.run(self._run(layer, options))
+        delivered = len(latencies)
+        latencies.sort()
+        self.stdout.write(
+            f'{backend}: {options["groups"]} групп x {options["members"]} каналов, {options["rounds"]} раундов'
+        )
+        self.stdout.write(
+            f'Доставлено {delivered} за {elapsed:.2f} с ({delivered / elapsed:.0f} сообщ./с), задержка '
+            f'p50 {statistics.median(latencies) * 1000:.1f} мс, '
+            f'p95 {latencies[int(delivered * 0.95)] * 1000:.1f} мс, '
+            f'p99 {latencies[int(delivered * 0.99)] * 1000:.1f} мс, '
+            f'макс. {latencies[-1] * 1000:.1f} мс'
+        )
+
+    async def _run(self, layer, options):
+        groups = [f'bench_{i}' for i in range(options['groups'])]
+        channels = []
+        for group in groups:
+            for _ in range(options['members']):
+                channel = await layer.new_channel()
+                await layer.group_add(group, channel)
+                channels.append(channel)
+
+        latencies = []
+        # Раунд завершён, когда сообщение получили все каналы
+        remaining = [len(channels)] * options['rounds']
+        done = [asyncio.Event() for _ in range(options['rounds'])]
+
+        async def listen(channel):
+            for _ in range(options['rounds']):
+                message = await layer.receive(channel)
+                latencies.append(time.perf_counter() - message['sent'])
+                remaining[message['round']] -= 1
+                if not remaining[message['round']]:
+                    done[message['round']].set()
+
+        listeners = [asyncio.create_task(listen(channel)) for channel in channels]
+
+        started = time.perf_counter()
+        try:
+            for round_number in range(options['rounds']):
+                await asyncio.gather(*(
+                    layer.group_send(group, {'type': 'bench', 'round': round_number, 'sent': time.perf_counter()})
+                    for group in groups
+                ))
+                await asyncio.wait_for(done[round_number].wait(), 60)
+            elapsed = time.perf_counter() - started
+        finally:
+            for task in listeners:
+                task.cancel()
+            if hasattr(layer, 'flush'):
+                await layer.flush()
+        return latencies, elapsed
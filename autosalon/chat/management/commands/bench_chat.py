@@ -0,0 +1,100 @@
+import asyncio
+import os
+import tempfile
+import time
+
+from channels.routing import URLRouter
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import override_settings
+
+from accounts.models import CustomUser
+from chat.models import Message, SupportChat
+from chat.routing import websocket_urlpatterns
+from chat.testing import SocketClient
+
+LOCAL_LAYER = {'default': {'BACKEND': 'chat.layers.LocalChannelLayer', 'CONFIG': {'capacity': 1000}}}
+
+
+class Command(BaseCommand):
+    help = (
+        'Замеряет пропускную способность чата: сокеты попарно (клиент и менеджер) '
+        'обмениваются сообщениями, сравнивается запись по одному сообщению и пачками. '
+        'Работает на временной тестовой базе, рабочие данные не затрагиваются.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sockets', type=int, default=1000, help='Сколько сокетов (по два на чат)')
+        parser.add_argument('--messages', type=int, default=10, help='Сообщений от каждого сокета')
+        parser.add_argument(
+            '--flush-size', type=int, nargs='+', default=[1, 200],
+            help='Значения CHAT_FLUSH_SIZE для замера (1 - INSERT на каждое сообщение)'
+        )
+
+    def handle(self, *args, **options):
+        with tempfile.TemporaryDirectory() as directory:
+            if connection.vendor == 'sqlite':
+                # Тестовая SQLite по умолчанию в памяти - там INSERT почти ничего не стоит
+                connection.settings_dict['TEST']['NAME'] = os.path.join(directory, 'bench_chat.sqlite3')
+            old_name = connection.settings_dict['NAME']
+            connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+            try:
+                self._bench(options)
+            finally:
+                connection.creation.destroy_test_db(old_name, verbosity=0)
+
+    def _bench(self, options):
+        pairs = self._populate(options['sockets'] // 2)
+        sent = len(pairs) * 2 * options['messages']
+        self.stdout.write(f'{len(pairs) * 2} сокетов, {sent} сообщений')
+        self.stdout.write(
+            f'{"flush size":<12}{"время, с":>10}{"доставлено/с":>15}{"сохранено/с":>14}{"сохранено":>12}'
+        )
+        for flush_size in options['flush_size']:
+            Message.objects.all().delete()
+            with override_settings(
+                CHANNEL_LAYERS=LOCAL_LAYER, CHAT_FLUSH_SIZE=flush_size, CHAT_FLUSH_INTERVAL=0.5,
+            ):
+                delivered, delivered_in, persisted_in = asyncio.run(self._run(pairs, options['messages']))
+            persisted = Message.objects.count()
+            self.stdout.write(
+                f'{flush_size:<12}{persisted_in:>10.2f}{delivered / delivered_in:>15.0f}'
+                f'{persisted / persisted_in:>14.0f}{persisted:>12}'
+            )
+
+    def _populate(self, count):
+        clients = CustomUser.objects.bulk_create(
+            CustomUser(username=f'client{i}', email=f'client{i}@example.com') for i in range(count)
+        )
+        managers = CustomUser.objects.bulk_create(
+            CustomUser(username=f'manager{i}', email=f'manager{i}@example.com', role='manager') for i in range(count)
+        )
+        chats = SupportChat.objects.bulk_create(
+            SupportChat(user=client, manager=manager) for client, manager in zip(clients, managers)
+        )
+        return [(chat, client, manager) for chat, client, manager in zip(chats, clients, managers)]
+
+    async def _run(self, pairs, messages):
+        """Возвращает (доставлено, время доставки, время до записи последнего сообщения)"""
+        application = URLRouter(websocket_urlpatterns)
+        sockets = []
+        for chat, client, manager in pairs:
+            for user in (client, manager):
+                socket = SocketClient(application, f'/ws/chat/{chat.pk}/', user)
+                await socket.connect(timeout=10)
+                sockets.append(socket)
+        # Каждое сообщение получают оба участника чата
+        expected = len(sockets) * messages * 2
+
+        async def talk(socket):
+            for i in range(messages):
+                await socket.send_json({'message': f'Сообщение {i}'})
+            for _ in range(messages * 2):
+                await socket.receive_json(timeout=60)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(talk(socket) for socket in sockets))
+        delivered_in = time.perf_counter() - started
+        # Отключение сбрасывает буфер - дожидаемся записи всех сообщений
+        await asyncio.gather(*(socket.disconnect(timeout=60) for socket in sockets))
+        return expected, delivered_in, time.perf_counter() - started
@@ -0,0 +1,117 @@
+"""
+Аутентификация WebSocket-соединений чата.
+
+Браузер не может передать заголовок Authorization при открытии сокета,
+поэтому access-токен JWT принимается в строке запроса (?token=...); другие
+клиенты могут прислать заголовок Authorization: Bearer. Без токена
+пользователь берётся из сессии Django (cookie sessionid).
+
+Пользователь по id кэшируется на USER_CACHE_TIMEOUT секунд: волна
+переподключений (перезапуск сервера, обрыв сети) не превращается в
+тысячи одинаковых запросов к таблице пользователей. Кэш сбрасывается при
+сохранении пользователя (chat/signals.py). В общий кэш попадают только
+поля, которые читает чат, и хеш для проверки сессии - не объект
+пользователя с хешем пароля; scope['user'] - несохраняемая модель из них.
+"""
+from urllib.parse import parse_qs
+
+from channels.db import database_sync_to_async
+from channels.middleware import BaseMiddleware
+from channels.sessions import CookieMiddleware, SessionMiddleware
+from django.contrib.auth import BACKEND_SESSION_KEY, HASH_SESSION_KEY, SESSION_KEY, get_user_model
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import cache
+from django.utils.crypto import constant_time_compare
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import AccessToken
+
+USER_CACHE_TIMEOUT = 60
+
+
+def user_cache_key(user_id):
+    return f'chat:ws-user:{user_id}'
+
+
+def _user_data(user_id):
+    """Поля активного пользователя для чата (из кэша или БД) или None"""
+    key = user_cache_key(user_id)
+    data = cache.get(key)
+    if data is None:
+        user = get_user_model().objects.filter(pk=user_id, is_active=True).first()
+        if user is None:
+            return None
+        data = {
+            'pk': user.pk,
+            'username': user.get_username(),
+            'role': user.role,
+            'session_auth_hash': user.get_session_auth_hash(),
+        }
+        cache.set(key, data, USER_CACHE_TIMEOUT)
+    return data
+
+
+def _user(data):
+    user_model = get_user_model()
+    return user_model(**{'pk': data['pk'], user_model.USERNAME_FIELD: data['username'], 'role': data['role']})
+
+
+def cached_user(user_id):
+    """Активный пользователь по id или None"""
+    data = _user_data(user_id)
+    return _user(data) if data is not None else None
+
+
+def _token(scope):
+    token = parse_qs(scope.get('query_string', b'').decode()).get('token')
+    if token:
+        return token[0]
+    for name, value in scope.get('headers', []):
+        if name == b'authorization':
+            scheme, _, credentials = value.decode().partition(' ')
+            if scheme.lower() == 'bearer':
+                return credentials.strip()
+    return None
+
+
+def _user_from_token(token):
+    try:
+        user_id = AccessToken(token)[api_settings.USER_ID_CLAIM]
+    except (TokenError, KeyError):
+        return None
+    return cached_user(user_id)
+
+
+def _user_from_session(session):
+    user_id = session.get(SESSION_KEY)
+    if user_id is None or BACKEND_SESSION_KEY not in session:
+        return None
+    data = _user_data(get_user_model()._meta.pk.to_python(user_id))
+    # Как django.contrib.auth.get_user: после смены пароля сессия недействительна
+    if data is None or not constant_time_compare(session.get(HASH_SESSION_KEY, ''), data['session_auth_hash']):
+        return None
+    return _user(data)
+
+
+@database_sync_to_async
+def get_scope_user(scope):
+    token = _token(scope)
+    if token:
+        user = _user_from_token(token)
+    elif 'session' in scope:
+        user = _user_from_session(scope['session'])
+    else:
+        user = None
+    return user or AnonymousUser()
+
+
+class WebsocketAuthMiddleware(BaseMiddleware):
+    """Кладёт в scope['user'] пользователя из JWT или сессии"""
+
+    async def __call__(self, scope, receive, send):
+        scope = dict(scope, user=await get_scope_user(scope))
+        return await super().__call__(scope, receive, send)
+
+
+def WebsocketAuthMiddlewareStack(inner):
+    return CookieMiddleware(SessionMiddleware(WebsocketAuthMiddleware(inner)))
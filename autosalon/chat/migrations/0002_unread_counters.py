@@ -0,0 +1,62 @@
+# Generated by Django 6.0 on 2026-10-18 14:20
+
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def populate_counters(apps, schema_editor):
+    """Счётчики непрочитанного и last_activity_at по уже сохранённым сообщениям"""
+    SupportChat = apps.get_model('chat', 'SupportChat')
+    Message = apps.get_model('chat', 'Message')
+    db_alias = schema_editor.connection.alias
+
+    unread = Message.objects.using(db_alias).filter(chat=OuterRef('pk'), is_read=False).order_by().values('chat')
+    latest = Message.objects.using(db_alias).filter(chat=OuterRef('pk')).order_by('-timestamp').values('timestamp')[:1]
+    SupportChat.objects.using(db_alias).update(
+        # Клиенту - сообщения менеджеров, менеджерам - сообщения клиента
+        client_unread=Coalesce(
+            Subquery(unread.exclude(sender=OuterRef('user')).annotate(count=Count('pk')).values('count')), 0,
+        ),
+        manager_unread=Coalesce(
+            Subquery(unread.filter(sender=OuterRef('user')).annotate(count=Count('pk')).values('count')), 0,
+        ),
+        last_activity_at=Coalesce(Subquery(latest), F('created_at')),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='supportchat',
+            name='client_unread',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='supportchat',
+            name='last_activity_at',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        migrations.AddField(
+            model_name='supportchat',
+            name='manager_unread',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddIndex(
+            model_name='message',
+            index=models.Index(fields=['chat', 'timestamp', 'id'], name='chat_messag_chat_id_89d5ad_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='supportchat',
+            index=models.Index(fields=['is_active', 'last_activity_at', 'id'], name='chat_suppor_is_acti_8a666c_idx'),
+        ),
+        migrations.RunPython(populate_counters, migrations.RunPython.noop),
+    ]
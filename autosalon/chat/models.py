@@ -1,5 +1,6 @@
 from django.db import models
 from django.contrib.auth import get_user_model
+from django.utils import timezone
 
 User = get_user_model()
 
@@ -10,10 +11,32 @@ class SupportChat(models.Model):
     manager = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, related_name='managed_chats')
     is_active = models.BooleanField(default=True)
     created_at = models.DateTimeField(auto_now_add=True)
+    # Счётчики непрочитанного ведёт chat.history: клиенту - от менеджеров,
+    # менеджерам - от клиента
+    client_unread = models.PositiveIntegerField(default=0)
+    manager_unread = models.PositiveIntegerField(default=0)
+    # Время последнего сообщения (до первого - время создания чата)
+    last_activity_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            # Входящие менеджера: активные чаты по последней активности
+            models.Index(fields=['is_active', 'last_activity_at', 'id']),
+        ]
+
+    def unread_for(self, user):
+        return self.client_unread if user.pk == self.user_id else self.manager_unread
 
 class Message(models.Model):
     chat = models.ForeignKey(SupportChat, on_delete=models.CASCADE)
     sender = models.ForeignKey(User, on_delete=models.CASCADE)
     content = models.TextField()
-    timestamp = models.DateTimeField(auto_now_add=True)
-    is_read = models.BooleanField(default=False)
\ No newline at end of file
+    # Время отправки задаёт consumer: в БД сообщение попадает позже, пачкой
+    timestamp = models.DateTimeField(default=timezone.now)
+    is_read = models.BooleanField(default=False)
+
+    class Meta:
+        indexes = [
+            # История чата по курсору и «прочитано до сообщения X»
+            models.Index(fields=['chat', 'timestamp', 'id']),
+        ]
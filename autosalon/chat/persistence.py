@@ -0,0 +1,125 @@
+"""
+Отложенная запись сообщений чата (write-behind).
+
+ChatConsumer рассылает сообщение участникам сразу, а в БД его кладёт
+через MessageBuffer: сообщения копятся в памяти процесса и пишутся одной
+пачкой (chat.history.save_messages), когда их набралось CHAT_FLUSH_SIZE или прошло
+CHAT_FLUSH_INTERVAL секунд с первого несохранённого. Цикл событий не
+ждёт INSERT на каждое сообщение.
+
+Отключение клиента сбрасывает буфер, только если в нём есть сообщения
+этого сокета (flush_for): переподключения без сообщений не сводят пачки к
+одиночным INSERT. Остальное дописывается по таймеру и при остановке
+сервера (lifespan.shutdown, см. lifespan ниже).
+
+Пачка, которую не удалось записать, возвращается в начало очереди и
+пишется со следующей; после MAX_WRITE_ATTEMPTS неудач подряд она
+отбрасывается с ошибкой в журнале.
+"""
+import asyncio
+import logging
+import weakref
+
+from channels.db import database_sync_to_async
+from django.conf import settings
+
+from .history import save_messages
+
+logger = logging.getLogger(__name__)
+
+MAX_WRITE_ATTEMPTS = 3
+
+# Буфер на цикл событий: таймер сброса привязан к своему циклу
+_buffers = weakref.WeakKeyDictionary()
+
+
+class MessageBuffer:
+    def __init__(self, max_size=None, max_delay=None):
+        self.max_size = max_size or settings.CHAT_FLUSH_SIZE
+        self.max_delay = max_delay if max_delay is not None else settings.CHAT_FLUSH_INTERVAL
+        self._pending = []
+        # Сокеты, чьи сообщения ждут записи
+        self._owners = set()
+        self._timer = None
+        self._writes = set()
+        self._failures = 0
+
+    def __len__(self):
+        return len(self._pending)
+
+    def add(self, message, owner=None):
+        """Ставит несохранённый Message в очередь на запись; owner - имя канала сокета"""
+        self._pending.append(message)
+        if owner is not None:
+            self._owners.add(owner)
+        if len(self._pending) >= self.max_size:
+            self._start_flush()
+        else:
+            self._arm_timer()
+
+    def _arm_timer(self):
+        if self._timer is None:
+            self._timer = asyncio.get_running_loop().call_later(self.max_delay, self._start_flush)
+
+    def _start_flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        self._owners.clear()
+        if batch:
+            task = asyncio.get_running_loop().create_task(self._write(batch))
+            self._writes.add(task)
+            task.add_done_callback(self._writes.discard)
+
+    async def _write(self, batch):
+        try:
+            await database_sync_to_async(save_messages)(batch)
+        except Exception:
+            self._failures += 1
+            if self._failures >= MAX_WRITE_ATTEMPTS:
+                self._failures = 0
+                logger.exception('Не удалось сохранить %s сообщений чата - пачка отброшена', len(batch))
+                return
+            logger.exception('Не удалось сохранить %s сообщений чата - повтор со следующей пачкой', len(batch))
+            self._pending[:0] = batch
+            self._arm_timer()
+        else:
+            self._failures = 0
+
+    async def flush(self):
+        """Записывает всё накопленное и дожидается уже начатых записей"""
+        self._start_flush()
+        if self._writes:
+            await asyncio.gather(*list(self._writes))
+
+    async def flush_for(self, owner):
+        """Сокет закрывается: если в буфере есть его сообщения, буфер пишется сразу"""
+        if owner in self._owners:
+            await self.flush()
+
+
+def get_buffer():
+    loop = asyncio.get_running_loop()
+    buffer = _buffers.get(loop)
+    if buffer is None:
+        buffer = _buffers[loop] = MessageBuffer()
+    return buffer
+
+
+async def flush_all():
+    buffer = _buffers.get(asyncio.get_running_loop())
+    if buffer is not None:
+        await buffer.flush()
+
+
+async def lifespan(scope, receive, send):
+    """ASGI lifespan: при остановке сервера несохранённые сообщения дописываются в БД"""
+    while True:
+        event = await receive()
+        if event['type'] == 'lifespan.startup':
+            await send({'type': 'lifespan.startup.complete'})
+        elif event['type'] == 'lifespan.shutdown':
+            await flush_all()
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
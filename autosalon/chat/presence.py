@@ -0,0 +1,168 @@
+"""
+Присутствие и индикатор «печатает...» в чате поддержки.
+
+События клавиатуры не уходят в слой каналов по одному. Состояние
+участников хранит PresenceTracker процесса (по одному на цикл событий,
+как буфер сообщений): typing от сокета лишь продлевает признак на
+TYPING_TIMEOUT секунд. Раз в CHAT_PRESENCE_TICK секунд трекер рассылает в
+группы чатов, где что-то изменилось, снимок - кто в чате и кто печатает.
+Один group_send на чат за тик, сколько бы событий ни пришло.
+
+Клиент раз в несколько секунд шлёт {"type": "ping"}; сокет, молчащий
+дольше HEARTBEAT_TIMEOUT, считается оборванным - трекер убирает его из
+снимка и просит consumer закрыть соединение.
+
+При нескольких воркерах каждый видит только свои сокеты: снимок помечен
+узлом (NODE_ID), consumer объединяет снимки узлов. Непустой снимок узел
+повторяет раз в SNAPSHOT_REFRESH секунд, а снимок, не обновлявшийся
+SNAPSHOT_TTL секунд (узел упал), consumer отбрасывает.
+"""
+import asyncio
+import logging
+import time
+import uuid
+import weakref
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+TYPING_TIMEOUT = 5.0
+HEARTBEAT_TIMEOUT = 45.0
+SNAPSHOT_REFRESH = 30.0
+SNAPSHOT_TTL = SNAPSHOT_REFRESH * 2 + 5
+
+NODE_ID = uuid.uuid4().hex[:12]
+
+_trackers = weakref.WeakKeyDictionary()
+
+
+def group_name(chat_id):
+    return f'chat_{chat_id}'
+
+
+class _Socket:
+    __slots__ = ('user_id', 'username', 'is_manager', 'seen_at', 'typing_until')
+
+    def __init__(self, user):
+        self.user_id = user.pk
+        self.username = user.get_username()
+        self.is_manager = user.is_manager()
+        self.seen_at = time.monotonic()
+        self.typing_until = 0.0
+
+
+class PresenceTracker:
+    def __init__(self, channel_layer, tick=None):
+        self.channel_layer = channel_layer
+        self.tick = tick or settings.CHAT_PRESENCE_TICK
+        self.snapshots_sent = 0
+        self._chats = {}
+        self._dirty = set()
+        self._sent_at = {}
+        self._task = None
+
+    def join(self, chat_id, channel_name, user):
+        self._chats.setdefault(chat_id, {})[channel_name] = _Socket(user)
+        self._changed(chat_id)
+
+    def leave(self, chat_id, channel_name):
+        if self._chats.get(chat_id, {}).pop(channel_name, None) is not None:
+            self._changed(chat_id)
+
+    def heartbeat(self, chat_id, channel_name):
+        socket = self._chats.get(chat_id, {}).get(channel_name)
+        if socket is not None:
+            socket.seen_at = time.monotonic()
+
+    def typing(self, chat_id, channel_name, active=True):
+        """Нажатие клавиши (active) или отправка/очистка поля ввода"""
+        socket = self._chats.get(chat_id, {}).get(channel_name)
+        if socket is None:
+            return
+        now = time.monotonic()
+        socket.seen_at = now
+        was_typing = socket.typing_until > now
+        socket.typing_until = now + TYPING_TIMEOUT if active else 0.0
+        # Повторные нажатия только продлевают признак - в снимок не попадают
+        if was_typing != active:
+            self._changed(chat_id)
+
+    def snapshot(self, chat_id):
+        """Участники чата на этом узле; несколько вкладок пользователя - одна запись"""
+        now = time.monotonic()
+        users = {}
+        for socket in self._chats.get(chat_id, {}).values():
+            user = users.setdefault(socket.user_id, {
+                'user_id': socket.user_id,
+                'username': socket.username,
+                'is_manager': socket.is_manager,
+                'typing': False,
+            })
+            user['typing'] = user['typing'] or socket.typing_until > now
+        return sorted(users.values(), key=lambda user: user['user_id'])
+
+    def _changed(self, chat_id):
+        self._dirty.add(chat_id)
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def _run(self):
+        try:
+            while self._chats or self._dirty:
+                await asyncio.sleep(self.tick)
+                await self._tick()
+        finally:
+            self._task = None
+
+    async def _tick(self):
+        now = time.monotonic()
+        for chat_id, sockets in list(self._chats.items()):
+            for channel_name, socket in list(sockets.items()):
+                if now - socket.seen_at > HEARTBEAT_TIMEOUT:
+                    del sockets[channel_name]
+                    self._dirty.add(chat_id)
+                    await self._send(self.channel_layer.send, channel_name, {'type': 'presence_evict'})
+                elif socket.typing_until and socket.typing_until <= now:
+                    socket.typing_until = 0.0
+                    self._dirty.add(chat_id)
+            if sockets and now - self._sent_at.get(chat_id, now) >= SNAPSHOT_REFRESH:
+                self._dirty.add(chat_id)
+
+        dirty, self._dirty = self._dirty, set()
+        for chat_id in dirty:
+            await self._send(self.channel_layer.group_send, group_name(chat_id), {
+                'type': 'presence_snapshot',
+                'node': NODE_ID,
+                'users': self.snapshot(chat_id),
+            })
+            self.snapshots_sent += 1
+            if self._chats.get(chat_id):
+                self._sent_at[chat_id] = now
+            else:
+                self._chats.pop(chat_id, None)
+                self._sent_at.pop(chat_id, None)
+
+    async def _send(self, method, target, message):
+        try:
+            await method(target, message)
+        except Exception:
+            logger.exception('Не удалось разослать присутствие в %s', target)
+
+
+def get_tracker(channel_layer):
+    loop = asyncio.get_running_loop()
+    tracker = _trackers.get(loop)
+    if tracker is None or tracker.channel_layer is not channel_layer:
+        tracker = _trackers[loop] = PresenceTracker(channel_layer)
+    return tracker
+
+
+def merge_snapshots(snapshots):
+    """Объединяет снимки узлов {node: (users, получен)} в один список пользователей"""
+    users = {}
+    for node_users, _ in snapshots.values():
+        for user in node_users:
+            merged = users.setdefault(user['user_id'], dict(user))
+            merged['typing'] = merged['typing'] or user['typing']
+    return sorted(users.values(), key=lambda user: user['user_id'])
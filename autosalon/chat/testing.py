@@ -0,0 +1,44 @@
+"""
+Клиент WebSocket для тестов и замеров чата поверх asgiref ApplicationCommunicator
+(channels.testing тянет за собой daphne, который серверу не нужен).
+"""
+import asyncio
+import json
+
+from asgiref.testing import ApplicationCommunicator
+
+
+class SocketClient(ApplicationCommunicator):
+    def __init__(self, application, path, user=None, query_string=b'', headers=None):
+        scope = {
+            'type': 'websocket',
+            'path': path,
+            'query_string': query_string,
+            'headers': headers or [],
+            'subprotocols': [],
+        }
+        if user is not None:
+            scope['user'] = user
+        super().__init__(application, scope)
+
+    async def connect(self, timeout=1):
+        await self.send_input({'type': 'websocket.connect'})
+        response = await self.receive_output(timeout)
+        return response['type'] == 'websocket.accept'
+
+    async def send_json(self, data):
+        await self.send_input({'type': 'websocket.receive', 'text': json.dumps(data)})
+
+    async def receive_json(self, timeout=1):
+        response = await self.receive_output(timeout)
+        return json.loads(response['text'])
+
+    async def receive_nothing(self, timeout=0.1):
+        """Ничего не пришло за timeout секунд (receive_output по таймауту завершает приложение)"""
+        if self.output_queue.empty():
+            await asyncio.sleep(timeout)
+        return self.output_queue.empty()
+
+    async def disconnect(self, code=1000, timeout=1):
+        await self.send_input({'type': 'websocket.disconnect', 'code': code})
+        await self.wait(timeout)
@@ -1,3 +1,242 @@
-from django.test import TestCase
+import asyncio
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import async_to_sync
+from asgiref.testing import ApplicationCommunicator
+from channels.db import database_sync_to_async
+from channels.routing import URLRouter
+from django.core.cache import cache
+from django.db import DatabaseError, connection
+from django.test import TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework_simplejwt.tokens import AccessToken
+
+from accounts.models import CustomUser
+from chat.middleware import WebsocketAuthMiddlewareStack, get_scope_user, user_cache_key
+from chat.models import Message, SupportChat
+from chat.persistence import MAX_WRITE_ATTEMPTS, MessageBuffer, lifespan
+from chat.routing import websocket_urlpatterns
+from chat.testing import SocketClient
+
+LOCAL_LAYER = {'default': {'BACKEND': 'chat.layers.LocalChannelLayer'}}
+
+
+@override_settings(CHANNEL_LAYERS=LOCAL_LAYER, CHAT_FLUSH_SIZE=3, CHAT_FLUSH_INTERVAL=60, CHAT_PRESENCE_TICK=60)
+class ChatWriteBehindTest(TransactionTestCase):
+    """Сообщения рассылаются сразу, а в БД пишутся пачками"""
+
+    def setUp(self):
+        self.client_user = CustomUser.objects.create_user(username='client', password='secret')
+        self.manager = CustomUser.objects.create_user(username='manager', password='secret', role='manager')
+        self.stranger = CustomUser.objects.create_user(username='stranger', password='secret')
+        self.chat = SupportChat.objects.create(user=self.client_user)
+
+    async def _connect(self, user):
+        socket = SocketClient(URLRouter(websocket_urlpatterns), f'/ws/chat/{self.chat.pk}/', user)
+        return socket, await socket.connect()
+
+    async def _message_count(self):
+        return await database_sync_to_async(Message.objects.count)()
+
+    async def _wait_for_messages(self, count, timeout=1):
+        """Запись пачки идёт в фоне - ждём, пока в БД окажется count сообщений"""
+        deadline = asyncio.get_running_loop().time() + timeout
+        while (current := await self._message_count()) < count and asyncio.get_running_loop().time() < deadline:
+            await asyncio.sleep(0.01)
+        return current
+
+    async def _shutdown(self):
+        server = ApplicationCommunicator(lifespan, {'type': 'lifespan'})
+        await server.send_input({'type': 'lifespan.startup'})
+        await server.receive_output(1)
+        await server.send_input({'type': 'lifespan.shutdown'})
+        self.assertEqual((await server.receive_output(1))['type'], 'lifespan.shutdown.complete')
+
+    def test_broadcast_then_batched_and_flushed_on_shutdown(self):
+        async def scenario():
+            client, _ = await self._connect(self.client_user)
+            manager, _ = await self._connect(self.manager)
+            for i in range(4):
+                await client.send_json({'message': f'Вопрос {i}'})
+                received = await manager.receive_json()
+                self.assertEqual((received['message'], received['sender']), (f'Вопрос {i}', 'client'))
+                await client.receive_json()
+            # Первые три ушли одной пачкой по размеру, четвёртое ждёт таймера
+            by_size = await self._wait_for_messages(3)
+            await asyncio.sleep(0.05)
+            # У менеджера несохранённых сообщений нет - его отключение буфер не трогает
+            await manager.disconnect()
+            after_manager = await self._message_count()
+
+            # Остановка сервера дописывает буфер
+            await self._shutdown()
+            after_shutdown = await self._message_count()
+
+            # Отключение автора дописывает его сообщения сразу
+            await client.send_json({'message': 'Вопрос 4'})
+            await client.receive_json()
+            await client.disconnect()
+            return by_size, after_manager, after_shutdown, await self._message_count()
+
+        self.assertEqual(async_to_sync(scenario)(), (3, 3, 4, 5))
+        self.assertEqual(
+            list(Message.objects.order_by('timestamp').values_list('content', flat=True)),
+            [f'Вопрос {i}' for i in range(5)],
+        )
+        self.chat.refresh_from_db()
+        self.assertEqual((self.chat.manager_unread, self.chat.client_unread), (5, 0))
+
+    @override_settings(CHAT_FLUSH_INTERVAL=0.1)
+    def test_flushed_by_timer(self):
+        async def scenario():
+            client, _ = await self._connect(self.client_user)
+            await client.send_json({'message': 'Здравствуйте'})
+            await client.receive_json()
+            right_after = await self._message_count()
+            written = await self._wait_for_messages(1)
+            await client.disconnect()
+            return right_after, written
+
+        self.assertEqual(async_to_sync(scenario)(), (0, 1))
+
+    def test_failed_write_requeued_then_dropped(self):
+        async def scenario():
+            buffer = MessageBuffer()
+            buffer.add(Message(chat_id=self.chat.pk, sender_id=self.client_user.pk, content='Вопрос'))
+            with mock.patch('chat.persistence.save_messages', side_effect=DatabaseError):
+                with self.assertLogs('chat.persistence', 'ERROR'):
+                    await buffer.flush()
+            # Пачка вернулась в очередь и пишется следующим сбросом
+            requeued = len(buffer)
+            await buffer.flush()
+            written = await self._message_count()
+
+            buffer.add(Message(chat_id=self.chat.pk, sender_id=self.client_user.pk, content='Ещё'))
+            with mock.patch('chat.persistence.save_messages', side_effect=DatabaseError):
+                with self.assertLogs('chat.persistence', 'ERROR') as logs:
+                    for _ in range(MAX_WRITE_ATTEMPTS):
+                        await buffer.flush()
+            return requeued, written, len(buffer), logs.output[-1]
+
+        requeued, written, left, last_log = async_to_sync(scenario)()
+        self.assertEqual((requeued, written, left), (1, 1, 0))
+        self.assertIn('пачка отброшена', last_log)
+
+    def test_foreign_chat_rejected(self):
+        async def scenario():
+            _, connected = await self._connect(self.stranger)
+            return connected
+
+        self.assertFalse(async_to_sync(scenario)())
+
+
+@override_settings(CHANNEL_LAYERS=LOCAL_LAYER)
+class WebsocketAuthTest(TransactionTestCase):
+    """Пользователь сокета - из JWT в строке запроса, с кэшем по id"""
+
+    def setUp(self):
+        cache.clear()
+        self.client_user = CustomUser.objects.create_user(username='client', password='secret')
+        self.chat = SupportChat.objects.create(user=self.client_user)
+        self.application = WebsocketAuthMiddlewareStack(URLRouter(websocket_urlpatterns))
+
+    def _connect(self, token):
+        async def scenario():
+            socket = SocketClient(
+                self.application, f'/ws/chat/{self.chat.pk}/', query_string=f'token={token}'.encode(),
+            )
+            connected = await socket.connect()
+            if connected:
+                await socket.disconnect()
+            return connected
+
+        with CaptureQueriesContext(connection) as queries:
+            connected = async_to_sync(scenario)()
+        user_queries = sum('FROM "accounts_customuser"' in q['sql'] for q in queries.captured_queries)
+        return connected, user_queries
+
+    def test_jwt_user_cached_between_connections(self):
+        token = str(AccessToken.for_user(self.client_user))
+        self.assertEqual(self._connect(token), (True, 1))
+        self.assertEqual(self._connect(token), (True, 0))
+        # Изменение пользователя сбрасывает кэш
+        self.client_user.save()
+        self.assertEqual(self._connect(token), (True, 1))
+
+    def test_cache_holds_no_password_hash(self):
+        self._connect(str(AccessToken.for_user(self.client_user)))
+        self.assertEqual(set(cache.get(user_cache_key(self.client_user.pk))), {'pk', 'username', 'role', 'session_auth_hash'})
+
+    def test_session_user_checked_against_auth_hash(self):
+        self.client.force_login(self.client_user)
+        session = self.client.session
+        self.assertEqual(async_to_sync(get_scope_user)({'session': session}).pk, self.client_user.pk)
+        self.assertFalse(async_to_sync(get_scope_user)({'session': session}).is_manager())
+        # Смена пароля сбрасывает кэш и делает сессию недействительной
+        self.client_user.set_password('changed')
+        self.client_user.save()
+        self.assertFalse(async_to_sync(get_scope_user)({'session': session}).is_authenticated)
+
+    def test_invalid_token_rejected(self):
+        self.assertEqual(self._connect('garbage'), (False, 0))
+
+
+@override_settings(CHANNEL_LAYERS=LOCAL_LAYER, CHAT_PRESENCE_TICK=0.05)
+class PresenceTest(TransactionTestCase):
+    """Набор текста и присутствие рассылаются снимками раз в тик, а не на каждое событие"""
+
+    def setUp(self):
+        self.client_user = CustomUser.objects.create_user(username='client', password='secret')
+        self.manager = CustomUser.objects.create_user(username='manager', password='secret', role='manager')
+        self.chat = SupportChat.objects.create(user=self.client_user)
+
+    async def _connect(self, user):
+        socket = SocketClient(URLRouter(websocket_urlpatterns), f'/ws/chat/{self.chat.pk}/', user)
+        await socket.connect()
+        return socket
+
+    async def _presence(self, socket):
+        """Все снимки присутствия, пришедшие сокету за пару тиков"""
+        await asyncio.sleep(0.2)
+        snapshots = []
+        while not await socket.receive_nothing(0):
+            snapshots.append((await socket.receive_json())['users'])
+        return snapshots
+
+    def test_keystrokes_coalesced_into_snapshots(self):
+        async def scenario():
+            manager = await self._connect(self.manager)
+            client = await self._connect(self.client_user)
+            joined = await self._presence(manager)
+            for _ in range(50):
+                await client.send_json({'type': 'typing'})
+            typing = await self._presence(manager)
+            await client.send_json({'type': 'typing', 'active': False})
+            stopped = await self._presence(manager)
+            await client.disconnect()
+            await manager.disconnect()
+            return joined, typing, stopped
+
+        joined, typing, stopped = async_to_sync(scenario)()
+        self.assertEqual([[user['username'] for user in users] for users in joined][-1], ['client', 'manager'])
+        # 50 нажатий - один снимок
+        self.assertEqual([[user['typing'] for user in users] for users in typing], [[True, False]])
+        self.assertEqual([[user['typing'] for user in users] for users in stopped], [[False, False]])
+
+    def test_silent_socket_evicted(self):
+        async def scenario():
+            manager = await self._connect(self.manager)
+            client = await self._connect(self.client_user)
+            with mock.patch('chat.presence.HEARTBEAT_TIMEOUT', 0.3):
+                for _ in range(5):
+                    await asyncio.sleep(0.1)
+                    await manager.send_json({'type': 'ping'})
+                closed = await client.receive_output(1)
+                while closed['type'] != 'websocket.close':
+                    closed = await client.receive_output(1)
+                users = (await self._presence(manager))[-1]
+            await manager.disconnect()
+            return users
+
+        users = async_to_sync(scenario)()
+        self.assertEqual([user['username'] for user in users], ['manager'])
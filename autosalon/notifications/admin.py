@@ -1,3 +1,13 @@
 from django.contrib import admin
 
-# Register your models here.
+from .models import Notification
+
+
+@admin.register(Notification)
+class NotificationAdmin(admin.ModelAdmin):
+    list_display = ('user', 'title', 'notification_type', 'is_read', 'delivery_status', 'attempts', 'created_at')
+    list_filter = ('notification_type', 'is_read', 'delivery_status')
+    search_fields = ('user__username', 'title', 'message')
+    list_select_related = ('user',)
+    raw_id_fields = ('user',)
+    readonly_fields = ('attempts', 'delivered_at', 'last_error')
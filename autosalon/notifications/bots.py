@@ -0,0 +1,120 @@
+"""
+Отправители сообщений для воркера уведомлений.
+
+У отправителя три корутины: start(), send(chat_id, text) и stop().
+send() сообщает о неудаче исключениями ниже - воркер по ним решает,
+повторять ли попытку и когда.
+"""
+import asyncio
+import random
+import time
+from collections import deque
+
+
+class DeliveryError(Exception):
+    """Временная ошибка: попытка будет повторена с нарастающей паузой"""
+
+
+class PermanentDeliveryError(DeliveryError):
+    """Повтор не поможет (бот заблокирован, чат не найден)"""
+
+
+class RetryLater(DeliveryError):
+    """Telegram просит подождать retry_after секунд (flood control)"""
+
+    def __init__(self, retry_after):
+        super().__init__(f'retry after {retry_after}s')
+        self.retry_after = retry_after
+
+
+class TelegramSender:
+    """
+    Отправка через python-telegram-bot. Все сообщения идут через один пул
+    keep-alive соединений (pool_size - не меньше числа одновременных отправок)
+    """
+
+    def __init__(self, token, pool_size=20):
+        from telegram import Bot
+        from telegram.request import HTTPXRequest
+
+        self.bot = Bot(token=token, request=HTTPXRequest(connection_pool_size=pool_size))
+
+    async def start(self):
+        await self.bot.initialize()
+
+    async def stop(self):
+        await self.bot.shutdown()
+
+    async def send(self, chat_id, text):
+        from telegram import error
+
+        try:
+            await self.bot.send_message(chat_id=chat_id, text=text, parse_mode='HTML')
+        except error.RetryAfter as exc:
+            retry_after = exc.retry_after
+            if hasattr(retry_after, 'total_seconds'):
+                retry_after = retry_after.total_seconds()
+            raise RetryLater(retry_after) from exc
+        except (error.Forbidden, error.BadRequest) as exc:
+            raise PermanentDeliveryError(str(exc)) from exc
+        except error.TelegramError as exc:
+            raise DeliveryError(str(exc)) from exc
+
+
+class FakeBot:
+    """
+    Локальная замена Telegram для тестов и замеров пропускной способности:
+    каждое сообщение «идёт» latency секунд, доля failure_rate - временные
+    ошибки. С global_limit/chat_limit (сообщений в секунду) ведёт себя как
+    flood control Telegram: превышение - RetryLater (ответ 429).
+    """
+
+    def __init__(self, latency=0.05, failure_rate=0.0, seed=None, global_limit=None, chat_limit=None):
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.global_limit = global_limit
+        self.chat_limit = chat_limit
+        self.sent = 0
+        self.failed = 0
+        self.rate_limited = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._random = random.Random(seed)
+        self._recent = deque()
+        self._chat_last = {}
+
+    def _check_flood(self, chat_id):
+        now = time.monotonic()
+        if self.global_limit:
+            while self._recent and now - self._recent[0] >= 1:
+                self._recent.popleft()
+            if len(self._recent) >= self.global_limit:
+                self.rate_limited += 1
+                raise RetryLater(1)
+            self._recent.append(now)
+        if self.chat_limit:
+            last = self._chat_last.get(chat_id)
+            # Небольшой допуск на неточность таймеров цикла событий
+            if last is not None and now - last < 1 / self.chat_limit * 0.95:
+                self.rate_limited += 1
+                raise RetryLater(1)
+            self._chat_last[chat_id] = now
+
+    async def start(self):
+        pass
+
+    async def stop(self):
+        pass
+
+    async def send(self, chat_id, text):
+        self._check_flood(chat_id)
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            await asyncio.sleep(self.latency)
+        finally:
+            self.in_flight -= 1
+        if self._random.random() < self.failure_rate:
+            self.failed += 1
+            raise DeliveryError('fake failure')
+        self.sent += 1
@@ -0,0 +1,147 @@
+"""
+Отправка сообщений в Telegram с учётом лимитов.
+
+DeliveryEngine оборачивает отправителя (notifications/bots.py):
+- не более concurrency отправок одновременно (asyncio.Semaphore);
+- token bucket на весь бот (Telegram: ~30 сообщений в секунду) и на
+  каждый чат (~1 сообщение в секунду). Корзина чата - единичная, её
+  отсчёт идёт от фактического момента отправки, так что ожидание общей
+  корзины не сокращает паузу между сообщениями одному чату;
+- ответ 429 (RetryLater) приостанавливает все отправки на retry_after
+  секунд, после чего сообщение отправляется повторно;
+- метрики: число отправок, 429, ошибок, темп и задержка ответа Telegram.
+"""
+import asyncio
+import statistics
+import time
+from collections import deque
+
+from .bots import RetryLater
+
+
+class TokenBucket:
+    """rate токенов в секунду, не больше burst про запас"""
+
+    def __init__(self, rate, burst=1):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = burst
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def is_idle(self):
+        self._refill()
+        return self._tokens >= self.burst
+
+    async def acquire(self):
+        # Ожидающие обслуживаются по очереди, без гонки за освободившийся токен
+        async with self._lock:
+            self._refill()
+            if self._tokens < 1:
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+                self._refill()
+            self._tokens -= 1
+
+
+class DeliveryMetrics:
+    # Перцентили считаются по последним отправкам
+    LATENCY_SAMPLES = 10_000
+
+    def __init__(self):
+        self.started = time.monotonic()
+        self.sent = 0
+        self.failed = 0
+        self.rate_limited = 0
+        self.latencies = deque(maxlen=self.LATENCY_SAMPLES)
+
+    def summary(self):
+        elapsed = time.monotonic() - self.started
+        latencies = sorted(self.latencies)
+        return {
+            'sent': self.sent,
+            'failed': self.failed,
+            'rate_limited': self.rate_limited,
+            'rate': self.sent / elapsed if elapsed else 0.0,
+            'p50_ms': statistics.median(latencies) * 1000 if latencies else 0.0,
+            'p95_ms': latencies[int(len(latencies) * 0.95)] * 1000 if latencies else 0.0,
+        }
+
+
+class _ChatSlot:
+    """Корзина чата ёмкостью в одно сообщение; lock выстраивает его сообщения в очередь"""
+    __slots__ = ('lock', 'next_at')
+
+    def __init__(self):
+        self.lock = asyncio.Lock()
+        self.next_at = 0.0
+
+    def is_idle(self):
+        return not self.lock.locked() and self.next_at <= time.monotonic()
+
+
+class DeliveryEngine:
+    # Состояний отдельных чатов больше этого - выбрасываем простаивающие
+    MAX_CHAT_SLOTS = 10_000
+
+    def __init__(self, sender, concurrency=20, global_rate=25, global_burst=5, chat_rate=1, max_retries=3):
+        self.sender = sender
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.global_bucket = TokenBucket(global_rate, global_burst)
+        self.chat_interval = 1 / chat_rate
+        self.max_retries = max_retries
+        self.metrics = DeliveryMetrics()
+        self._chat_slots = {}
+        self._resume_at = 0.0
+
+    async def start(self):
+        await self.sender.start()
+
+    async def stop(self):
+        await self.sender.stop()
+
+    def _chat_slot(self, chat_id):
+        slot = self._chat_slots.get(chat_id)
+        if slot is None:
+            if len(self._chat_slots) >= self.MAX_CHAT_SLOTS:
+                self._chat_slots = {key: value for key, value in self._chat_slots.items() if not value.is_idle()}
+            slot = self._chat_slots[chat_id] = _ChatSlot()
+        return slot
+
+    async def _wait_until(self, moment):
+        delay = moment - time.monotonic()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    async def send(self, chat_id, text):
+        """Отправляет сообщение, соблюдая лимиты; ошибки отправителя пробрасываются"""
+        slot = self._chat_slot(chat_id)
+        # Очередь чата ждёт вне семафора - слоты остальных чатов не заняты
+        async with slot.lock:
+            await self._wait_until(slot.next_at)
+            async with self.semaphore:
+                for attempt in range(self.max_retries + 1):
+                    await self._wait_until(self._resume_at)
+                    await self.global_bucket.acquire()
+                    started = time.monotonic()
+                    slot.next_at = started + self.chat_interval
+                    try:
+                        await self.sender.send(chat_id, text)
+                    except RetryLater as exc:
+                        # 429 относится ко всему боту: приостанавливаем все отправки
+                        self.metrics.rate_limited += 1
+                        self._resume_at = max(self._resume_at, time.monotonic() + exc.retry_after)
+                        if attempt == self.max_retries:
+                            self.metrics.failed += 1
+                            raise
+                        continue
+                    except Exception:
+                        self.metrics.failed += 1
+                        raise
+                    self.metrics.latencies.append(time.monotonic() - started)
+                    self.metrics.sent += 1
+                    return
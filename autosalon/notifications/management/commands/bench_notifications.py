@@ -0,0 +1,121 @@
+import asyncio
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.utils import timezone
+
+from accounts.models import CustomUser
+from notifications.bots import FakeBot
+from notifications.delivery import DeliveryEngine
+from notifications.models import Notification, TelegramUser
+from notifications.outbox import enqueue_broadcast, run_worker
+
+
+class Command(BaseCommand):
+    help = (
+        'Замеряет пропускную способность воркера уведомлений с FakeBot. '
+        'Работает на временной тестовой базе, рабочие данные не затрагиваются.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--notifications', type=int, default=2000, help='Сколько уведомлений в очереди')
+        parser.add_argument('--users', type=int, default=200, help='Сколько подписчиков')
+        parser.add_argument('--latency', type=float, default=0.05, help='Задержка FakeBot на сообщение, с')
+        parser.add_argument(
+            '--concurrency', type=int, nargs='+', default=[1, 10, 50, 200],
+            help='Значения concurrency для замера'
+        )
+        parser.add_argument('--batch-size', type=int, default=200, help='Уведомлений за одну выборку')
+        parser.add_argument(
+            '--broadcast', type=int, default=500,
+            help='Подписчиков в замере рассылки с лимитами Telegram (0 - не замерять)'
+        )
+
+    def handle(self, *args, **options):
+        old_name = connection.settings_dict['NAME']
+        connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            self._populate(options['users'], options['notifications'])
+            self.stdout.write(
+                f'{options["notifications"]} уведомлений, задержка FakeBot {options["latency"] * 1000:.0f} мс'
+            )
+            self.stdout.write('Без лимитов Telegram:')
+            self.stdout.write(f'{"concurrency":<14}{"время, с":>10}{"сообщ./с":>12}{"p95, мс":>10}')
+            for concurrency in options['concurrency']:
+                # При concurrency=1 весь объём ждать долго - ограничиваем его
+                limit = min(options['notifications'], max(concurrency, 1) * 100)
+                self._reset(limit)
+                bot = FakeBot(latency=options['latency'])
+                engine = DeliveryEngine(
+                    bot, concurrency=concurrency, global_rate=1_000_000, global_burst=1000, chat_rate=1_000_000,
+                )
+                elapsed = self._drain(engine, options['batch_size'])
+                self.stdout.write(
+                    f'{concurrency:<14}{elapsed:>10.2f}{bot.sent / elapsed:>12.0f}'
+                    f'{engine.metrics.summary()["p95_ms"]:>10.0f}'
+                )
+            if options['broadcast']:
+                self._bench_broadcast(options)
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+
+    def _drain(self, engine, batch_size):
+        started = time.perf_counter()
+        asyncio.run(run_worker(engine, batch_size=batch_size, until_idle=True))
+        return time.perf_counter() - started
+
+    def _bench_broadcast(self, options):
+        """Рассылка всем подписчикам: FakeBot отвечает 429 при превышении лимитов Telegram"""
+        count = options['broadcast']
+        users = CustomUser.objects.bulk_create(
+            CustomUser(username=f'subscriber{i}', email=f'subscriber{i}@example.com') for i in range(count)
+        )
+        TelegramUser.objects.bulk_create(
+            TelegramUser(user=user, telegram_id=f's{user.pk}', chat_id=f's{user.pk}') for user in users
+        )
+        Notification.objects.update(delivery_status=Notification.DELIVERY_SENT)
+        TelegramUser.objects.exclude(user__in=users).update(is_active=False)
+        queued = enqueue_broadcast('Новые автомобили в продаже', 'Kia Rio, 2021 г.', 'new_car')
+
+        rate = settings.TELEGRAM_GLOBAL_RATE
+        bot = FakeBot(latency=options['latency'], global_limit=30, chat_limit=1)
+        engine = DeliveryEngine(
+            bot, concurrency=settings.TELEGRAM_CONCURRENCY, global_rate=rate, chat_rate=settings.TELEGRAM_CHAT_RATE,
+        )
+        elapsed = self._drain(engine, options['batch_size'])
+        summary = engine.metrics.summary()
+        self.stdout.write(
+            f'Рассылка {queued} подписчикам (лимит {rate:.0f} сообщ./с): {elapsed:.1f} с, '
+            f'{summary["rate"]:.1f} сообщ./с, ответов 429: {bot.rate_limited}, '
+            f'p50 {summary["p50_ms"]:.0f} мс, p95 {summary["p95_ms"]:.0f} мс'
+        )
+        self.stdout.write(f'Оценка для 10 000 подписчиков: {10_000 / summary["rate"] / 60:.1f} мин')
+
+    def _populate(self, user_count, count):
+        users = CustomUser.objects.bulk_create(
+            CustomUser(username=f'bench{i}', email=f'bench{i}@example.com') for i in range(user_count)
+        )
+        TelegramUser.objects.bulk_create(
+            TelegramUser(user=user, telegram_id=str(user.pk), chat_id=str(user.pk)) for user in users
+        )
+        Notification.objects.bulk_create(
+            (
+                Notification(
+                    user=users[i % user_count], title='Изменение статуса заявки',
+                    message=f'Заявка #{i}: статус изменен', notification_type='request_status_update',
+                )
+                for i in range(count)
+            ),
+            batch_size=2000,
+        )
+
+    def _reset(self, limit):
+        """Первые limit уведомлений снова в очереди, остальные - уже доставлены"""
+        now = timezone.now()
+        Notification.objects.update(delivery_status=Notification.DELIVERY_SENT)
+        ids = Notification.objects.order_by('pk').values_list('pk', flat=True)[:limit]
+        Notification.objects.filter(pk__in=list(ids)).update(
+            delivery_status=Notification.DELIVERY_PENDING, attempts=0, next_attempt_at=now, delivered_at=None,
+        )
@@ -0,0 +1,69 @@
+import asyncio
+import signal
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from notifications.bots import FakeBot, TelegramSender
+from notifications.delivery import DeliveryEngine
+from notifications.outbox import run_worker
+
+
+class Command(BaseCommand):
+    help = 'Фоновая доставка уведомлений в Telegram из очереди Notification'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=100, help='Уведомлений за одну выборку')
+        parser.add_argument(
+            '--concurrency', type=int, default=settings.TELEGRAM_CONCURRENCY,
+            help='Одновременных отправок (и соединений в пуле)'
+        )
+        parser.add_argument(
+            '--global-rate', type=float, default=settings.TELEGRAM_GLOBAL_RATE, help='Сообщений в секунду на бота'
+        )
+        parser.add_argument(
+            '--chat-rate', type=float, default=settings.TELEGRAM_CHAT_RATE, help='Сообщений в секунду в один чат'
+        )
+        parser.add_argument('--poll-interval', type=float, default=1.0, help='Пауза при пустой очереди, с')
+        parser.add_argument('--report-interval', type=float, default=60, help='Как часто писать метрики в лог, с')
+        parser.add_argument('--once', action='store_true', help='Выйти, когда очередь опустеет')
+        parser.add_argument('--fake', action='store_true', help='Локальный FakeBot вместо Telegram')
+        parser.add_argument('--fake-latency', type=float, default=0.05, help='Задержка FakeBot, с')
+        parser.add_argument('--fake-failure-rate', type=float, default=0.0, help='Доля ошибок FakeBot')
+
+    def handle(self, *args, **options):
+        if options['fake']:
+            sender = FakeBot(options['fake_latency'], options['fake_failure_rate'])
+        elif settings.TELEGRAM_BOT_TOKEN:
+            sender = TelegramSender(settings.TELEGRAM_BOT_TOKEN, pool_size=options['concurrency'])
+        else:
+            raise CommandError('TELEGRAM_BOT_TOKEN не задан (для проверки без Telegram: --fake)')
+
+        engine = DeliveryEngine(
+            sender,
+            concurrency=options['concurrency'],
+            global_rate=options['global_rate'],
+            chat_rate=options['chat_rate'],
+        )
+        processed = asyncio.run(self._run(engine, options))
+        summary = engine.metrics.summary()
+        self.stdout.write(self.style.SUCCESS(f'Обработано уведомлений: {processed}'))
+        self.stdout.write(
+            f'Отправлено {summary["sent"]}, ошибок {summary["failed"]}, 429: {summary["rate_limited"]}, '
+            f'{summary["rate"]:.1f} сообщ./с, p50 {summary["p50_ms"]:.0f} мс, p95 {summary["p95_ms"]:.0f} мс'
+        )
+
+    async def _run(self, engine, options):
+        stop = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            # Текущая пачка дорабатывается и записывается, новая не берётся
+            loop.add_signal_handler(signum, stop.set)
+        return await run_worker(
+            engine,
+            batch_size=options['batch_size'],
+            poll_interval=options['poll_interval'],
+            report_interval=options['report_interval'],
+            stop=stop,
+            until_idle=options['once'],
+        )
@@ -0,0 +1,18 @@
+# Generated by Django 6.0 on 2026-10-18 13:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notifications', '0002_notification_delivery'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='notification',
+            name='notification_type',
+            field=models.CharField(choices=[('request_status_update', 'Изменение статуса заявки'), ('new_car', 'Новый автомобиль')], max_length=50),
+        ),
+    ]
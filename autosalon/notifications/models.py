@@ -1,5 +1,6 @@
 from django.db import models
 from django.contrib.auth import get_user_model
+from django.utils import timezone
 
 User = get_user_model()
 
@@ -9,4 +10,51 @@ class TelegramUser(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     telegram_id = models.CharField(max_length=100, unique=True)
     chat_id = models.CharField(max_length=100)
-    is_active = models.BooleanField(default=True)
\ No newline at end of file
+    is_active = models.BooleanField(default=True)
+
+class Notification(models.Model):
+    """
+    Уведомление пользователю. Создаётся в той же транзакции, что и событие,
+    и служит очередью (outbox) для доставки в Telegram фоновым воркером
+    (notifications/outbox.py).
+    """
+    TYPE_CHOICES = (
+        ('request_status_update', 'Изменение статуса заявки'),
+        ('new_car', 'Новый автомобиль'),
+    )
+
+    DELIVERY_PENDING = 'pending'
+    DELIVERY_SENT = 'sent'
+    DELIVERY_FAILED = 'failed'
+    DELIVERY_SKIPPED = 'skipped'
+    DELIVERY_CHOICES = (
+        (DELIVERY_PENDING, 'Ожидает отправки'),
+        (DELIVERY_SENT, 'Доставлено'),
+        (DELIVERY_FAILED, 'Не доставлено'),
+        (DELIVERY_SKIPPED, 'Нет подписки в Telegram'),
+    )
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='notifications')
+    title = models.CharField(max_length=200)
+    message = models.TextField()
+    notification_type = models.CharField(max_length=50, choices=TYPE_CHOICES)
+    is_read = models.BooleanField(default=False)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    # Доставка в Telegram
+    delivery_status = models.CharField(max_length=20, choices=DELIVERY_CHOICES, default=DELIVERY_PENDING)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    delivered_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['user', 'created_at']),
+            # Выборка очереди воркером: WHERE delivery_status = 'pending' AND next_attempt_at <= now
+            models.Index(fields=['delivery_status', 'next_attempt_at']),
+        ]
+
+    def __str__(self):
+        return f"{self.user} - {self.title}"
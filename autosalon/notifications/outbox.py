@@ -0,0 +1,199 @@
+"""
+Доставка уведомлений в Telegram (outbox).
+
+Notification пишется в той же транзакции, что и событие (см.
+cars.purchase_requests) - веб-запрос в Telegram не ходит. Долгоживущий
+воркер (команда run_notification_worker) забирает пачки ожидающих строк,
+рассылает их через DeliveryEngine (параллельно, в пределах лимитов
+Telegram) и записывает результаты.
+
+Забор пачки - аренда: next_attempt_at сдвигается на LEASE вперёд, и
+другие воркеры эти строки не видят. Если воркер упал, не записав
+результат, строки вернутся в очередь по истечении аренды. attempts
+растёт при заборе, поэтому строка, чья аренда истекла после последней
+(MAX_ATTEMPTS-й) попытки, больше не забирается, а помечается failed.
+"""
+import asyncio
+import logging
+import random
+import time
+from datetime import timedelta
+from html import escape
+
+from asgiref.sync import sync_to_async
+from django.db import close_old_connections, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .bots import PermanentDeliveryError, RetryLater
+from .models import Notification, TelegramUser
+
+logger = logging.getLogger(__name__)
+
+LEASE = timedelta(minutes=5)
+MAX_ATTEMPTS = 5
+BACKOFF_BASE = 30  # секунд; 30, 60, 120, ... со случайным разбросом
+BACKOFF_MAX = 3600
+
+
+def enqueue_broadcast(title, message, notification_type, batch_size=2000):
+    """
+    Ставит сообщение в очередь всем активным подписчикам Telegram (по
+    уведомлению на пользователя). Темп рассылки задаёт воркер - тысячи
+    подписчиков расходятся за минуты без нарушения лимитов.
+    Возвращает число уведомлений.
+    """
+    user_ids = (
+        TelegramUser.objects.filter(is_active=True)
+        .order_by('user_id').values_list('user_id', flat=True).distinct()
+    )
+    count = 0
+    batch = []
+    with transaction.atomic():
+        for user_id in user_ids.iterator(chunk_size=batch_size):
+            batch.append(Notification(
+                user_id=user_id, title=title, message=message, notification_type=notification_type,
+            ))
+            if len(batch) >= batch_size:
+                Notification.objects.bulk_create(batch)
+                count += len(batch)
+                batch = []
+        if batch:
+            Notification.objects.bulk_create(batch)
+            count += len(batch)
+    return count
+
+
+def log_metrics(metrics):
+    logger.info(
+        'Отправлено %(sent)s, ошибок %(failed)s, 429: %(rate_limited)s, '
+        '%(rate).1f сообщ./с, задержка p50 %(p50_ms).0f мс, p95 %(p95_ms).0f мс',
+        metrics.summary(),
+    )
+
+
+def render(title, message):
+    return f'<b>{escape(title)}</b>\n{escape(message)}'
+
+
+def claim_batch(size):
+    """
+    Забирает до size уведомлений, которые пора отправлять. Возвращает
+    (сколько забрано, [{'pk', 'chat_id', 'text', 'attempts'}]); уведомления
+    пользователей без подписки в Telegram сразу помечаются skipped.
+    """
+    close_old_connections()
+    now = timezone.now()
+    due = Notification.objects.filter(delivery_status=Notification.DELIVERY_PENDING, next_attempt_at__lte=now)
+    with transaction.atomic():
+        # Попытки исчерпаны, а результат последней так и не записан (воркер упал)
+        due.filter(attempts__gte=MAX_ATTEMPTS).update(
+            delivery_status=Notification.DELIVERY_FAILED,
+            last_error='Аренда истекла после последней попытки',
+        )
+        ids = list(
+            due.select_for_update(skip_locked=True)
+            .order_by('next_attempt_at')
+            .values_list('pk', flat=True)[:size]
+        )
+        if not ids:
+            return 0, []
+        Notification.objects.filter(pk__in=ids).update(
+            next_attempt_at=now + LEASE, attempts=F('attempts') + 1,
+        )
+
+    rows = list(Notification.objects.filter(pk__in=ids).values_list('pk', 'user_id', 'title', 'message', 'attempts'))
+    chats = {}
+    subscriptions = (
+        TelegramUser.objects.filter(user_id__in={row[1] for row in rows}, is_active=True)
+        .order_by('user_id', '-pk').values_list('user_id', 'chat_id')
+    )
+    for user_id, chat_id in subscriptions:
+        chats.setdefault(user_id, chat_id)
+
+    batch, skipped = [], []
+    for pk, user_id, title, message, attempts in rows:
+        if user_id in chats:
+            batch.append({'pk': pk, 'chat_id': chats[user_id], 'text': render(title, message), 'attempts': attempts})
+        else:
+            skipped.append(pk)
+    if skipped:
+        Notification.objects.filter(pk__in=skipped).update(delivery_status=Notification.DELIVERY_SKIPPED)
+    return len(ids), batch
+
+
+def _retry_delay(attempts, exc):
+    if isinstance(exc, RetryLater):
+        return exc.retry_after
+    return min(BACKOFF_BASE * 2 ** (attempts - 1), BACKOFF_MAX) * random.uniform(0.5, 1.5)
+
+
+def record_results(results):
+    """
+    results: [(item, исключение или None)]. Доставленные отмечаются одним
+    UPDATE по списку id, неудачные (их обычно единицы) - bulk_update.
+    """
+    now = timezone.now()
+    sent, failures = [], []
+    for item, exc in results:
+        if exc is None:
+            sent.append(item['pk'])
+            continue
+        notification = Notification(pk=item['pk'], last_error=f'{type(exc).__name__}: {exc}'[:1000])
+        if isinstance(exc, PermanentDeliveryError) or item['attempts'] >= MAX_ATTEMPTS:
+            notification.delivery_status = Notification.DELIVERY_FAILED
+            notification.next_attempt_at = now
+        else:
+            notification.delivery_status = Notification.DELIVERY_PENDING
+            notification.next_attempt_at = now + timedelta(seconds=_retry_delay(item['attempts'], exc))
+        failures.append(notification)
+    if sent:
+        Notification.objects.filter(pk__in=sent).update(
+            delivery_status=Notification.DELIVERY_SENT, delivered_at=now, last_error='',
+        )
+    if failures:
+        Notification.objects.bulk_update(failures, ['delivery_status', 'last_error', 'next_attempt_at'])
+
+
+async def _deliver(engine, item):
+    try:
+        await engine.send(item['chat_id'], item['text'])
+    except Exception as exc:  # любая ошибка отправки - повод для повтора
+        if not isinstance(exc, RetryLater):
+            logger.warning('Уведомление %s не доставлено: %s', item['pk'], exc)
+        return item, exc
+    return item, None
+
+
+async def run_worker(engine, batch_size=100, poll_interval=1.0, stop=None, until_idle=False, report_interval=60):
+    """
+    Цикл воркера: забрать пачку, разослать через engine (DeliveryEngine),
+    записать результаты; раз в report_interval секунд пишет в лог метрики
+    отправки. Останавливается по событию stop, а с until_idle=True - когда
+    отправлять больше нечего. Возвращает число обработанных уведомлений.
+    """
+    stop = stop or asyncio.Event()
+    processed = 0
+    reported_at = time.monotonic()
+    await engine.start()
+    try:
+        while not stop.is_set():
+            claimed, batch = await sync_to_async(claim_batch)(batch_size)
+            if not claimed:
+                if until_idle:
+                    break
+                try:
+                    await asyncio.wait_for(stop.wait(), poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            results = await asyncio.gather(*(_deliver(engine, item) for item in batch))
+            if results:
+                await sync_to_async(record_results)(results)
+            processed += claimed
+            if time.monotonic() - reported_at >= report_interval:
+                log_metrics(engine.metrics)
+                reported_at = time.monotonic()
+    finally:
+        await engine.stop()
+    return processed
@@ -1,8 +1,11 @@
 # notifications/telegram_bot.py
 import asyncio
+import logging
 from telegram import Bot
 from telegram.ext import Application, CommandHandler, MessageHandler, filters
 
+logger = logging.getLogger(__name__)
+
 
 class NotificationBot:
     def __init__(self, token):
@@ -11,6 +14,10 @@ class NotificationBot:
         self.application = Application.builder().token(token).build()
 
     async def send_notification(self, chat_id, message):
+        """
+        Разовая отправка. Уведомления и рассылки идут через очередь Notification
+        и воркер run_notification_worker - с пулом соединений и лимитами Telegram.
+        """
         try:
             await self.bot.send_message(
                 chat_id=chat_id,
@@ -19,7 +26,7 @@ class NotificationBot:
             )
             return True
         except Exception as e:
-            print(f"Error sending notification: {e}")
+            logger.warning("Error sending notification: %s", e)
             return False
 
     def setup_handlers(self):
@@ -1,3 +1,142 @@
-from django.test import TestCase
+import asyncio
+import time
 
-# Create your tests here.
+from django.test import SimpleTestCase, TransactionTestCase
+from django.utils import timezone
+
+from accounts.models import CustomUser
+from notifications.bots import FakeBot, PermanentDeliveryError, RetryLater
+from notifications.delivery import DeliveryEngine
+from notifications.models import Notification, TelegramUser
+from notifications.outbox import MAX_ATTEMPTS, claim_batch, enqueue_broadcast, run_worker
+
+
+class FailingBot(FakeBot):
+    async def send(self, chat_id, text):
+        raise PermanentDeliveryError('Forbidden: bot was blocked by the user')
+
+
+class NotificationWorkerTest(TransactionTestCase):
+    """Воркер работает в потоках sync_to_async - нужен настоящий commit"""
+
+    def setUp(self):
+        self.subscriber = CustomUser.objects.create_user(username='subscriber', password='secret')
+        self.other = CustomUser.objects.create_user(username='other', password='secret')
+        TelegramUser.objects.create(user=self.subscriber, telegram_id='1', chat_id='100')
+
+    def _notify(self, user, count):
+        Notification.objects.bulk_create(
+            Notification(user=user, title='Заявка', message='Статус <изменен>', notification_type='request_status_update')
+            for _ in range(count)
+        )
+
+    def _run(self, bot, concurrency=20, **options):
+        # Лимиты Telegram здесь не проверяются (см. DeliveryEngineTest)
+        engine = DeliveryEngine(bot, concurrency=concurrency, global_rate=10_000, global_burst=100, chat_rate=10_000)
+        return asyncio.run(run_worker(engine, until_idle=True, **options))
+
+    def test_delivers_concurrently_and_skips_unsubscribed(self):
+        subscribers = [self.subscriber]
+        for i in range(5):
+            user = CustomUser.objects.create_user(username=f'subscriber{i}', password='secret')
+            TelegramUser.objects.create(user=user, telegram_id=f'1{i}', chat_id=f'10{i}')
+            subscribers.append(user)
+        for _ in range(5):
+            for user in subscribers + [self.other]:
+                self._notify(user, 1)
+        bot = FakeBot(latency=0.01)
+        self.assertEqual(self._run(bot, concurrency=5, batch_size=10), 35)
+        self.assertEqual(bot.sent, 30)
+        self.assertEqual(bot.max_in_flight, 5)
+        self.assertEqual(
+            set(Notification.objects.values_list('delivery_status', flat=True).filter(user=self.other)),
+            {Notification.DELIVERY_SKIPPED},
+        )
+        self.assertEqual(Notification.objects.filter(delivery_status=Notification.DELIVERY_SENT).count(), 30)
+
+    def test_temporary_failure_retried_with_backoff(self):
+        self._notify(self.subscriber, 1)
+        with self.assertLogs('notifications.outbox', 'WARNING'):
+            self._run(FakeBot(latency=0, failure_rate=1.0))
+        notification = Notification.objects.get()
+        self.assertEqual(notification.delivery_status, Notification.DELIVERY_PENDING)
+        self.assertEqual(notification.attempts, 1)
+        self.assertGreater(notification.next_attempt_at, timezone.now())
+        self.assertIn('fake failure', notification.last_error)
+
+        # Последняя попытка исчерпана - уведомление больше не отправляется
+        Notification.objects.update(attempts=MAX_ATTEMPTS - 1, next_attempt_at=timezone.now())
+        with self.assertLogs('notifications.outbox', 'WARNING'):
+            self._run(FakeBot(latency=0, failure_rate=1.0))
+        self.assertEqual(Notification.objects.get().delivery_status, Notification.DELIVERY_FAILED)
+
+    def test_expired_lease_after_last_attempt_fails(self):
+        self._notify(self.subscriber, 2)
+        # Воркер упал после забора: аренда истекла, результата нет
+        expired = Notification.objects.first()
+        Notification.objects.filter(pk=expired.pk).update(attempts=MAX_ATTEMPTS, next_attempt_at=timezone.now())
+        self.assertEqual(claim_batch(10)[0], 1)
+        expired.refresh_from_db()
+        self.assertEqual((expired.delivery_status, expired.attempts), (Notification.DELIVERY_FAILED, MAX_ATTEMPTS))
+        self.assertIn('Аренда истекла', expired.last_error)
+
+    def test_permanent_failure_not_retried(self):
+        self._notify(self.subscriber, 1)
+        with self.assertLogs('notifications.outbox', 'WARNING'):
+            self._run(FailingBot(latency=0))
+        notification = Notification.objects.get()
+        self.assertEqual((notification.delivery_status, notification.attempts), (Notification.DELIVERY_FAILED, 1))
+
+    def test_broadcast_enqueued_for_active_subscribers(self):
+        TelegramUser.objects.create(user=self.other, telegram_id='2', chat_id='200', is_active=False)
+        self.assertEqual(enqueue_broadcast('Новые автомобили', 'Kia Rio', 'new_car'), 1)
+        self.assertEqual(Notification.objects.get().user, self.subscriber)
+
+
+class FloodStubBot(FakeBot):
+    """Первая отправка получает 429"""
+
+    async def send(self, chat_id, text):
+        if not self.rate_limited:
+            self.rate_limited += 1
+            raise RetryLater(0.2)
+        await super().send(chat_id, text)
+
+
+class DeliveryEngineTest(SimpleTestCase):
+    """Лимиты проверяются на FakeBot, который отвечает 429 при их превышении"""
+
+    def _broadcast(self, engine, chat_ids):
+        async def run():
+            await asyncio.gather(*(engine.send(chat_id, 'Новый автомобиль') for chat_id in chat_ids))
+
+        started = time.monotonic()
+        asyncio.run(run())
+        return time.monotonic() - started
+
+    def test_global_and_chat_limits_respected(self):
+        bot = FakeBot(latency=0.01, global_limit=50, chat_limit=1)
+        engine = DeliveryEngine(bot, concurrency=20, global_rate=40, global_burst=10, chat_rate=1)
+        # 60 разных чатов и ещё 2 сообщения в первый
+        elapsed = self._broadcast(engine, list(range(60)) + [0, 0])
+        self.assertEqual(bot.rate_limited, 0)
+        self.assertEqual(bot.sent, 62)
+        # Три сообщения одному чату - не быстрее чем за 2 секунды
+        self.assertGreaterEqual(elapsed, 1.9)
+        self.assertEqual(engine.metrics.summary()['sent'], 62)
+
+    def test_without_limits_stub_answers_429(self):
+        bot = FakeBot(latency=0.01, global_limit=50)
+        engine = DeliveryEngine(bot, concurrency=100, global_rate=10_000, global_burst=100, max_retries=0)
+        with self.assertRaises(RetryLater):
+            self._broadcast(engine, range(60))
+        self.assertGreater(bot.rate_limited, 0)
+
+    def test_retry_after_pauses_and_resends(self):
+        bot = FloodStubBot(latency=0)
+        engine = DeliveryEngine(bot, concurrency=5, global_rate=1000, global_burst=10)
+        elapsed = self._broadcast(engine, range(5))
+        self.assertEqual(bot.sent, 5)
+        self.assertGreaterEqual(elapsed, 0.2)
+        summary = engine.metrics.summary()
+        self.assertEqual((summary['sent'], summary['rate_limited'], summary['failed']), (5, 1, 0))